@@ -1,6 +1,6 @@
-from django.contrib import admin
-from .models import Book, BookRequest
-from django.utils import timezone
+from django.contrib import admin, messages
+from .models import Book, BookRequest, ResourceVersion
+from .services.requests import BookRequestService
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
@@ -8,6 +8,10 @@ class BookAdmin(admin.ModelAdmin):
     search_fields = ('title', 'author', 'isbn')
     list_filter = ('available_copies',)
 
+    def delete_queryset(self, request, queryset):
+        ResourceVersion.touch(books=queryset.values_list('pk', flat=True))
+        super().delete_queryset(request, queryset)
+
 @admin.register(BookRequest)
 class BookRequestAdmin(admin.ModelAdmin):
     list_display = ['user', 'book', 'request_date', 'status', 'response_date']
@@ -17,15 +21,19 @@ class BookRequestAdmin(admin.ModelAdmin):
     actions = ['approve_requests', 'reject_requests']
 
     def approve_requests(self, request, queryset):
-        queryset.update(
-            status='APPROVED',
-            response_date=timezone.now()
-        )
+        self.decide(request, approve=queryset.values_list('pk', flat=True))
     approve_requests.short_description = "Approve selected requests"
 
     def reject_requests(self, request, queryset):
-        queryset.update(
-            status='REJECTED',
-            response_date=timezone.now()
-        )
+        self.decide(request, reject=queryset.values_list('pk', flat=True))
     reject_requests.short_description = "Reject selected requests"
+
+    def decide(self, request, approve=(), reject=()):
+        decisions = BookRequestService.decide(approve=list(approve), reject=list(reject))
+        done = [decision for decision in decisions if decision.outcome != 'skipped']
+        skipped = [decision for decision in decisions if decision.outcome == 'skipped']
+        if done:
+            self.message_user(request, f"{len(done)} request(s) {done[0].outcome}")
+        if skipped:
+            reasons = '; '.join(f"#{decision.request_id}: {decision.error}" for decision in skipped[:10])
+            self.message_user(request, f"{len(skipped)} request(s) skipped ({reasons})", messages.WARNING)
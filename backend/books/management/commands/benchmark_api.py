@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from library_project.benchmark import check_budgets, get_budgets, run_benchmark, seed_library
+from library_project.test_runner import throwaway_environment
+
+class Command(BaseCommand):
+    help = 'Benchmark every API endpoint against a synthetic library and enforce budgets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=2000,
+                          help='Number of synthetic books to seed')
+        parser.add_argument('--users', type=int, default=200,
+                          help='Number of synthetic members to seed')
+        parser.add_argument('--loans', type=int, default=400,
+                          help='Number of synthetic loans to seed')
+        parser.add_argument('--requests', type=int, default=200,
+                          help='Number of synthetic book requests to seed')
+        parser.add_argument('--iterations', type=int, default=20,
+                          help='Number of calls per endpoint')
+        parser.add_argument('--no-fail', action='store_true',
+                          help='Report budget violations without failing')
+
+    def handle(self, *args, **options):
+        budgets = get_budgets()
+
+        # The synthetic library, sessions and cached payloads all go to a
+        # test database and caches that are thrown away afterwards. Calls
+        # run inside one transaction, as in the test suite, so query counts
+        # compare with the same budgets.
+        with throwaway_environment(), transaction.atomic():
+            self.stdout.write('Seeding synthetic library...')
+            library = seed_library(
+                books=options['books'],
+                members=options['users'],
+                loans=options['loans'],
+                requests=options['requests']
+            )
+            results = run_benchmark(library, iterations=options['iterations'])
+
+        self.stdout.write(
+            f"\n{'endpoint':<32} {'queries':>8} {'p50 ms':>8} {'p99 ms':>8} {'bytes':>9}"
+        )
+        for result in results:
+            budget = budgets[result.name]
+            self.stdout.write(
+                f'{result.name:<32} {result.max_queries:>4}/{budget["queries"]:<3} '
+                f'{result.p50_ms:>8.1f} {result.p99_ms:>8.1f} {result.max_bytes:>9}'
+            )
+
+        violations = check_budgets(results, budgets)
+        if not violations:
+            self.stdout.write(self.style.SUCCESS('\nAll endpoints within budget'))
+            return
+
+        for violation in violations:
+            self.stdout.write(self.style.ERROR(violation))
+        if not options['no_fail']:
+            raise CommandError(f'{len(violations)} budget violation(s)')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from library_project.write_benchmark import DEFAULT_PROFILE, configured_profile, run_writers
+
+class Command(BaseCommand):
+    help = 'Compare concurrent write throughput with Django\'s SQLite defaults and the configured settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8],
+                          help='Numbers of writer threads to try')
+        parser.add_argument('--transactions', type=int, default=200,
+                          help='Transactions per thread')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'profile':<10} {'threads':>7} {'tx/s':>9} {'locked':>7} {'p50 ms':>8}")
+        for threads in options['threads']:
+            results = [
+                run_writers(DEFAULT_PROFILE, 'default', threads, options['transactions']),
+                run_writers(configured_profile(), 'configured', threads, options['transactions']),
+            ]
+            for result in results:
+                self.stdout.write(
+                    f'{result.profile:<10} {result.threads:>7} {result.tps:>9.0f} '
+                    f'{result.locked:>7} {result.p50_ms:>8.2f}'
+                )
+            default, configured = results
+            if default.tps:
+                self.stdout.write(self.style.SUCCESS(f'{configured.tps / default.tps:.1f}x with {threads} writer(s)'))
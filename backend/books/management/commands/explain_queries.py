@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from library_project.benchmark import seed_library
+from library_project.query_plans import check_plans, explain_shapes
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot API query shapes against a synthetic library and flag full-table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=20000,
+                          help='Number of synthetic books to seed')
+        parser.add_argument('--users', type=int, default=5000,
+                          help='Number of synthetic members to seed')
+        parser.add_argument('--loans', type=int, default=15000,
+                          help='Number of synthetic loans to seed')
+        parser.add_argument('--requests', type=int, default=20000,
+                          help='Number of synthetic book requests to seed')
+        parser.add_argument('--iterations', type=int, default=20,
+                          help='Number of timed runs per query')
+        parser.add_argument('--show-plans', action='store_true',
+                          help='Print the full plan of every query')
+        parser.add_argument('--no-fail', action='store_true',
+                          help='Report full scans without failing')
+
+    def handle(self, *args, **options):
+        # The synthetic library is rolled back, as in benchmark_api.
+        try:
+            with transaction.atomic():
+                self.stdout.write('Seeding synthetic library...')
+                library = seed_library(
+                    books=options['books'],
+                    members=options['users'],
+                    loans=options['loans'],
+                    requests=options['requests']
+                )
+                results = explain_shapes(library, iterations=options['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"\n{'query':<24} {'median ms':>10} {'sorts':>6}  full scans")
+        for result in results:
+            scans = ', '.join(result.full_scans) or '-'
+            if result.full_scans and result.allow_scan:
+                scans += ' (expected)'
+            self.stdout.write(f'{result.name:<24} {result.median_ms:>10.3f} {result.sorts:>6}  {scans}')
+            if options['show_plans']:
+                self.stdout.write(f'{result.sql}\n{result.plan}\n')
+
+        violations = check_plans(results)
+        if not violations:
+            self.stdout.write(self.style.SUCCESS('\nNo unexpected full-table scans'))
+            return
+
+        for violation in violations:
+            self.stdout.write(self.style.ERROR(violation))
+        if not options['no_fail']:
+            raise CommandError(f'{len(violations)} query shape(s) scan a whole table')
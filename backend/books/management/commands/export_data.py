@@ -0,0 +1,35 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from library_project.exports import CHUNK_SIZE, CONTENT_TYPES, EXPORTS, export_chunks
+
+class Command(BaseCommand):
+    help = 'Stream the catalog, loans or book requests to a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=sorted(EXPORTS),
+                          help='What to export')
+        parser.add_argument('--format', choices=sorted(CONTENT_TYPES), default='csv',
+                          help='Output format')
+        parser.add_argument('--status',
+                          help='Only export loans or requests with this status')
+        parser.add_argument('--output', '-o',
+                          help='File to write; standard output by default')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                          help='Rows fetched and written at a time')
+
+    def handle(self, *args, **options):
+        status = options['status'].upper() if options['status'] else None
+        try:
+            chunks = export_chunks(options['resource'], options['format'], status, options['chunk_size'])
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['resource']} to {options['output']}"))
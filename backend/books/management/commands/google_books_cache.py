@@ -0,0 +1,55 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from books.services.cache import SQLiteCache, make_key
+from books.services.google_books import GoogleBooksService
+
+class Command(BaseCommand):
+    help = 'Inspect, clear, record or load the Google Books response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true',
+                          help='Remove every cached response')
+        parser.add_argument('--dump', metavar='FILE',
+                          help='Write every cached response to a JSON fixture file')
+        parser.add_argument('--load', metavar='FILE',
+                          help='Load responses from a JSON fixture file; they never expire')
+
+    def handle(self, *args, **options):
+        cache = GoogleBooksService.get_cache()
+        if cache is None:
+            raise CommandError('GOOGLE_BOOKS_CACHE is disabled')
+        disk = next((tier for tier in cache.tiers if isinstance(tier, SQLiteCache)), None)
+
+        if options['clear']:
+            cache.clear()
+            self.stdout.write(self.style.SUCCESS('Cache cleared'))
+
+        if options['load']:
+            with open(options['load']) as fixture:
+                entries = json.load(fixture)
+            for entry in entries:
+                key = make_key(
+                    'volumes',
+                    entry['query'],
+                    max_results=entry.get('max_results', 10),
+                    start_index=entry.get('start_index', 0)
+                )
+                cache.set(key, entry['items'], ttl=None)
+            self.stdout.write(self.style.SUCCESS(f"Loaded {len(entries)} responses from {options['load']}"))
+
+        if options['dump']:
+            if disk is None:
+                raise CommandError('No on-disk cache tier is configured')
+            entries = []
+            for key, items in disk.items():
+                namespace, _, payload = key.partition(':')
+                if namespace != 'volumes':
+                    continue
+                query, params = json.loads(payload)
+                entries.append({'query': query, **params, 'items': items})
+            with open(options['dump'], 'w') as fixture:
+                json.dump(entries, fixture, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(entries)} responses to {options['dump']}"))
+
+        if disk is not None:
+            self.stdout.write(f'{len(disk)} responses cached in {disk.path}')
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_test_environment
+from library_project.loadtest import GOOGLE_SEARCH_PATH, load_token, run_asgi, run_wsgi, stubbed_google_books
+
+class Command(BaseCommand):
+    help = 'Compare WSGI and ASGI throughput of an async endpoint against a slow Google Books stub'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                          help='Number of requests per run')
+        parser.add_argument('--workers', type=int, default=4,
+                          help='Number of WSGI worker threads')
+        parser.add_argument('--concurrency', type=int, default=100,
+                          help='Number of requests the ASGI run keeps in flight')
+        parser.add_argument('--latency-ms', type=float, default=200,
+                          help='Latency added by the Google Books stub')
+        parser.add_argument('--path', default=GOOGLE_SEARCH_PATH,
+                          help='Endpoint to load')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        token = load_token()
+
+        with stubbed_google_books(options['latency_ms'] / 1000):
+            results = [
+                run_wsgi(options['path'], token, options['requests'], options['workers']),
+                run_asgi(options['path'], token, options['requests'], options['concurrency']),
+            ]
+
+        self.stdout.write(
+            f"\n{'mode':<6} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}"
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result.mode:<6} {result.requests:>9} {result.errors:>7} {result.rps:>8.1f} '
+                f'{result.p50_ms:>8.1f} {result.p99_ms:>8.1f}'
+            )
+
+        wsgi, asgi = results
+        if wsgi.rps:
+            self.stdout.write(self.style.SUCCESS(f'\nASGI served {asgi.rps / wsgi.rps:.1f}x the WSGI throughput'))
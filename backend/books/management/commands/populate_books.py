@@ -10,29 +10,41 @@ class Command(BaseCommand):
                           help='List of topics to search for books')
         parser.add_argument('--books-per-topic', type=int, default=5,
                           help='Number of books to import per topic')
+        parser.add_argument('--workers', type=int, default=8,
+                          help='Number of concurrent Google Books requests')
+        parser.add_argument('--batch-size', type=int, default=500,
+                          help='Number of books written per bulk insert')
 
     def handle(self, *args, **options):
         topics = options['topics']
         books_per_topic = options['books_per_topic']
-        
-        total_imported = 0
-        
-        for topic in topics:
-            self.stdout.write(f"Searching for '{topic}' books...")
-            imported_books = GoogleBooksService.import_books_from_search(
-                query=topic,
-                max_results=books_per_topic
-            )
-            
-            total_imported += len(imported_books)
+        pages_per_topic = -(-books_per_topic // GoogleBooksService.PAGE_SIZE)
+        total_pages = pages_per_topic * len(topics)
+
+        self.stdout.write(
+            f"Fetching {books_per_topic} books for each of {len(topics)} topics "
+            f"({total_pages} pages, {options['workers']} workers)..."
+        )
+
+        def report(topic, stats):
             self.stdout.write(
-                self.style.SUCCESS(
-                    f"Successfully imported {len(imported_books)} books for topic '{topic}'"
-                )
+                f"[{stats.pages}/{total_pages}] '{topic}': {stats.volumes} volumes fetched, "
+                f"{stats.inserted} inserted, {stats.volumes / stats.elapsed:.1f} volumes/s"
             )
-        
+
+        stats = GoogleBooksService.bulk_import(
+            topics,
+            per_topic=books_per_topic,
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            progress=report
+        )
+
         self.stdout.write(
             self.style.SUCCESS(
-                f"\nTotal books imported: {total_imported}"
+                f"\nTotal books imported: {stats.inserted} "
+                f"({stats.existing} already present, {stats.duplicates} duplicates, "
+                f"{stats.without_isbn} without ISBN) in {stats.elapsed:.1f}s "
+                f"({stats.books_per_second:.1f} books/s)"
             )
         )
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from books.services.volumes_stub import RecordedCorpus, SyntheticCorpus, VOLUMES_PATH, make_server
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Google Books volumes endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1',
+                          help='Interface to listen on')
+        parser.add_argument('--port', type=int, default=8765,
+                          help='Port to listen on')
+        parser.add_argument('--corpus-size', type=int, default=100_000,
+                          help='Number of volumes in the synthetic corpus')
+        parser.add_argument('--seed', type=int, default=0,
+                          help='Seed for the synthetic corpus')
+        parser.add_argument('--fixture',
+                          help='Serve a corpus recorded with google_books_cache --dump instead')
+        parser.add_argument('--latency-ms', type=float, default=0,
+                          help='Added latency per request')
+        parser.add_argument('--jitter-ms', type=float, default=0,
+                          help='Random variation applied to the latency')
+        parser.add_argument('--error-rate', type=float, default=0,
+                          help='Fraction of requests answered with 429/500/503')
+        parser.add_argument('--verbose-log', action='store_true',
+                          help='Log every request')
+
+    def handle(self, *args, **options):
+        if options['fixture']:
+            corpus = RecordedCorpus(options['fixture'])
+            description = f"recorded corpus from {options['fixture']}"
+        else:
+            corpus = SyntheticCorpus(size=options['corpus_size'], seed=options['seed'])
+            description = f"synthetic corpus of {options['corpus_size']} volumes"
+
+        server = make_server(
+            corpus,
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+            quiet=not options['verbose_log']
+        )
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(
+            f'Serving {description} at http://{host}:{port}{VOLUMES_PATH}'
+        ))
+        self.stdout.write(f'Set GOOGLE_BOOKS_BASE_URL=http://{host}:{port}{VOLUMES_PATH} to use it')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,36 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database to each replica file, to simulate replication locally'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                          help='Keep copying every this many seconds, which is then the replication lag')
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            raise CommandError('No replicas configured; set DB_REPLICAS')
+
+        while True:
+            started = time.monotonic()
+            for alias in replicas:
+                self.copy(settings.DATABASES['default']['NAME'], settings.DATABASES[alias]['NAME'])
+            self.stdout.write(f'Synced {len(replicas)} replica(s) in {time.monotonic() - started:.2f}s')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def copy(self, source_path, target_path):
+        # The backup API takes a consistent snapshot while the primary is
+        # in use, and replaces the replica's pages in place for its readers.
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
@@ -0,0 +1,90 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:38
+
+from django.db import migrations
+
+# The DDL is a snapshot rather than an import from books.services.search,
+# so this migration keeps working whatever happens to the live code. On
+# SQLite, a later migration that rebuilds books_book drops the triggers
+# and has to recreate them from a copy of these statements.
+
+SQLITE_FTS_STATEMENTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_book_fts USING fts5(
+        title, author, description,
+        content='books_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_insert AFTER INSERT ON books_book BEGIN
+        INSERT INTO books_book_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_delete AFTER DELETE ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_update AFTER UPDATE OF title, author, description ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+        INSERT INTO books_book_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END
+    """,
+    "INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP_STATEMENTS = [
+    'DROP TRIGGER IF EXISTS books_book_fts_insert',
+    'DROP TRIGGER IF EXISTS books_book_fts_delete',
+    'DROP TRIGGER IF EXISTS books_book_fts_update',
+    'DROP TABLE IF EXISTS books_book_fts',
+]
+
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+POSTGRES_FTS_STATEMENTS = [
+    f'CREATE INDEX IF NOT EXISTS books_book_search_idx ON books_book USING GIN (({POSTGRES_DOCUMENT}))',
+]
+
+POSTGRES_FTS_DROP_STATEMENTS = [
+    'DROP INDEX IF EXISTS books_book_search_idx',
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {
+        'sqlite': SQLITE_FTS_STATEMENTS,
+        'postgresql': POSTGRES_FTS_STATEMENTS,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {
+        'sqlite': SQLITE_FTS_DROP_STATEMENTS,
+        'postgresql': POSTGRES_FTS_DROP_STATEMENTS,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_book_search_index'),
+        ('users', '0004_overdue_sweep'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['request_date', 'id'], name='bookrequest_date_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['user', 'book'], name='bookrequest_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_hot_path_indexes'),
+        ('users', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['status', 'request_date', 'id'], name='bookrequest_status_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_bookrequest_status_keyset_index'),
+        ('users', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['book', 'request_date', 'id'], name='bookrequest_queue_idx'),
+        ),
+    ]
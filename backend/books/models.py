@@ -1,5 +1,7 @@
+import secrets
 from django.db import models
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 class Book(models.Model):
     title = models.CharField(max_length=200)
@@ -10,6 +12,13 @@ class Book(models.Model):
     total_copies = models.IntegerField(default=1)
     available_copies = models.IntegerField(default=1)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['title', 'id'], name='book_title_keyset_idx'),
+            models.Index(fields=['author', 'id'], name='book_author_keyset_idx'),
+            models.Index(fields=['available_copies', 'id'], name='book_available_keyset_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -22,6 +31,11 @@ class Book(models.Model):
     def save(self, *args, **kwargs):
         self.clean()
         super().save(*args, **kwargs)
+        ResourceVersion.touch(books=[self.pk])
+
+    def delete(self, *args, **kwargs):
+        ResourceVersion.touch(books=[self.pk])
+        return super().delete(*args, **kwargs)
 
 class BookRequest(models.Model):
     STATUS_CHOICES = [
@@ -52,6 +66,79 @@ class BookRequest(models.Model):
 
     class Meta:
         ordering = ['-request_date']
+        indexes = [
+            models.Index(fields=['request_date', 'id'], name='bookrequest_date_keyset_idx'),
+            models.Index(fields=['status', 'request_date', 'id'], name='bookrequest_status_keyset_idx'),
+            models.Index(
+                fields=['user', 'book'],
+                condition=models.Q(status='PENDING'),
+                name='bookrequest_pending_idx'
+            ),
+            # The reservation queue of each book.
+            models.Index(
+                fields=['book', 'request_date', 'id'],
+                condition=models.Q(status='PENDING'),
+                name='bookrequest_queue_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"Request for {self.book.title} by {self.user.user.username}"
+
+class ResourceVersion(models.Model):
+    """
+    Version stamp of a cached API resource
+
+    Every write that changes a resource replaces its stamp with a new
+    random version in the same transaction, so ETags and cached payloads
+    derived from the stamps change exactly when the data does. Stamps are
+    named 'books' for the catalogue as a whole, 'book:<id>' for one book
+    and 'profile:<id>' for a member's loans and counters.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} v{self.version:x}"
+
+    @classmethod
+    def touch(cls, books=(), profiles=()):
+        """
+        Bump the stamps of the given book and profile ids; changing any
+        book also changes the catalogue
+        """
+        names = [f'book:{pk}' for pk in dict.fromkeys(books)]
+        if names:
+            names.append('books')
+        names += [f'profile:{pk}' for pk in dict.fromkeys(profiles)]
+        return cls.bump(*names)
+
+    @classmethod
+    def bump(cls, *names):
+        """
+        Give each named stamp a new version with one upsert
+
+        Returns:
+            The new stamps, keyed by name
+        """
+        now = timezone.now()
+        stamps = {name: cls(name=name, version=secrets.randbits(63), updated_at=now) for name in names}
+        if stamps:
+            cls.objects.bulk_create(
+                stamps.values(),
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=['version', 'updated_at']
+            )
+        return stamps
+
+    @classmethod
+    def get_many(cls, names):
+        """
+        Current stamps for the given names, keyed by name
+
+        Names that were never touched have no stamp and are left out;
+        reading never writes, only touch() and bump() create stamps.
+        """
+        return {stamp.name: stamp for stamp in cls.objects.filter(name__in=names)}
@@ -0,0 +1,127 @@
+import base64
+import json
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite (sort field, primary key) keyset
+
+    Each page is fetched with a range condition on an indexed column
+    instead of an OFFSET, so the cost of a page does not grow with its
+    position in the result set. The primary key is always used as the
+    final tie-breaker, which keeps the ordering stable even when many
+    rows share the same sort value.
+    """
+
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    ordering_fields = ('id',)
+    default_ordering = 'id'
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if ordering.lstrip('-') not in self.ordering_fields:
+            raise ValidationError({'ordering': f'Unsupported ordering: {ordering}'})
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request, field=None):
+        """
+        The (value, pk) pair in the request's cursor, with the value
+        converted by the model field the page is ordered by
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if field is not None:
+                value = field.to_python(value)
+            return value, int(pk)
+        except (ValueError, TypeError, DjangoValidationError):
+            raise ValidationError({'cursor': 'Invalid cursor'})
+
+    def encode_cursor(self, value, pk):
+        payload = json.dumps([value, pk], default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    def page_queryset(self, queryset, request):
+        """
+        The unevaluated query for one page plus one row, which tells
+        whether there is a next page; async views iterate it themselves
+        and pass the rows to set_page
+        """
+        self.request = request
+        ordering = self.get_ordering(request)
+        self.field = ordering.lstrip('-')
+        self.descending = ordering.startswith('-')
+        page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request, queryset.model._meta.get_field(self.field))
+        if cursor is not None:
+            value, pk = cursor
+            lookup = 'lt' if self.descending else 'gt'
+            if self.field == 'pk' or self.field == 'id':
+                queryset = queryset.filter(**{f'pk__{lookup}': pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{self.field}__{lookup}': value}) |
+                    Q(**{self.field: value, f'pk__{lookup}': pk})
+                )
+
+        order_by = [ordering] if self.field in ('pk', 'id') else [ordering, '-pk' if self.descending else 'pk']
+        self.page_size = page_size
+        return queryset.order_by(*order_by)[:page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor(getattr(last, self.field), last.pk)
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+class BookPagination(KeysetPagination):
+    ordering_fields = ('id', 'title', 'author', 'available_copies')
+    default_ordering = 'title'
+
+class BookRequestPagination(KeysetPagination):
+    page_size = 50
+    ordering_fields = ('request_date',)
+    default_ordering = '-request_date'
+
+class UserPagination(KeysetPagination):
+    ordering_fields = ('id', 'username')
+    default_ordering = 'username'
+
+class LoanHistoryPagination(KeysetPagination):
+    ordering_fields = ('loan_date',)
+    default_ordering = '-loan_date'
@@ -53,6 +53,7 @@ class BookCreateSerializer(serializers.ModelSerializer):
 class BookRequestSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.user.username', read_only=True)
     book_title = serializers.CharField(source='book.title', read_only=True)
+    queue_position = serializers.SerializerMethodField()
     
     class Meta:
         model = BookRequest
@@ -63,6 +64,11 @@ class BookRequestSerializer(serializers.ModelSerializer):
             'request_date',
             'status',
             'notes',
-            'response_date'
+            'response_date',
+            'queue_position'
         ]
         read_only_fields = ['request_date', 'response_date', 'status']
+
+    def get_queue_position(self, obj):
+        # Only set on querysets annotated with BookRequestService.queue_position_expression.
+        return getattr(obj, 'queue_position', None)
@@ -0,0 +1,306 @@
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, List, Optional, Tuple
+
+MISSING = object()
+
+def make_key(namespace: str, query: str, **params) -> str:
+    """
+    Build a cache key from a query and its parameters
+
+    The query is lower-cased with whitespace collapsed and the parameters
+    are sorted, so equivalent requests share one entry.
+    """
+    normalized = ' '.join(query.lower().split())
+    return f'{namespace}:{json.dumps([normalized, params], sort_keys=True)}'
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    negative_hits: int = 0
+    sets: int = 0
+    expirations: int = 0
+    evictions: int = 0
+    # Misses answered by waiting for another caller's computation.
+    coalesced: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), 'hit_ratio': round(self.hit_ratio, 4)}
+
+class LRUCache:
+    """
+    In-process cache bounded by entry count, evicting the least recently used
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = MISSING, allow_expired: bool = False) -> Any:
+        value, _ = self.get_with_ttl(key, default, allow_expired)
+        return value
+
+    def get_with_ttl(self, key: str, default: Any = MISSING,
+                     allow_expired: bool = False) -> Tuple[Any, Optional[float]]:
+        """
+        Return the value and its remaining seconds, None if it never expires
+
+        The remaining time is zero or less for an expired entry returned
+        because of allow_expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return default, None
+
+            expires_at, value = entry
+            remaining = expires_at - time.time() if expires_at is not None else None
+            if remaining is not None and remaining <= 0 and not allow_expired:
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return default, None
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value, remaining
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Set key only if it is missing or expired; returns whether it was set
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.time()):
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def _store(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        self._entries[key] = (time.time() + ttl if ttl is not None else None, value)
+        self._entries.move_to_end(key)
+        self.stats.sets += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCache:
+    """
+    On-disk cache in a single SQLite file, shared by every process on the host
+
+    Values are pickled. The file runs in WAL mode so readers in other
+    processes are not blocked by a writer.
+
+    Eviction is least recently used, approximately: a hit only records its
+    access time when the stored one is over ``touch_interval`` seconds
+    old, and the size is checked every ``evict_every`` writes, so a read
+    is usually a single SELECT and the file can run up to ``evict_every``
+    entries per process over ``max_entries`` between checks.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000,
+                 touch_interval: float = 60, evict_every: int = 100):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.evict_every = evict_every
+        self.stats = CacheStats()
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        with self._connection() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed_at)')
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def get(self, key: str, default: Any = MISSING, allow_expired: bool = False) -> Any:
+        value, _ = self.get_with_ttl(key, default, allow_expired)
+        return value
+
+    def get_with_ttl(self, key: str, default: Any = MISSING,
+                     allow_expired: bool = False) -> Tuple[Any, Optional[float]]:
+        """
+        Return the value and its remaining seconds, as LRUCache.get_with_ttl
+        """
+        db = self._connection()
+        row = db.execute(
+            'SELECT value, expires_at, accessed_at FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return default, None
+
+        value, expires_at, accessed_at = row
+        now = time.time()
+        remaining = expires_at - now if expires_at is not None else None
+        if remaining is not None and remaining <= 0 and not allow_expired:
+            db.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return default, None
+
+        if now - accessed_at >= self.touch_interval:
+            db.execute('UPDATE cache_entries SET accessed_at = ? WHERE key = ?', (now, key))
+        self.stats.hits += 1
+        return pickle.loads(value), remaining
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        db = self._connection()
+        db.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at, now)
+        )
+        self.stats.sets += 1
+        self._evict(db)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Set key only if it is missing or expired; returns whether it was set
+
+        A single statement, so exactly one process wins a race.
+        """
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        db = self._connection()
+        added = db.execute(
+            'INSERT INTO cache_entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at, '
+            'accessed_at = excluded.accessed_at '
+            'WHERE cache_entries.expires_at IS NOT NULL AND cache_entries.expires_at <= ?',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at, now, now)
+        ).rowcount > 0
+        if added:
+            self.stats.sets += 1
+            self._evict(db)
+        return added
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        with self._writes_lock:
+            self._writes += 1
+            if self._writes < self.evict_every:
+                return
+            self._writes = 0
+        (count,) = db.execute('SELECT COUNT(*) FROM cache_entries').fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            db.execute(
+                'DELETE FROM cache_entries WHERE key IN '
+                '(SELECT key FROM cache_entries ORDER BY accessed_at LIMIT ?)',
+                (overflow,)
+            )
+            self.stats.evictions += overflow
+
+    def delete(self, key: str) -> None:
+        self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def items(self):
+        for key, value in self._connection().execute('SELECT key, value FROM cache_entries ORDER BY key'):
+            yield key, pickle.loads(value)
+
+    def clear(self) -> None:
+        self._connection().execute('DELETE FROM cache_entries')
+
+    def __len__(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+
+class TieredCache:
+    """
+    Read-through stack of caches, fastest first
+
+    A hit in a lower tier is copied into the tiers above it for the time it
+    has left, unless it was only returned because of allow_expired. Empty
+    results are cached with negative_ttl, which is usually much shorter
+    than ttl.
+    """
+
+    def __init__(self, tiers: List[Any], ttl: Optional[float] = 86400, negative_ttl: Optional[float] = 3600):
+        self.tiers = tiers
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = CacheStats()
+
+    def lookup(self, key: str, allow_expired: bool = False) -> Tuple[bool, Any]:
+        for index, tier in enumerate(self.tiers):
+            value, remaining = tier.get_with_ttl(key, allow_expired=allow_expired)
+            if value is not MISSING:
+                if remaining is None or remaining > 0:
+                    for upper in self.tiers[:index]:
+                        upper.set(key, value, remaining)
+                self.stats.hits += 1
+                if self._is_negative(value):
+                    self.stats.negative_hits += 1
+                return True, value
+
+        self.stats.misses += 1
+        return False, None
+
+    def get(self, key: str, default: Any = None, allow_expired: bool = False) -> Any:
+        found, value = self.lookup(key, allow_expired=allow_expired)
+        return value if found else default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = MISSING) -> None:
+        if ttl is MISSING:
+            ttl = self._ttl_for(value)
+        for tier in self.tiers:
+            tier.set(key, value, ttl)
+        self.stats.sets += 1
+
+    def delete(self, key: str) -> None:
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def clear(self) -> None:
+        for tier in self.tiers:
+            tier.clear()
+
+    def tier_stats(self) -> dict:
+        return {type(tier).__name__: tier.stats.as_dict() for tier in self.tiers}
+
+    def _ttl_for(self, value: Any) -> Optional[float]:
+        return self.negative_ttl if self._is_negative(value) else self.ttl
+
+    @staticmethod
+    def _is_negative(value: Any) -> bool:
+        return value in (None, [], {})
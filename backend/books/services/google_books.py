@@ -1,8 +1,40 @@
+import asyncio
 import logging
+import sqlite3
+import threading
+import time
+import weakref
+import httpx
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from django.conf import settings
-from typing import List, Dict, Optional
-from books.models import Book
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib3.util.retry import Retry
+from books.models import Book, ResourceVersion
+from books.services.cache import LRUCache, SQLiteCache, TieredCache, make_key
+
+@dataclass
+class ImportStats:
+    """
+    Running totals for a bulk import
+    """
+    pages: int = 0
+    volumes: int = 0
+    without_isbn: int = 0
+    duplicates: int = 0
+    existing: int = 0
+    inserted: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def books_per_second(self) -> float:
+        return self.inserted / self.elapsed if self.elapsed else 0.0
 
 class GoogleBooksService:
     """
@@ -11,34 +43,252 @@ class GoogleBooksService:
     """
     
     BASE_URL = 'https://www.googleapis.com/books/v1/volumes'
-    
+    PAGE_SIZE = 40
+    POOL_SIZE = 16
+    TIMEOUT = 10
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    RETRIES = 3
+    BACKOFF_FACTOR = 0.5
+
+    _session = None
+    _session_lock = threading.Lock()
+    _async_clients = weakref.WeakKeyDictionary()
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    @classmethod
+    def get_cache(cls) -> Optional[TieredCache]:
+        """
+        Response cache configured by settings.GOOGLE_BOOKS_CACHE, or None
+        when caching is disabled
+        """
+        with cls._cache_lock:
+            if cls._cache is None:
+                config = getattr(settings, 'GOOGLE_BOOKS_CACHE', {})
+                if not config.get('ENABLED', True):
+                    return None
+                tiers = [LRUCache(max_entries=config.get('MAX_ENTRIES', 1024))]
+                if config.get('PATH'):
+                    tiers.append(SQLiteCache(config['PATH'], max_entries=config.get('MAX_DISK_ENTRIES', 100_000)))
+                cls._cache = TieredCache(
+                    tiers,
+                    ttl=config.get('TTL', 86400),
+                    negative_ttl=config.get('NEGATIVE_TTL', 3600)
+                )
+            return cls._cache
+
+    @classmethod
+    def set_cache(cls, cache: Optional[TieredCache]) -> None:
+        with cls._cache_lock:
+            cls._cache = cache
+
+    @classmethod
+    def get_base_url(cls) -> str:
+        return getattr(settings, 'GOOGLE_BOOKS_BASE_URL', None) or cls.BASE_URL
+
+    @classmethod
+    def is_offline(cls) -> bool:
+        return getattr(settings, 'GOOGLE_BOOKS_CACHE', {}).get('OFFLINE', False)
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """
+        Shared HTTP session so connections are pooled and kept alive
+        across requests and worker threads
+        """
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=cls.POOL_SIZE,
+                    pool_maxsize=cls.POOL_SIZE,
+                    max_retries=Retry(
+                        total=cls.RETRIES,
+                        backoff_factor=cls.BACKOFF_FACTOR,
+                        status_forcelist=sorted(cls.RETRY_STATUSES)
+                    )
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                cls._session = session
+            return cls._session
+
     @classmethod
-    def search_books(cls, query: str, max_results: int = 10) -> List[Dict]:
+    def search_books(cls, query: str, max_results: int = 10, start_index: int = 0) -> List[Dict]:
         """
         Search for books via Google Books API
         
         Args:
             query (str): Search term for books
-            max_results (int): Maximum number of results to return
+            max_results (int): Maximum number of results to return (at most 40)
+            start_index (int): Offset of the first result, for paging
         
         Returns:
-            List of book dictionaries from Google Books API
+            List of book dictionaries from Google Books API. Responses are
+            served from the configured cache when possible; errors are
+            never cached.
         """
+        key = make_key('volumes', query, max_results=max_results, start_index=start_index)
+        found, items = cls._lookup(key)
+        if found:
+            return items
+
         try:
-            params = {
-                'q': query,
-                'maxResults': max_results,
-                'key': settings.GOOGLE_BOOKS_API_KEY
-            }
-            response = requests.get(cls.BASE_URL, params=params)
+            response = cls.get_session().get(
+                cls.get_base_url(),
+                params=cls._params(query, max_results, start_index),
+                timeout=cls.TIMEOUT
+            )
             response.raise_for_status()
             
-            return response.json().get('items', [])
+            items = response.json().get('items', [])
+            cls._store(key, items)
+            return items
         
         except requests.RequestException as e:
             logging.error(f"Google Books API error: {e}")
             return []
+
+    @classmethod
+    async def asearch_books(cls, query: str, max_results: int = 10, start_index: int = 0) -> List[Dict]:
+        """
+        Async version of search_books for ASGI views
+
+        Uses the same cache, and retries throttling and server errors with
+        the same backoff as the sync session, without holding a thread
+        while it waits on the network.
+        """
+        key = make_key('volumes', query, max_results=max_results, start_index=start_index)
+        found, items = cls._lookup(key)
+        if found:
+            return items
+
+        client = cls.get_async_client()
+        params = cls._params(query, max_results, start_index)
+        try:
+            for attempt in range(cls.RETRIES + 1):
+                response = await client.get(cls.get_base_url(), params=params)
+                if response.status_code not in cls.RETRY_STATUSES or attempt == cls.RETRIES:
+                    break
+                await asyncio.sleep(cls.BACKOFF_FACTOR * 2 ** attempt)
+            response.raise_for_status()
+
+            items = response.json().get('items', [])
+            cls._store(key, items)
+            return items
+
+        except httpx.HTTPError as e:
+            logging.error(f"Google Books API error: {e}")
+            return []
+
+    @classmethod
+    def get_async_client(cls) -> httpx.AsyncClient:
+        """
+        Pooled async client for the running event loop
+
+        An AsyncClient is bound to the loop it was first used on, so each
+        loop gets its own; it is dropped along with the loop.
+        """
+        loop = asyncio.get_running_loop()
+        client = cls._async_clients.get(loop)
+        if client is None:
+            client = cls._async_clients[loop] = httpx.AsyncClient(
+                timeout=cls.TIMEOUT,
+                limits=httpx.Limits(max_connections=cls.POOL_SIZE * 4, max_keepalive_connections=cls.POOL_SIZE)
+            )
+        return client
+
+    @classmethod
+    def _lookup(cls, key: str) -> Tuple[bool, List[Dict]]:
+        """
+        Cached items for a request key; offline, a miss counts as an
+        empty result so the API is never called
+        """
+        cache = cls.get_cache()
+        offline = cls.is_offline()
+        if cache is not None:
+            # Offline, anything on disk is better than nothing, so
+            # expired entries are still served.
+            try:
+                found, items = cache.lookup(key, allow_expired=offline)
+            except sqlite3.Error as e:
+                # A locked or broken cache file must not fail the search.
+                logging.warning(f"Google Books cache unavailable: {e}")
+                found = False
+            if found:
+                return True, items
+        return offline, []
+
+    @classmethod
+    def _store(cls, key: str, items: List[Dict]) -> None:
+        cache = cls.get_cache()
+        if cache is not None:
+            try:
+                cache.set(key, items)
+            except sqlite3.Error as e:
+                logging.warning(f"Google Books cache unavailable: {e}")
+
+    @classmethod
+    def _params(cls, query: str, max_results: int, start_index: int) -> Dict:
+        params = {
+            'q': query,
+            'maxResults': max_results,
+            'startIndex': start_index
+        }
+        if settings.GOOGLE_BOOKS_API_KEY:
+            params['key'] = settings.GOOGLE_BOOKS_API_KEY
+        return params
     
+    @classmethod
+    def fetch_volumes(cls, queries: Iterable[str], per_query: int,
+                      workers: int = 8) -> Iterator[Tuple[str, List[Dict]]]:
+        """
+        Fetch every result page for several queries concurrently
+
+        Args:
+            queries: Search terms
+            per_query (int): Number of volumes wanted for each query
+            workers (int): Number of concurrent requests
+
+        Yields:
+            (query, volumes) for each page as soon as it arrives
+        """
+        pages = [
+            (query, start, min(cls.PAGE_SIZE, per_query - start))
+            for query in queries
+            for start in range(0, per_query, cls.PAGE_SIZE)
+        ]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(cls.search_books, query, size, start): query
+                for query, start, size in pages
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    @classmethod
+    def build_book(cls, google_book: Dict) -> Optional[Book]:
+        """
+        Build an unsaved Book from a Google Books API volume
+
+        Returns:
+            Book instance, or None if the volume has no ISBN
+        """
+        volume_info = google_book.get('volumeInfo', {})
+        isbn = cls._extract_isbn(volume_info)
+        if not isbn:
+            return None
+
+        return Book(
+            title=volume_info.get('title', 'Unknown Title')[:200],
+            author=', '.join(volume_info.get('authors', ['Unknown Author']))[:200],
+            isbn=isbn,
+            description=volume_info.get('description', ''),
+            google_book_id=google_book.get('id', '')[:100],
+        )
+
     @classmethod
     def convert_to_book_model(cls, google_book: Dict) -> Optional[Book]:
         """
@@ -97,24 +347,90 @@ class GoogleBooksService:
         
         return ''
 
+    @classmethod
+    def save_books(cls, books: List[Book], stats: ImportStats, batch_size: int = 500) -> None:
+        """
+        Insert books that are not in the database yet, in batches
+
+        Existing ISBNs are filtered out with one query per batch so the
+        inserted count is exact; ignore_conflicts still covers rows added
+        concurrently by another import.
+        """
+        for offset in range(0, len(books), batch_size):
+            batch = books[offset:offset + batch_size]
+            existing = set(
+                Book.objects.filter(isbn__in=[book.isbn for book in batch]).values_list('isbn', flat=True)
+            )
+            new_books = [book for book in batch if book.isbn not in existing]
+            Book.objects.bulk_create(new_books, ignore_conflicts=True)
+            if new_books:
+                ResourceVersion.bump('books')
+            stats.existing += len(batch) - len(new_books)
+            stats.inserted += len(new_books)
+
+    @classmethod
+    def bulk_import(cls, topics: Iterable[str], per_topic: int, workers: int = 8, batch_size: int = 500,
+                    progress: Optional[Callable[[str, ImportStats], None]] = None) -> ImportStats:
+        """
+        Fetch several topics concurrently and insert the new books in bulk
+
+        Volumes are de-duplicated by ISBN in memory before touching the
+        database, and pending books are flushed every batch_size books.
+
+        Args:
+            topics: Search terms to import
+            per_topic (int): Number of volumes to fetch for each topic
+            workers (int): Number of concurrent HTTP requests
+            batch_size (int): Number of books per INSERT
+            progress: Optional callback, called with (topic, stats) after each page
+
+        Returns:
+            ImportStats with page, volume and insert counts
+        """
+        stats = ImportStats()
+        seen_isbns = set()
+        pending = []
+
+        for topic, volumes in cls.fetch_volumes(topics, per_topic, workers=workers):
+            stats.pages += 1
+            stats.volumes += len(volumes)
+            for volume in volumes:
+                book = cls.build_book(volume)
+                if book is None:
+                    stats.without_isbn += 1
+                elif book.isbn in seen_isbns:
+                    stats.duplicates += 1
+                else:
+                    seen_isbns.add(book.isbn)
+                    pending.append(book)
+
+            if len(pending) >= batch_size:
+                cls.save_books(pending, stats, batch_size)
+                pending = []
+            if progress:
+                progress(topic, stats)
+
+        cls.save_books(pending, stats, batch_size)
+        return stats
+
     @classmethod
     def import_books_from_search(cls, query: str, max_results: int = 10) -> List[Book]:
         """
         Search Google Books and import results to local database
-        
+
         Args:
             query (str): Search term
             max_results (int): Maximum books to import
-        
+
         Returns:
             List of imported Book instances
         """
-        google_books = cls.search_books(query, max_results)
-        imported_books = []
-        
-        for book_data in google_books:
-            book = cls.convert_to_book_model(book_data)
-            if book:
-                imported_books.append(book)
-        
-        return imported_books
+        books = {}
+        for _, volumes in cls.fetch_volumes([query], max_results):
+            for volume in volumes:
+                book = cls.build_book(volume)
+                if book:
+                    books.setdefault(book.isbn, book)
+
+        cls.save_books(list(books.values()), ImportStats())
+        return list(Book.objects.filter(isbn__in=books.keys()))
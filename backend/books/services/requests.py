@@ -0,0 +1,188 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Case, Count, OuterRef, Q, Subquery, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from books.models import Book, BookRequest
+from users.models import BookLoan
+from users.services.loans import LoanService
+
+@dataclass
+class Decision:
+    """
+    Outcome of one request in a bulk decision
+    """
+    request_id: int
+    outcome: str
+    error: str = ''
+    loan_id: Optional[int] = None
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+class BookRequestService:
+    """
+    Approving and rejecting book requests, and the reservation queue
+
+    Pending requests for a book form its reservation queue, oldest first.
+    Positions are counted through the partial (book, request_date, id)
+    index on pending requests, never by scanning the table.
+    """
+
+    MAX_DECISIONS = 5000
+    ALLOCATION_BATCH = 20
+
+    @classmethod
+    def decide(cls, approve: Iterable[int] = (), reject: Iterable[int] = ()) -> List[Decision]:
+        """
+        Approve and reject many pending requests in one transaction
+
+        Approvals are served oldest request first, so when copies run out
+        the earliest requesters get them. An approval only succeeds if its
+        loan can be checked out; otherwise the request stays pending and
+        the reason is reported.
+
+        Args:
+            approve: Ids of requests to approve
+            reject: Ids of requests to reject
+
+        Returns:
+            One Decision per id, approvals first, in the order given
+        """
+        approve = list(dict.fromkeys(approve))
+        reject = list(dict.fromkeys(reject))
+        conflicting = set(approve) & set(reject)
+        now = timezone.now()
+
+        with transaction.atomic():
+            requests = BookRequest.objects.filter(pk__in=approve + reject).only(
+                'user_id', 'book_id', 'status', 'request_date'
+            )
+            if connection.features.has_select_for_update:
+                requests = requests.select_for_update()
+            requests = {request.pk: request for request in requests}
+
+            decisions = {}
+            for request_id in approve + reject:
+                request = requests.get(request_id)
+                if request_id in conflicting:
+                    decisions[request_id] = Decision(request_id, 'skipped', 'Request both approved and rejected')
+                elif request is None:
+                    decisions[request_id] = Decision(request_id, 'skipped', 'Request not found')
+                elif request.status != 'PENDING':
+                    decisions[request_id] = Decision(request_id, 'skipped', 'Request is not pending')
+
+            approvals = sorted(
+                (requests[request_id] for request_id in approve if request_id not in decisions),
+                key=lambda request: (request.request_date, request.pk)
+            )
+            loans = [BookLoan(user_id=request.user_id, book_id=request.book_id) for request in approvals]
+            errors = LoanService.checkout_many(loans)
+
+            approved = []
+            for request, loan, error in zip(approvals, loans, errors):
+                if error:
+                    decisions[request.pk] = Decision(request.pk, 'skipped', error)
+                else:
+                    decisions[request.pk] = Decision(request.pk, 'approved', loan_id=loan.pk)
+                    approved.append(request.pk)
+
+            rejected = [request_id for request_id in reject if request_id not in decisions]
+            for request_id in rejected:
+                decisions[request_id] = Decision(request_id, 'rejected')
+
+            BookRequest.objects.filter(pk__in=approved).update(status='APPROVED', response_date=now)
+            BookRequest.objects.filter(pk__in=rejected).update(status='REJECTED', response_date=now)
+
+        return [decisions[request_id] for request_id in approve + reject]
+
+    @classmethod
+    def allocate(cls, book_id: int) -> List[BookLoan]:
+        """
+        Hand free copies of a book to the oldest eligible pending requests
+
+        Called when a copy comes back. Each request is claimed with a
+        conditional UPDATE and checked out in a savepoint, so concurrent
+        returns can never give one request two loans or oversell a copy;
+        requesters who are at their loan limit or already hold the book
+        keep their place and are skipped.
+
+        Returns:
+            The loans created, in queue order
+        """
+        now = timezone.now()
+        loans = []
+        queue = BookRequest.objects.filter(book_id=book_id, status='PENDING').order_by('request_date', 'id')
+
+        # Each claim has its own savepoint; the loop itself only needs to
+        # join the caller's transaction.
+        with transaction.atomic(savepoint=False):
+            after = None
+            while True:
+                batch = queue if after is None else queue.filter(
+                    Q(request_date__gt=after[0]) | Q(request_date=after[0], pk__gt=after[1])
+                )
+                candidates = list(batch.values_list('pk', 'user_id', 'request_date')[:cls.ALLOCATION_BATCH])
+                if not candidates:
+                    return loans
+
+                for request_id, user_id, request_date in candidates:
+                    try:
+                        with transaction.atomic():
+                            claimed = BookRequest.objects.filter(pk=request_id, status='PENDING').update(
+                                status='APPROVED',
+                                response_date=now
+                            )
+                            if not claimed:
+                                continue
+                            loans.append(LoanService.checkout(BookLoan(user_id=user_id, book_id=book_id)))
+                    except ValidationError as e:
+                        if getattr(e, 'code', None) == 'unavailable':
+                            return loans
+                after = (candidates[-1][2], candidates[-1][0])
+
+    @classmethod
+    def queue_position_expression(cls):
+        """
+        Expression annotating a pending request with its 1-based place in
+        its book's queue; None for requests that are no longer pending
+        """
+        request_date = OuterRef('request_date')
+        ahead = BookRequest.objects.filter(
+            Q(request_date__lt=request_date) | Q(request_date=request_date, pk__lt=OuterRef('pk')),
+            book=OuterRef('book'),
+            status='PENDING'
+        ).order_by().values('book').annotate(total=Count('pk')).values('total')
+        return Case(When(status='PENDING', then=Coalesce(Subquery(ahead), 0) + 1), default=None)
+
+    @classmethod
+    def estimate_available_at(cls, book: Book, position: int) -> Optional[datetime]:
+        """
+        Estimate when the copy for a queue position frees up
+
+        Free copies go to the first positions. After that, copies are
+        assumed to come back on their loans' due dates and to be lent
+        again for a full loan period each time.
+
+        Returns:
+            The estimated time, or None if the book has no copies at all
+        """
+        now = timezone.now()
+        if position <= book.available_copies:
+            return now
+
+        waiting = position - book.available_copies
+        due_dates = list(
+            BookLoan.objects.filter(book=book, return_date__isnull=True)
+            .order_by('due_date')
+            .values_list('due_date', flat=True)[:waiting]
+        )
+        if not due_dates:
+            return None
+
+        # With fewer loans than people waiting, copies go round again.
+        rounds, index = divmod(waiting - 1, len(due_dates))
+        return max(due_dates[index], now) + rounds * LoanService.LOAN_PERIOD
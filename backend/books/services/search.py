@@ -0,0 +1,134 @@
+import re
+from abc import ABC, abstractmethod
+from typing import List, Optional
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from books.models import Book
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Searched fields and their Postgres document weights, best first.
+SEARCH_WEIGHTS = {'title': 'A', 'author': 'B', 'description': 'C'}
+SEARCH_FIELDS = tuple(SEARCH_WEIGHTS)
+
+# Has to match the expression indexed by migration 0004 for the index to
+# be used.
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+def tokenize(query: str) -> List[str]:
+    return TOKEN_PATTERN.findall(query.lower())
+
+class BookSearchBackend(ABC):
+    """
+    Ranked prefix search over Book title, author and description
+
+    Every query term is treated as a prefix and all terms must match, so
+    the same call serves both type-ahead and full searches.
+    """
+
+    def search(self, query: str, limit: int = 20) -> List[Book]:
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        book_ids = self.ranked_ids(terms, limit)
+        books = Book.objects.in_bulk(book_ids)
+        return [books[book_id] for book_id in book_ids if book_id in books]
+
+    def matching(self, query: str, field: Optional[str] = None) -> Q:
+        """
+        Condition for the books matching every term of ``query``, in any
+        searched field or only in ``field``
+
+        Unlike search() the matches are neither ranked nor limited, so the
+        caller can order and page them like any other filter.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return Q(pk__in=[])
+        if field is not None and field not in SEARCH_FIELDS:
+            raise ValueError(f'Cannot search {field}')
+        return self.match_condition(terms, field)
+
+    @abstractmethod
+    def ranked_ids(self, terms: List[str], limit: int) -> List[int]:
+        """
+        Ids of at most ``limit`` books matching every term, best first
+        """
+
+    @abstractmethod
+    def match_condition(self, terms: List[str], field: Optional[str]) -> Q:
+        """
+        Condition for the books matching every term, for matching()
+        """
+
+class SQLiteSearchBackend(BookSearchBackend):
+    def ranked_ids(self, terms: List[str], limit: int) -> List[int]:
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT rowid FROM books_book_fts
+                WHERE books_book_fts MATCH %s
+                ORDER BY bm25(books_book_fts, 10.0, 5.0, 1.0)
+                LIMIT %s
+                """,
+                [match, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def match_condition(self, terms: List[str], field: Optional[str]) -> Q:
+        match = ' '.join(f'"{term}"*' for term in terms)
+        if field:
+            match = f'{field} : ({match})'
+        return Q(pk__in=RawSQL('SELECT rowid FROM books_book_fts WHERE books_book_fts MATCH %s', [match]))
+
+class PostgresSearchBackend(BookSearchBackend):
+    def ranked_ids(self, terms: List[str], limit: int) -> List[int]:
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT id FROM books_book
+                WHERE ({POSTGRES_DOCUMENT}) @@ to_tsquery('simple', %s)
+                ORDER BY ts_rank(({POSTGRES_DOCUMENT}), to_tsquery('simple', %s)) DESC, id
+                LIMIT %s
+                """,
+                [tsquery, tsquery, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def match_condition(self, terms: List[str], field: Optional[str]) -> Q:
+        # A weight label keeps a single-field match on the document index.
+        weight = SEARCH_WEIGHTS[field] if field else ''
+        tsquery = ' & '.join(f'{term}:*{weight}' for term in terms)
+        return Q(pk__in=RawSQL(
+            f"SELECT id FROM books_book WHERE ({POSTGRES_DOCUMENT}) @@ to_tsquery('simple', %s)",
+            [tsquery]
+        ))
+
+class FallbackSearchBackend(BookSearchBackend):
+    def ranked_ids(self, terms: List[str], limit: int) -> List[int]:
+        return list(Book.objects.filter(self.match_condition(terms, None)).order_by('title', 'id')
+                    .values_list('id', flat=True)[:limit])
+
+    def match_condition(self, terms: List[str], field: Optional[str]) -> Q:
+        condition = Q()
+        for term in terms:
+            condition &= Q.create(
+                [(f'{name}__icontains', term) for name in ([field] if field else SEARCH_FIELDS)],
+                connector=Q.OR
+            )
+        return condition
+
+def get_search_backend() -> BookSearchBackend:
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return FallbackSearchBackend()
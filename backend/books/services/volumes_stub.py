@@ -0,0 +1,194 @@
+"""
+Local stand-in for the Google Books volumes endpoint
+
+Serves either a deterministic synthetic corpus or a corpus recorded with
+``manage.py google_books_cache --dump``. Responses use the same paging
+parameters and payload shape as the real API, with configurable latency
+and error injection. Point ``GOOGLE_BOOKS_BASE_URL`` at the server to run
+imports and load tests without network access or an API key.
+"""
+
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+VOLUMES_PATH = '/books/v1/volumes'
+MAX_RESULTS_LIMIT = 40
+
+ADJECTIVES = ['Silent', 'Crimson', 'Hidden', 'Last', 'Infinite', 'Broken', 'Golden', 'Distant',
+              'Forgotten', 'Electric', 'Wandering', 'Hollow', 'Radiant', 'Quiet', 'Savage', 'Little']
+NOUNS = ['Garden', 'Algorithm', 'Empire', 'River', 'Machine', 'Kingdom', 'Archive', 'Compiler',
+         'Ocean', 'Library', 'Dragon', 'Protocol', 'Harbor', 'Forest', 'Engine', 'Star']
+FIRST_NAMES = ['Ada', 'Alan', 'Grace', 'Ursula', 'Isaac', 'Octavia', 'Donald', 'Mary', 'Terry', 'Ken']
+LAST_NAMES = ['Lovelace', 'Turing', 'Hopper', 'Le Guin', 'Asimov', 'Butler', 'Knuth', 'Shelley',
+              'Pratchett', 'Thompson']
+
+def isbn13(number: int) -> str:
+    digits = f'978{number % 10**9:09d}'
+    checksum = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(digits))
+    return digits + str((10 - checksum % 10) % 10)
+
+def isbn10(number: int) -> str:
+    digits = f'{number % 10**9:09d}'
+    check = (11 - sum((10 - i) * int(d) for i, d in enumerate(digits)) % 11) % 11
+    return digits + ('X' if check == 10 else str(check))
+
+class SyntheticCorpus:
+    """
+    Deterministic corpus of ``size`` volumes, generated on demand
+
+    Every query matches a stable, query-dependent slice of the corpus, so
+    paging through the same query always returns the same volumes without
+    holding the corpus in memory. About one volume in twenty has no ISBN,
+    as in the real data.
+    """
+
+    def __init__(self, size: int = 100_000, seed: int = 0):
+        self.size = size
+        self.seed = seed
+
+    def volume(self, index: int) -> Dict:
+        rng = random.Random(self.seed * 1_000_003 + index)
+        title = f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+        if index % 3 == 0:
+            title += f' {rng.randint(2, 9)}'
+        authors = [
+            f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            for _ in range(1 + (index % 7 == 0))
+        ]
+        identifiers = [] if index % 20 == 19 else [
+            {'type': 'ISBN_13', 'identifier': isbn13(index)},
+            {'type': 'ISBN_10', 'identifier': isbn10(index)},
+        ]
+        return {
+            'kind': 'books#volume',
+            'id': f'stub{index:09d}',
+            'volumeInfo': {
+                'title': title,
+                'authors': authors,
+                'description': f'{title} by {", ".join(authors)}. ' + ' '.join(
+                    rng.choice(NOUNS).lower() for _ in range(rng.randint(10, 40))
+                ),
+                'industryIdentifiers': identifiers,
+                'pageCount': rng.randint(80, 900),
+            }
+        }
+
+    def search(self, query: str, start: int, count: int) -> Tuple[int, List[Dict]]:
+        key = zlib.crc32(' '.join(query.lower().split()).encode())
+        total = min(self.size, 200 + key % 2000)
+        offset = key % self.size
+        end = min(start + count, total)
+        return total, [self.volume((offset + i) % self.size) for i in range(start, end)]
+
+class RecordedCorpus:
+    """
+    Corpus replayed from a fixture written by ``google_books_cache --dump``
+    """
+
+    def __init__(self, path: str):
+        with open(path) as fixture:
+            entries = json.load(fixture)
+        pages: Dict[str, List[Tuple[int, List[Dict]]]] = {}
+        for entry in entries:
+            query = ' '.join(entry['query'].lower().split())
+            pages.setdefault(query, []).append((entry.get('start_index', 0), entry['items']))
+
+        self.volumes: Dict[str, List[Dict]] = {}
+        for query, query_pages in pages.items():
+            seen = {}
+            for _, items in sorted(query_pages, key=lambda page: page[0]):
+                for item in items:
+                    seen.setdefault(item.get('id'), item)
+            self.volumes[query] = list(seen.values())
+
+    def search(self, query: str, start: int, count: int) -> Tuple[int, List[Dict]]:
+        volumes = self.volumes.get(' '.join(query.lower().split()), [])
+        return len(volumes), volumes[start:start + count]
+
+class VolumesHandler(BaseHTTPRequestHandler):
+    corpus = None
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    quiet = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != VOLUMES_PATH:
+            return self.send_json(404, self.error_body(404, 'Not Found'))
+
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if self.error_rate and random.random() < self.error_rate:
+            code = random.choice([429, 500, 503])
+            return self.send_json(code, self.error_body(code, 'Injected failure'))
+
+        params = parse_qs(url.query)
+        query = params.get('q', [''])[0]
+        if not query:
+            return self.send_json(400, self.error_body(400, 'Missing query.'))
+        try:
+            start = int(params.get('startIndex', ['0'])[0])
+            count = int(params.get('maxResults', ['10'])[0])
+        except ValueError:
+            return self.send_json(400, self.error_body(400, 'Invalid value'))
+        if start < 0 or not 0 < count <= MAX_RESULTS_LIMIT:
+            return self.send_json(400, self.error_body(400, 'Invalid value'))
+
+        total, items = self.corpus.search(query, start, count)
+        body = {'kind': 'books#volumes', 'totalItems': total}
+        if items:
+            body['items'] = items
+        self.send_json(200, body)
+
+    def send_json(self, code: int, body: Dict):
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    @staticmethod
+    def error_body(code: int, message: str) -> Dict:
+        return {'error': {'code': code, 'message': message, 'errors': [{'message': message}]}}
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+class VolumesServer(ThreadingHTTPServer):
+    # Load tests open many connections at once. With the default backlog
+    # of 5 the kernel drops the rest, and their clients retry a second later.
+    request_queue_size = 128
+    daemon_threads = True
+
+def make_server(corpus, host: str = '127.0.0.1', port: int = 8765, latency: float = 0.0,
+                jitter: float = 0.0, error_rate: float = 0.0, quiet: bool = True) -> ThreadingHTTPServer:
+    """
+    Build a threaded server for ``corpus``; port 0 picks a free port
+    """
+    handler = type('ConfiguredVolumesHandler', (VolumesHandler,), {
+        'corpus': corpus,
+        'latency': latency,
+        'jitter': jitter,
+        'error_rate': error_rate,
+        'quiet': quiet,
+    })
+    return VolumesServer((host, port), handler)
+
+def start_in_thread(server: ThreadingHTTPServer) -> Tuple[str, threading.Thread]:
+    """
+    Serve in a background thread and return the volumes URL
+    """
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}{VOLUMES_PATH}', thread
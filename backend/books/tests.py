@@ -1,3 +1,768 @@
-from django.test import TestCase
+import asyncio
+import base64
+import httpx
+import json
+import os
+import requests
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, transaction
+from django.test import Client, TestCase, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import Book, BookRequest, ResourceVersion
+from .services.cache import LRUCache, MISSING, SQLiteCache, TieredCache, make_key
+from .services.google_books import GoogleBooksService
+from .services.requests import BookRequestService
+from users.models import BookLoan, UserProfile
+from users.services.loans import LoanService
+from .services.volumes_stub import SyntheticCorpus, make_server, start_in_thread
 
-# Create your tests here.
+class BookListViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', password='password123')
+        self.client.force_authenticate(self.user)
+        for i in range(25):
+            Book.objects.create(
+                title=f'Book {i:02d}',
+                author='Ursula Le Guin' if i % 2 else 'Terry Pratchett',
+                isbn=f'{9780000000000 + i}',
+                total_copies=1,
+                available_copies=i % 3 and 1
+            )
+
+    def test_list_is_paginated_by_cursor(self):
+        response = self.client.get('/api/books/', {'page_size': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNotNone(response.data['next'])
+
+        seen = [book['title'] for book in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            response = self.client.get(next_url)
+            seen.extend(book['title'] for book in response.data['results'])
+            next_url = response.data['next']
+
+        self.assertEqual(seen, sorted(Book.objects.values_list('title', flat=True)))
+
+    def test_cursor_is_stable_for_duplicate_sort_values(self):
+        seen = []
+        next_url = '/api/books/?ordering=-available_copies&page_size=4'
+        while next_url:
+            response = self.client.get(next_url)
+            seen.extend(book['id'] for book in response.data['results'])
+            next_url = response.data['next']
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_filters_run_in_database(self):
+        response = self.client.get('/api/books/', {
+            'author': 'pratchett',
+            'available': 'true',
+            'page_size': 100
+        })
+        results = response.data['results']
+        self.assertTrue(results)
+        self.assertTrue(all(book['author'] == 'Terry Pratchett' for book in results))
+        self.assertTrue(all(book['available_copies'] > 0 for book in results))
+
+        response = self.client.get('/api/books/', {'q': 'book 07'})
+        self.assertEqual([book['title'] for book in response.data['results']], ['Book 07'])
+
+    def test_query_matches_word_prefixes_and_isbn_prefixes(self):
+        response = self.client.get('/api/books/', {'q': 'le gu', 'page_size': 100})
+        self.assertEqual(len(response.data['results']), 12)
+
+        response = self.client.get('/api/books/', {'q': '978000000001', 'page_size': 100})
+        self.assertEqual([book['isbn'] for book in response.data['results']],
+                         [f'{9780000000010 + i}' for i in range(10)])
+
+        response = self.client.get('/api/books/', {'author': 'guin pratch'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_rejects_a_cursor_of_the_wrong_type(self):
+        cursor = base64.urlsafe_b64encode(json.dumps(['many', 1]).encode()).decode()
+        response = self.client.get('/api/books/', {'ordering': 'available_copies', 'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'cursor': 'Invalid cursor'})
+
+    def test_rejects_unknown_ordering(self):
+        response = self.client.get('/api/books/', {'ordering': 'description'})
+        self.assertEqual(response.status_code, 400)
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='reader')
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        total_copies=2, available_copies=2)
+
+    def test_unchanged_book_is_not_modified(self):
+        url = f'/api/books/{self.book.pk}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_rendered_payload_is_served_from_the_cache(self):
+        url = f'/api/books/{self.book.pk}/'
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
+
+    def test_loans_and_edits_change_the_etag(self):
+        detail = self.client.get(f'/api/books/{self.book.pk}/')
+        listing = self.client.get('/api/books/')
+
+        LoanService.checkout(BookLoan(user=self.user.profile, book=self.book))
+
+        response = self.client.get(f'/api/books/{self.book.pk}/', HTTP_IF_NONE_MATCH=detail['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['available_copies'], 1)
+        response = self.client.get('/api/books/', HTTP_IF_NONE_MATCH=listing['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['available_copies'], 1)
+
+        listing = response
+        Book.objects.create(title='Emma', author='Jane Austen', isbn='9780141439587')
+        response = self.client.get('/api/books/', HTTP_IF_NONE_MATCH=listing['ETag'])
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_etag_depends_on_the_query(self):
+        first = self.client.get('/api/books/?ordering=title')
+        second = self.client.get('/api/books/?ordering=-title')
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_missing_book_is_not_cached(self):
+        response = self.client.get('/api/books/999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_reads_never_create_stamps(self):
+        ResourceVersion.objects.filter(name=f'book:{self.book.pk}').delete()
+        self.client.get('/api/books/999/')
+        first = self.client.get(f'/api/books/{self.book.pk}/')
+        second = self.client.get(f'/api/books/{self.book.pk}/')
+
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertFalse(ResourceVersion.objects.filter(name__in=['book:999', f'book:{self.book.pk}']).exists())
+
+        self.book.save()
+        response = self.client.get(f'/api/books/{self.book.pk}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+class BookSearchViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', password='password123')
+        self.client.force_authenticate(self.user)
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        description='Spice, sand and politics on Arrakis')
+        self.earthsea = Book.objects.create(title='A Wizard of Earthsea', author='Ursula K. Le Guin',
+                                            isbn='9780547773742', description='A young wizard on Roke')
+        self.dispossessed = Book.objects.create(title='The Dispossessed', author='Ursula K. Le Guin',
+                                                isbn='9780061054884', description='Anarres and Urras')
+
+    def search(self, query):
+        response = self.client.get('/api/books/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [book['id'] for book in response.data['results']]
+
+    def test_prefix_queries_match_title_author_and_description(self):
+        self.assertEqual(self.search('earth'), [self.earthsea.id])
+        self.assertEqual(set(self.search('ursu le')), {self.earthsea.id, self.dispossessed.id})
+        self.assertEqual(self.search('arrak'), [self.dune.id])
+
+    def test_title_matches_rank_above_description_matches(self):
+        archipelago = Book.objects.create(title='Tales from the Archipelago', author='Anon',
+                                          isbn='9780000000001', description='Stories of a wizard school')
+        self.assertEqual(self.search('wizard'), [self.earthsea.id, archipelago.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.dune.title = 'Children of Dune'
+        self.dune.save()
+        self.assertEqual(self.search('children'), [self.dune.id])
+
+        self.dune.delete()
+        self.assertEqual(self.search('children'), [])
+
+    def test_empty_query_returns_no_results(self):
+        self.assertEqual(self.search('  '), [])
+
+def fake_volume(isbn, title):
+    identifiers = [{'type': 'ISBN_13', 'identifier': isbn}] if isbn else []
+    return {
+        'id': f'g-{isbn or title}',
+        'volumeInfo': {'title': title, 'authors': ['Author'], 'industryIdentifiers': identifiers}
+    }
+
+def fake_search(query, max_results=10, start_index=0):
+    # Every topic shares the ISBNs of its first two results with the
+    # other topics, and each page has one volume without an ISBN.
+    volumes = []
+    for n in range(start_index, start_index + max_results - 1):
+        isbn = f'{9780000000000 + n}' if n < 2 else f'{9780000000000 + zlib.crc32(query.encode()) % 10**6 * 100 + n}'
+        volumes.append(fake_volume(isbn, f'{query} {n}'))
+    volumes.append(fake_volume('', f'{query} no isbn'))
+    return volumes
+
+@mock.patch.object(GoogleBooksService, 'search_books', side_effect=fake_search)
+class GoogleBooksBulkImportTests(TestCase):
+    def test_bulk_import_pages_deduplicates_and_inserts_in_batches(self, search):
+        progress = []
+        stats = GoogleBooksService.bulk_import(
+            ['fantasy', 'history'],
+            per_topic=100,
+            workers=4,
+            batch_size=50,
+            progress=lambda topic, stats: progress.append(topic)
+        )
+
+        self.assertEqual(search.call_count, 6)
+        self.assertEqual(stats.pages, 6)
+        self.assertEqual(stats.volumes, 200)
+        self.assertEqual(stats.without_isbn, 6)
+        self.assertEqual(stats.duplicates, 2)
+        self.assertEqual(stats.inserted, 192)
+        self.assertEqual(Book.objects.count(), 192)
+        self.assertEqual(len(progress), 6)
+
+    def test_existing_books_are_skipped(self, search):
+        Book.objects.create(title='Already here', author='Author', isbn='9780000000000')
+
+        stats = GoogleBooksService.bulk_import(['fantasy'], per_topic=10)
+
+        self.assertEqual(stats.existing, 1)
+        self.assertEqual(stats.inserted, 8)
+        self.assertEqual(Book.objects.get(isbn='9780000000000').title, 'Already here')
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_keys_are_normalized(self):
+        self.assertEqual(
+            make_key('volumes', '  Science   Fiction ', max_results=10, start_index=0),
+            make_key('volumes', 'science fiction', start_index=0, max_results=10)
+        )
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('b'), MISSING)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_entries_expire_after_ttl(self):
+        for cache in (LRUCache(), SQLiteCache(self.path)):
+            cache.set('key', 'value', ttl=0.01)
+            time.sleep(0.02)
+            self.assertEqual(cache.get('key', allow_expired=True), 'value')
+            self.assertEqual(cache.get('key'), MISSING)
+            self.assertEqual(cache.stats.expirations, 1)
+
+    def test_disk_hits_only_record_stale_access_times(self):
+        cache = SQLiteCache(self.path, touch_interval=3600)
+        cache.set('key', 'value')
+        db = cache._connection()
+        db.execute("UPDATE cache_entries SET accessed_at = accessed_at - 60")
+        (before,) = db.execute('SELECT accessed_at FROM cache_entries').fetchone()
+
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(db.execute('SELECT accessed_at FROM cache_entries').fetchone(), (before,))
+
+        cache.touch_interval = 30
+        cache.get('key')
+        self.assertGreater(db.execute('SELECT accessed_at FROM cache_entries').fetchone()[0], before)
+
+    def test_disk_tier_checks_its_size_every_few_writes(self):
+        cache = SQLiteCache(self.path, max_entries=2, evict_every=3)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), MISSING)
+
+        cache.set('d', 4)
+        cache.set('e', 5)
+        self.assertEqual(len(cache), 4)
+        cache.set('f', 6)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats.evictions, 4)
+
+    def test_disk_tier_persists_and_promotes_to_memory(self):
+        SQLiteCache(self.path).set('key', [{'id': 1}])
+
+        memory = LRUCache()
+        cache = TieredCache([memory, SQLiteCache(self.path)])
+        self.assertEqual(cache.get('key'), [{'id': 1}])
+        self.assertEqual(memory.get('key'), [{'id': 1}])
+
+    def test_promoted_entries_keep_their_remaining_ttl(self):
+        SQLiteCache(self.path).set('key', [{'id': 1}], ttl=60)
+
+        memory = LRUCache()
+        TieredCache([memory, SQLiteCache(self.path)], ttl=3600).get('key')
+        _, remaining = memory.get_with_ttl('key')
+        self.assertLessEqual(remaining, 60)
+
+    def test_expired_entries_are_not_promoted(self):
+        SQLiteCache(self.path).set('key', [{'id': 1}], ttl=0.01)
+        time.sleep(0.02)
+
+        memory = LRUCache()
+        cache = TieredCache([memory, SQLiteCache(self.path)])
+        self.assertEqual(cache.get('key', allow_expired=True), [{'id': 1}])
+        self.assertEqual(memory.get('key'), MISSING)
+
+    def test_empty_results_use_negative_ttl(self):
+        memory = LRUCache()
+        cache = TieredCache([memory], ttl=3600, negative_ttl=0.01)
+        cache.set('empty', [])
+        cache.set('full', [1])
+        time.sleep(0.02)
+
+        self.assertEqual(cache.lookup('empty'), (False, None))
+        self.assertEqual(cache.lookup('full'), (True, [1]))
+
+class GoogleBooksCachingTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = TieredCache([LRUCache()])
+        GoogleBooksService.set_cache(self.cache)
+        response = mock.Mock()
+        response.json.return_value = {'items': [fake_volume('9780441013593', 'Dune')]}
+        self.session = mock.Mock()
+        self.session.get.return_value = response
+        patcher = mock.patch.object(GoogleBooksService, 'get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        GoogleBooksService.set_cache(None)
+
+    def test_repeated_searches_hit_the_cache(self):
+        first = GoogleBooksService.search_books('Dune')
+        second = GoogleBooksService.search_books('  dune ')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(self.cache.stats.hits, 1)
+        self.assertEqual(self.cache.stats.misses, 1)
+
+    def test_errors_are_not_cached(self):
+        self.session.get.side_effect = requests.ConnectionError('offline')
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(GoogleBooksService.search_books('Dune'), [])
+
+        self.session.get.side_effect = None
+        self.assertEqual(len(GoogleBooksService.search_books('Dune')), 1)
+
+    def test_cache_errors_count_as_a_miss(self):
+        client = mock.Mock()
+        client.get = mock.AsyncMock(return_value=httpx.Response(
+            200, json={'items': [fake_volume('9780441013593', 'Dune')]}, request=httpx.Request('GET', 'http://stub')
+        ))
+        broken = mock.Mock(side_effect=sqlite3.OperationalError('database is locked'))
+        with mock.patch.object(self.cache, 'lookup', broken), mock.patch.object(self.cache, 'set', broken), \
+                mock.patch.object(GoogleBooksService, 'get_async_client', return_value=client):
+            with self.assertLogs(level='WARNING'):
+                self.assertEqual(len(GoogleBooksService.search_books('Dune')), 1)
+            with self.assertLogs(level='WARNING'):
+                self.assertEqual(len(asyncio.run(GoogleBooksService.asearch_books('Dune'))), 1)
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(client.get.call_count, 1)
+
+    @override_settings(GOOGLE_BOOKS_CACHE={'OFFLINE': True})
+    def test_offline_mode_never_touches_the_network(self):
+        self.cache.set(make_key('volumes', 'dune', max_results=10, start_index=0), ['cached'], ttl=-1)
+
+        self.assertEqual(GoogleBooksService.search_books('Dune'), ['cached'])
+        self.assertEqual(GoogleBooksService.search_books('Unknown'), [])
+        self.session.get.assert_not_called()
+
+@override_settings(GOOGLE_BOOKS_CACHE={'ENABLED': False})
+class VolumesStubImportTests(TestCase):
+    def setUp(self):
+        GoogleBooksService.set_cache(None)
+        self.server = make_server(SyntheticCorpus(size=5000, seed=1), port=0)
+        url, self.thread = start_in_thread(self.server)
+        settings_patch = override_settings(GOOGLE_BOOKS_BASE_URL=url)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_stub_pages_like_the_volumes_api(self):
+        first = GoogleBooksService.search_books('fantasy', max_results=40)
+        second = GoogleBooksService.search_books('fantasy', max_results=40, start_index=40)
+
+        self.assertEqual(len(first), 40)
+        self.assertEqual(len(second), 40)
+        self.assertFalse({v['id'] for v in first} & {v['id'] for v in second})
+        self.assertEqual(first, GoogleBooksService.search_books('Fantasy', max_results=40))
+
+    def test_bulk_import_runs_against_the_stub(self):
+        stats = GoogleBooksService.bulk_import(['fantasy', 'history'], per_topic=120, workers=4)
+
+        self.assertEqual(stats.pages, 6)
+        self.assertEqual(stats.volumes, 240)
+        self.assertEqual(Book.objects.count(), stats.inserted)
+        self.assertEqual(stats.inserted + stats.without_isbn + stats.duplicates, 240)
+
+class AsyncBookViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.client = Client()
+        self.client.force_login(self.user)
+        for i in range(12):
+            Book.objects.create(
+                title=f'Book {i:02d}',
+                author='Ursula Le Guin' if i % 2 else 'Terry Pratchett',
+                isbn=f'{9780000000000 + i}',
+                total_copies=1,
+                available_copies=i % 3 and 1
+            )
+
+    def titles(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(book['title'] for book in response.json()['results'])
+            url = response.json()['next']
+        return seen
+
+    def test_list_matches_the_sync_view(self):
+        for query in ('page_size=5', 'page_size=4&ordering=-available_copies', 'author=pratchett&available=1'):
+            self.assertEqual(self.titles(f'/api/async/books/?{query}'), self.titles(f'/api/books/?{query}'))
+
+    def test_detail_and_missing_book(self):
+        book = Book.objects.get(title='Book 03')
+        response = self.client.get(f'/api/async/books/{book.pk}/')
+        self.assertEqual(response.json(), self.client.get(f'/api/books/{book.pk}/').json())
+
+        response = self.client.get('/api/async/books/999999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Book not found'})
+
+    def test_search_uses_the_full_text_index(self):
+        response = self.client.get('/api/async/books/search/', {'q': 'pratch'})
+        self.assertEqual(len(response.json()['results']), 6)
+
+        response = self.client.get('/api/async/books/search/', {'limit': 'many'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_authentication_and_errors_match_drf(self):
+        token = AccessToken()
+        token['user_id'] = self.user.pk
+        response = Client().get('/api/async/books/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+
+        response = Client().get('/api/async/books/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+        response = Client().get('/api/async/books/', headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.status_code, 401)
+
+        self.assertEqual(self.client.post('/api/async/books/').status_code, 405)
+        response = self.client.get('/api/async/books/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'cursor': 'Invalid cursor'})
+
+@override_settings(GOOGLE_BOOKS_CACHE={'ENABLED': False})
+class AsyncGoogleBooksSearchTests(TestCase):
+    def setUp(self):
+        GoogleBooksService.set_cache(None)
+        self.corpus = SyntheticCorpus(size=5000, seed=1)
+        self.server = make_server(self.corpus, port=0)
+        url, self.thread = start_in_thread(self.server)
+        settings_patch = override_settings(GOOGLE_BOOKS_BASE_URL=url)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        self.client = Client()
+        self.client.force_login(User.objects.create(username='reader'))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_async_search_returns_the_same_pages(self):
+        async def search():
+            return await GoogleBooksService.asearch_books('fantasy', max_results=40, start_index=40)
+
+        self.assertEqual(
+            asyncio.run(search()),
+            GoogleBooksService.search_books('fantasy', max_results=40, start_index=40)
+        )
+
+    def test_proxy_marks_books_already_in_the_library(self):
+        _, volumes = self.corpus.search('fantasy', 0, 20)
+        owned = GoogleBooksService.build_book(volumes[0])
+        owned.save()
+
+        response = self.client.get('/api/async/books/google/', {'q': 'fantasy', 'max_results': 20})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        with_isbn = [volume for volume in volumes if GoogleBooksService.build_book(volume)]
+        self.assertEqual([result['google_book_id'] for result in results], [volume['id'] for volume in with_isbn])
+        self.assertEqual([result['isbn'] for result in results if result['in_library']], [owned.isbn])
+
+    def test_proxy_requires_a_query(self):
+        response = self.client.get('/api/async/books/google/', {'q': ' '})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Search query is required'})
+
+class AdminBookRequestQueueTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='password123', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        reader = User.objects.create_user(username='reader', password='password123')
+        book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593')
+        statuses = ['PENDING', 'APPROVED', 'REJECTED']
+        BookRequest.objects.bulk_create(
+            BookRequest(user=reader.profile, book=book, status=statuses[i % 3]) for i in range(30)
+        )
+        # Spread the requests over 30 days, newest first by id.
+        now = timezone.now()
+        for i, request_id in enumerate(BookRequest.objects.order_by('id').values_list('id', flat=True)):
+            BookRequest.objects.filter(id=request_id).update(request_date=now - timedelta(days=30 - i))
+
+    def test_queue_is_paginated_newest_first_with_counts(self):
+        response = self.client.get('/api/admin/book-requests/', {'page_size': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['counts'], {'PENDING': 10, 'APPROVED': 10, 'REJECTED': 10, 'CANCELLED': 0})
+        self.assertEqual(response.data['results'][0]['username'], 'reader')
+        self.assertEqual(response.data['results'][0]['book_title'], 'Dune')
+
+        seen = [item['id'] for item in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            with self.assertNumQueries(2):
+                response = self.client.get(next_url)
+            seen.extend(item['id'] for item in response.data['results'])
+            next_url = response.data['next']
+        self.assertEqual(seen, list(BookRequest.objects.order_by('-request_date').values_list('id', flat=True)))
+
+    def test_status_and_date_filters(self):
+        since = (timezone.now() - timedelta(days=10)).date().isoformat()
+        response = self.client.get('/api/admin/book-requests/', {'status': 'pending,approved', 'since': since})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertTrue(results)
+        self.assertTrue(all(item['status'] in ('PENDING', 'APPROVED') for item in results))
+        self.assertEqual(sum(response.data['counts'].values()), len(results) + response.data['counts']['REJECTED'])
+
+    def test_rejects_invalid_filters(self):
+        self.assertEqual(self.client.get('/api/admin/book-requests/', {'status': 'LOST'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/book-requests/', {'until': 'yesterday'}).status_code, 400)
+
+class BookRequestDecisionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='password123', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        total_copies=2, available_copies=2)
+        self.readers = [User.objects.create(username=f'reader{i}') for i in range(4)]
+        self.requests = [BookRequest.objects.create(user=reader.profile, book=self.book) for reader in self.readers]
+        now = timezone.now()
+        for age, book_request in enumerate(reversed(self.requests)):
+            BookRequest.objects.filter(pk=book_request.pk).update(request_date=now - timedelta(hours=age))
+
+    def decide(self, **data):
+        response = self.client.post('/api/admin/book-requests/decisions/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_copies_go_to_the_oldest_requests(self):
+        ids = [book_request.pk for book_request in self.requests]
+        data = self.decide(approve=list(reversed(ids[:3])), reject=[ids[3]])
+
+        self.assertEqual((data['approved'], data['rejected'], data['skipped']), (2, 1, 1))
+        outcomes = {result['request_id']: result for result in data['results']}
+        self.assertEqual(outcomes[ids[0]]['outcome'], 'approved')
+        self.assertEqual(outcomes[ids[1]]['outcome'], 'approved')
+        self.assertEqual(outcomes[ids[2]]['error'], 'Book not available')
+        self.assertEqual(
+            list(BookRequest.objects.order_by('request_date').values_list('status', flat=True)),
+            ['APPROVED', 'APPROVED', 'PENDING', 'REJECTED']
+        )
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(BookLoan.objects.filter(book=self.book, return_date__isnull=True).count(), 2)
+        self.readers[0].profile.refresh_from_db()
+        self.assertEqual(self.readers[0].profile.active_loan_count, 1)
+        self.assertEqual(LoanService.reconcile_counters(dry_run=True), 0)
+
+    def test_decisions_are_only_applied_to_pending_requests(self):
+        first = self.requests[0].pk
+        self.decide(reject=[first])
+        data = self.decide(approve=[first, 999999])
+
+        self.assertEqual([result['error'] for result in data['results']],
+                         ['Request is not pending', 'Request not found'])
+        self.assertFalse(BookLoan.objects.exists())
+
+    def test_decision_queries_do_not_grow_with_batch_size(self):
+        extra = [User.objects.create(username=f'extra{i}') for i in range(20)]
+        books = [Book.objects.create(title=f'Book {i}', author='Author', isbn=f'{9781000000000 + i}')
+                 for i in range(20)]
+        small = [BookRequest.objects.create(user=extra[i].profile, book=books[i]).pk for i in range(2)]
+        large = [BookRequest.objects.create(user=extra[i].profile, book=books[i]).pk for i in range(2, 20)]
+
+        with CaptureQueriesContext(connection) as small_queries:
+            self.decide(approve=small)
+        with CaptureQueriesContext(connection) as large_queries:
+            self.decide(approve=large)
+        self.assertEqual(len(small_queries), len(large_queries))
+
+    def test_rejects_malformed_payloads(self):
+        response = self.client.post('/api/admin/book-requests/decisions/', {'approve': 'all'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+class ReservationQueueTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        total_copies=1, available_copies=1)
+        self.holder = User.objects.create(username='holder')
+        self.loan = LoanService.checkout(BookLoan(user=self.holder.profile, book=self.book))
+        self.waiting = [User.objects.create(username=f'waiting{i}') for i in range(3)]
+        self.requests = [BookRequest.objects.create(user=user.profile, book=self.book) for user in self.waiting]
+
+    def return_loan(self):
+        self.client.force_authenticate(self.holder)
+        response = self.client.post(f'/loans/{self.loan.pk}/return_book/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_return_hands_the_copy_to_the_oldest_request(self):
+        response = self.return_loan()
+        self.assertEqual(response.data['book']['available_copies'], 0)
+
+        statuses = [BookRequest.objects.get(pk=request.pk).status for request in self.requests]
+        self.assertEqual(statuses, ['APPROVED', 'PENDING', 'PENDING'])
+        self.assertTrue(BookLoan.objects.filter(user=self.waiting[0].profile, book=self.book,
+                                                return_date__isnull=True).exists())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_return_without_requests_reports_the_copy_back(self):
+        BookRequest.objects.all().delete()
+        response = self.return_loan()
+        self.assertEqual(response.data['book']['available_copies'], 1)
+
+    def test_ineligible_requesters_keep_their_place(self):
+        UserProfile.objects.filter(user=self.waiting[0]).update(active_loan_count=UserProfile.MAX_ALLOWED_LOANS)
+        self.return_loan()
+
+        statuses = [BookRequest.objects.get(pk=request.pk).status for request in self.requests]
+        self.assertEqual(statuses, ['PENDING', 'APPROVED', 'PENDING'])
+
+    def test_queue_position_and_estimated_wait(self):
+        self.client.force_authenticate(self.waiting[2])
+        response = self.client.get(f'/api/book-requests/{self.requests[2].pk}/queue/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['queue_position'], 3)
+        # The only copy comes back on its due date and goes round twice more.
+        self.assertEqual(response.data['estimated_available_at'], self.loan.due_date + 2 * LoanService.LOAN_PERIOD)
+
+        response = self.client.get('/api/book-requests/')
+        self.assertEqual(response.data[0]['queue_position'], 3)
+
+        self.client.force_authenticate(self.waiting[0])
+        response = self.client.get(f'/api/book-requests/{self.requests[2].pk}/queue/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_allocation_stops_when_no_copy_is_left(self):
+        unavailable = ValidationError('No copies left', code='unavailable')
+        with mock.patch.object(LoanService, 'checkout', side_effect=unavailable) as checkout:
+            self.assertEqual(BookRequestService.allocate(self.book.pk), [])
+
+        self.assertEqual(checkout.call_count, 1)
+        statuses = [BookRequest.objects.get(pk=request.pk).status for request in self.requests]
+        self.assertEqual(statuses, ['PENDING', 'PENDING', 'PENDING'])
+
+    def test_approving_without_a_copy_keeps_the_request_queued(self):
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.put(f'/api/admin/book-requests/{self.requests[1].pk}/', {'status': 'APPROVED'},
+                                   format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'PENDING')
+        self.assertEqual(response.data['queue_position'], 2)
+
+class ReservationQueueConcurrencyTests(TransactionTestCase):
+    def test_concurrent_returns_serve_each_request_once(self):
+        copies = 4
+        book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                   total_copies=copies, available_copies=copies)
+        loans = [
+            LoanService.checkout(BookLoan(user=User.objects.create(username=f'holder{i}').profile, book=book))
+            for i in range(copies)
+        ]
+        for i in range(6):
+            BookRequest.objects.create(user=User.objects.create(username=f'waiting{i}').profile, book=book)
+
+        errors = []
+
+        def return_and_allocate(loan):
+            try:
+                for _ in range(200):
+                    try:
+                        with transaction.atomic():
+                            LoanService.return_loan(loan)
+                            BookRequestService.allocate(book.pk)
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting.
+                        time.sleep(0.005)
+                errors.append('database stayed locked')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=return_and_allocate, args=(loan,)) for loan in loans]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 0)
+        self.assertEqual(BookRequest.objects.filter(status='APPROVED').count(), copies)
+        self.assertEqual(BookLoan.objects.filter(book=book, return_date__isnull=True).count(), copies)
@@ -1,11 +1,24 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from .models import Book, BookRequest
-from users.models import BookLoan
 from .serializers import BookSerializer, BookDetailSerializer, BookCreateSerializer, BookRequestSerializer
+from .pagination import BookPagination, BookRequestPagination
+from .services.google_books import GoogleBooksService
+from .services.requests import BookRequestService
+from .services.search import get_search_backend
+from django.db import transaction
+from django.db.models import Count, Q
 from django.utils import timezone
+from library_project.async_api import AsyncAPIView
+from library_project.db_routers import replica_reads
+from library_project.filters import filter_by_date_range
+from library_project.http_cache import conditional_response
+from users.authentication import profile_id_for
+from users.services.stats import CirculationStats, Event
 
 BOOK_NOT_FOUND_ERROR = 'Book not found'
 
@@ -13,9 +26,35 @@ class BookListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        books = Book.objects.all()
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
+        with replica_reads(request):
+            return conditional_response(request, ['books'], lambda: self.render(request))
+
+    def render(self, request):
+        books = self.filter_queryset(Book.objects.all(), request.query_params)
+        paginator = BookPagination()
+        page = paginator.paginate_queryset(books, request, view=self)
+        serializer = BookSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def filter_queryset(self, queryset, params):
+        # Words match as prefixes through the full-text index; an ISBN
+        # prefix is a range on the unique index.
+        search = get_search_backend()
+        query = params.get('q', '').strip()
+        if query:
+            queryset = queryset.filter(
+                search.matching(query) |
+                Q(isbn__gte=query, isbn__lt=query + '\uffff')
+            )
+
+        author = params.get('author', '').strip()
+        if author:
+            queryset = queryset.filter(search.matching(author, field='author'))
+
+        if params.get('available', '').lower() in ('1', 'true', 'yes'):
+            queryset = queryset.filter(available_copies__gt=0)
+
+        return queryset
 
     def post(self, request):
         if not request.user.is_staff:
@@ -30,10 +69,32 @@ class BookListView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class BookSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_limit = 50
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+        except ValueError:
+            return Response(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        books = get_search_backend().search(query, limit=max(1, limit))
+        serializer = BookSerializer(books, many=True)
+        return Response({'results': serializer.data})
+
 class BookDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
+        with replica_reads(request):
+            return conditional_response(request, [f'book:{pk}'], lambda: self.render(pk))
+
+    def render(self, pk):
         try:
             book = Book.objects.get(pk=pk)
             serializer = BookDetailSerializer(book)
@@ -93,7 +154,7 @@ class BookRequestView(APIView):
             book = Book.objects.get(id=book_id)
             
             existing_request = BookRequest.objects.filter(
-                user=request.user.profile,
+                user_id=profile_id_for(request.user),
                 book=book,
                 status='PENDING'
             ).exists()
@@ -104,11 +165,15 @@ class BookRequestView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            book_request = BookRequest.objects.create(
-                user=request.user.profile,
-                book=book,
-                notes=notes
-            )
+            with transaction.atomic():
+                book_request = BookRequest.objects.create(
+                    user=request.user.profile,
+                    book=book,
+                    notes=notes
+                )
+                CirculationStats.record([
+                    Event('requests', book_request.request_date, book.pk, book_request.user_id)
+                ])
 
             serializer = BookRequestSerializer(book_request)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -121,10 +186,50 @@ class BookRequestView(APIView):
 
     def get(self, request):
         """Get user's book requests"""
-        requests = BookRequest.objects.filter(user=request.user.profile)
+        requests = BookRequest.objects.filter(
+            user_id=profile_id_for(request.user)
+        ).select_related('user__user', 'book').annotate(
+            queue_position=BookRequestService.queue_position_expression()
+        )
         serializer = BookRequestSerializer(requests, many=True)
         return Response(serializer.data)
 
+class BookRequestQueueView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, request_id):
+        """Get a pending request's place in its book's queue and estimated wait"""
+        requests = BookRequest.objects.select_related('book').annotate(
+            queue_position=BookRequestService.queue_position_expression()
+        )
+        if not request.user.is_staff:
+            requests = requests.filter(user_id=profile_id_for(request.user))
+
+        try:
+            book_request = requests.get(id=request_id)
+        except BookRequest.DoesNotExist:
+            return Response(
+                {'error': 'Request not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        position = book_request.queue_position
+        available_at = None
+        if position is not None:
+            available_at = BookRequestService.estimate_available_at(book_request.book, position)
+
+        return Response({
+            'request_id': book_request.id,
+            'book_id': book_request.book_id,
+            'status': book_request.status,
+            'queue_position': position,
+            'estimated_available_at': available_at,
+            'estimated_wait_days': (
+                None if available_at is None
+                else max(0, (available_at - timezone.now()).days)
+            )
+        })
+
 class AdminBookRequestView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -135,9 +240,32 @@ class AdminBookRequestView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        requests = BookRequest.objects.all()
-        serializer = BookRequestSerializer(requests, many=True)
-        return Response(serializer.data)
+        try:
+            requests = filter_by_date_range(BookRequest.objects.all(), request.query_params, 'request_date')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Counts ignore the status filter so every dashboard tab can show
+        # its total, and come from one grouped query.
+        counts = dict.fromkeys((choice for choice, _ in BookRequest.STATUS_CHOICES), 0)
+        counts.update(
+            requests.order_by().values_list('status').annotate(total=Count('id'))
+        )
+
+        statuses = [value for value in request.query_params.get('status', '').upper().split(',') if value]
+        if any(value not in counts for value in statuses):
+            return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
+        if statuses:
+            requests = requests.filter(status__in=statuses)
+
+        requests = requests.select_related('user__user', 'book').only(
+            'request_date', 'status', 'notes', 'response_date', 'user__user__username', 'book__title'
+        )
+        paginator = BookRequestPagination()
+        page = paginator.paginate_queryset(requests, request, view=self)
+        response = paginator.get_paginated_response(BookRequestSerializer(page, many=True).data)
+        response.data['counts'] = counts
+        return response
 
     def put(self, request, request_id):
         if not request.user.is_staff:
@@ -146,33 +274,155 @@ class AdminBookRequestView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        try:
-            book_request = BookRequest.objects.get(id=request_id)
-            new_status = request.data.get('status')
-            
-            if new_status not in ['APPROVED', 'REJECTED']:
-                return Response(
-                    {'error': 'Invalid status'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        new_status = request.data.get('status')
+        if new_status not in ['APPROVED', 'REJECTED']:
+            return Response(
+                {'error': 'Invalid status'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            book_request.status = new_status
-            book_request.response_date = timezone.now()
-            book_request.save()
+        if new_status == 'APPROVED':
+            decision, = BookRequestService.decide(approve=[request_id])
+        else:
+            decision, = BookRequestService.decide(reject=[request_id])
 
-            if new_status == 'APPROVED' and book_request.book.available_copies > 0:
-                due_date = timezone.now() + timezone.timedelta(days=14)
-                BookLoan.objects.create(
-                    user=book_request.user,
-                    book=book_request.book,
-                    due_date=due_date
-                )
+        if decision.error == 'Request not found':
+            return Response(
+                {'error': decision.error},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if decision.outcome == 'skipped' and decision.error != 'Book not available':
+            return Response(
+                {'error': decision.error},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            serializer = BookRequestSerializer(book_request)
-            return Response(serializer.data)
+        # Without a free copy the request stays in the book's queue and is
+        # served by the allocator when a copy is returned.
+        book_request = BookRequest.objects.select_related('user__user', 'book').annotate(
+            queue_position=BookRequestService.queue_position_expression()
+        ).get(id=request_id)
+        serializer = BookRequestSerializer(book_request)
+        if decision.outcome == 'skipped':
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        return Response(serializer.data)
 
-        except BookRequest.DoesNotExist:
+class AdminBookRequestDecisionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """Approve and reject many pending requests at once"""
+        if not request.user.is_staff:
             return Response(
-                {'error': 'Request not found'},
+                {'error': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        approve = request.data.get('approve', [])
+        reject = request.data.get('reject', [])
+        if not isinstance(approve, list) or not isinstance(reject, list) or not all(
+            isinstance(request_id, int) for request_id in approve + reject
+        ):
+            return Response(
+                {'error': 'approve and reject must be lists of request ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(approve) + len(reject) > BookRequestService.MAX_DECISIONS:
+            return Response(
+                {'error': f'At most {BookRequestService.MAX_DECISIONS} decisions per call'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        decisions = BookRequestService.decide(approve=approve, reject=reject)
+        totals = {'approved': 0, 'rejected': 0, 'skipped': 0}
+        for decision in decisions:
+            totals[decision.outcome] += 1
+        return Response({
+            **totals,
+            'results': [decision.as_dict() for decision in decisions]
+        })
+
+class AsyncBookListView(AsyncAPIView):
+    async def get(self, request):
+        books = BookListView().filter_queryset(Book.objects.all(), request.query_params)
+        paginator = BookPagination()
+        page = paginator.set_page([book async for book in paginator.page_queryset(books, request)])
+        return {
+            'next': paginator.get_next_link(),
+            'results': BookSerializer(page, many=True).data
+        }
+
+class AsyncBookSearchView(AsyncAPIView):
+    async def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), BookSearchView.max_limit)
+        except ValueError:
+            return JsonResponse(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Full-text search uses raw cursors, which have no async API.
+        books = await sync_to_async(get_search_backend().search)(query, limit=max(1, limit))
+        return {'results': BookSerializer(books, many=True).data}
+
+class AsyncBookDetailView(AsyncAPIView):
+    async def get(self, request, pk):
+        try:
+            book = await Book.objects.aget(pk=pk)
+        except Book.DoesNotExist:
+            return JsonResponse(
+                {'error': BOOK_NOT_FOUND_ERROR},
                 status=status.HTTP_404_NOT_FOUND
             )
+        return BookDetailSerializer(book).data
+
+class AsyncGoogleBookSearchView(AsyncAPIView):
+    """
+    Search Google Books without holding a worker for the round-trip
+
+    Only volumes with an ISBN are returned, since those are the ones that
+    can be imported; ``in_library`` tells which are in the catalog already.
+    """
+
+    max_results_limit = 40
+
+    async def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return JsonResponse(
+                {'error': 'Search query is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            max_results = int(request.query_params.get('max_results', 10))
+            start_index = int(request.query_params.get('start_index', 0))
+        except ValueError:
+            return JsonResponse(
+                {'error': 'max_results and start_index must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_results = max(1, min(max_results, self.max_results_limit))
+
+        volumes = await GoogleBooksService.asearch_books(query, max_results, max(0, start_index))
+        books = [
+            book for book in map(GoogleBooksService.build_book, volumes)
+            if book is not None
+        ]
+        in_library = {
+            isbn async for isbn in Book.objects.filter(
+                isbn__in=[book.isbn for book in books]
+            ).values_list('isbn', flat=True)
+        }
+        return {'results': [
+            {
+                'google_book_id': book.google_book_id,
+                'title': book.title,
+                'author': book.author,
+                'isbn': book.isbn,
+                'description': book.description,
+                'in_library': book.isbn in in_library,
+            }
+            for book in books
+        ]}
@@ -0,0 +1,48 @@
+"""
+Base view for the async read endpoints
+
+DRF views are synchronous, so under ASGI each one still occupies a thread
+for its whole duration. Views built on AsyncAPIView run on the event loop
+instead: they await the async ORM and the async Google Books client, and a
+single worker can keep many slow requests in flight at once. They are
+read-only and authenticate like the DRF views, bearer token first and
+session second.
+"""
+
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.request import Request
+
+from users.authentication import authenticate_async
+
+class AsyncAPIView(View):
+    """
+    Async view whose handlers receive a DRF Request with ``query_params``
+    and may return a dict or list to be sent as JSON
+
+    APIExceptions raised by a handler, such as a pagination
+    ValidationError, are answered with their detail and status code as
+    they would be by DRF.
+    """
+
+    http_method_names = ['get', 'options']
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            user = await authenticate_async(request)
+            if user is None:
+                raise NotAuthenticated()
+            request = Request(request)
+            request.user = user
+            self.request = request
+            response = await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+            response = JsonResponse(detail, status=exc.status_code, safe=False)
+            if isinstance(exc, NotAuthenticated):
+                response['WWW-Authenticate'] = 'Bearer realm="api"'
+
+        if not isinstance(response, HttpResponse):
+            response = JsonResponse(response, safe=False)
+        return response
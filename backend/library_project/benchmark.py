@@ -0,0 +1,474 @@
+"""
+Query-count, latency and payload-size benchmark for the HTTP API
+
+Seeds a synthetic library, calls every API route through the Django test
+client and compares the measurements against per-endpoint budgets. Used
+by the test suite and by the ``benchmark_api`` management command, and
+never touches the network.
+"""
+
+import math
+import statistics
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+
+from books.models import Book, BookRequest
+from books.services.cache import LRUCache, TieredCache, make_key
+from books.services.google_books import GoogleBooksService
+from books.services.volumes_stub import SyntheticCorpus
+from users.authentication import LibraryTokenObtainPairSerializer
+from users.models import BookLoan, UserProfile
+from users.services.loans import LoanService
+from users.services.stats import CirculationStats
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+# Budgets are per call: queries is the maximum for any single call, p99_ms
+# is the 99th percentile latency and bytes is the largest response body.
+# Names ending in @jwt repeat an endpoint with a bearer token instead of a
+# session, to show the cost of authentication itself.
+DEFAULT_BUDGET = {'queries': 10, 'p99_ms': 250, 'bytes': 64 * 1024}
+
+DEFAULT_BUDGETS = {
+    'token_obtain_pair:post': {'queries': 3, 'p99_ms': 1500},
+    'token_refresh:post': {'queries': 9},
+    'token_blacklist:post': {'queries': 7},
+    'login:post': {'queries': 12, 'p99_ms': 1500},
+    'logout:post': {'queries': 3},
+    'register:post': {'queries': 14, 'p99_ms': 2500},
+    'current-user:get': {'queries': 6},
+    'current-user:get@jwt': {'queries': 3},
+    'user-list:get': {'queries': 2, 'bytes': 4 * 1024},
+    'user-list:get@search': {'queries': 2, 'bytes': 8 * 1024},
+    'loan-history:get': {'queries': 3},
+    'loan-history:get@archived': {'queries': 3},
+    'book-list:get': {'queries': 3},
+    'book-list:get@jwt': {'queries': 1},
+    'book-list:post': {'queries': 4},
+    'book-search:get': {'queries': 3},
+    'book-detail:get': {'queries': 4},
+    'book-detail:put': {'queries': 5},
+    'book-detail:delete': {'queries': 9},
+    'book-requests:get': {'queries': 3},
+    'book-requests:get@jwt': {'queries': 1},
+    'book-requests:post': {'queries': 9},
+    'book-request-queue:get': {'queries': 3},
+    'async-book-list:get': {'queries': 2},
+    'async-book-list:get@jwt': {'queries': 1},
+    'async-book-search:get': {'queries': 3},
+    'async-book-detail:get': {'queries': 2},
+    'async-google-search:get': {'queries': 2},
+    'async-my-loans:get': {'queries': 3},
+    'admin-book-requests:get': {'queries': 3},
+    'admin-book-request-detail:put': {'queries': 15},
+    'admin-book-request-decisions:post': {'queries': 15},
+    'admin-cache-metrics:get': {'queries': 1},
+    'admin-export:get': {'queries': 2, 'bytes': 1024 * 1024},
+    'stats:get': {'queries': 4, 'bytes': 64 * 1024},
+    'router-user-list:get': {'queries': 5, 'p99_ms': 1500, 'bytes': 512 * 1024},
+    'user-detail:get': {'queries': 5},
+    'user-loans:get': {'queries': 5},
+    'user-active-loans:get': {'queries': 5},
+    'loan-list:get': {'queries': 3, 'p99_ms': 1000, 'bytes': 512 * 1024},
+    'loan-list:get@jwt': {'queries': 1, 'p99_ms': 1000, 'bytes': 512 * 1024},
+    'loan-list:post': {'queries': 11},
+    'loan-detail:get': {'queries': 3},
+    'loan-return-book:post': {'queries': 14},
+    'loan-batch-checkout:post': {'queries': 10},
+    'loan-batch-return:post': {'queries': 13},
+}
+
+@dataclass
+class SyntheticLibrary:
+    admin: User
+    members: List[User]
+    books: List[Book]
+    loans: List[BookLoan]
+    requests: List[BookRequest]
+    password_hash: str
+    sequence: int = 0
+
+    def next_id(self) -> int:
+        self.sequence += 1
+        return self.sequence
+
+    def member(self, i: int) -> User:
+        return self.members[i % len(self.members)]
+
+    def book(self, i: int) -> Book:
+        return self.books[i % len(self.books)]
+
+    def fresh_book(self, copies: int = 3) -> Book:
+        n = self.next_id()
+        return Book.objects.create(
+            title=f'Benchmark fresh book {n}',
+            author='Benchmark Author',
+            isbn=f'1{n:012d}',
+            total_copies=copies,
+            available_copies=copies
+        )
+
+    def fresh_member(self) -> User:
+        n = self.next_id()
+        return User.objects.create(username=f'bench-fresh-{n}', password=self.password_hash)
+
+@dataclass
+class Call:
+    method: str
+    path: str
+    user: Optional[User] = None
+    data: Optional[dict] = None
+    # 'session' logs the client in; 'jwt' sends a bearer access token.
+    auth: str = 'session'
+
+@dataclass
+class Endpoint:
+    name: str
+    prepare: Callable[[SyntheticLibrary, int], Call]
+
+@dataclass
+class Measurement:
+    name: str
+    path: str
+    calls: int = 0
+    queries: List[int] = field(default_factory=list)
+    latencies_ms: List[float] = field(default_factory=list)
+    sizes: List[int] = field(default_factory=list)
+    statuses: List[int] = field(default_factory=list)
+
+    @property
+    def max_queries(self) -> int:
+        return max(self.queries)
+
+    @property
+    def p50_ms(self) -> float:
+        return statistics.median(self.latencies_ms)
+
+    @property
+    def p99_ms(self) -> float:
+        ordered = sorted(self.latencies_ms)
+        return ordered[max(0, math.ceil(0.99 * len(ordered)) - 1)]
+
+    @property
+    def max_bytes(self) -> int:
+        return max(self.sizes)
+
+def seed_library(books: int = 200, members: int = 50, loans: int = 100, requests: int = 50) -> SyntheticLibrary:
+    """
+    Bulk-insert a synthetic library with every member sharing one password hash
+    """
+    password = make_password(BENCHMARK_PASSWORD)
+    admin = User.objects.create(username='bench-admin', password=password, is_staff=True)
+
+    User.objects.bulk_create(
+        User(username=f'bench-member-{i}', email=f'member{i}@example.com', password=password)
+        for i in range(members)
+    )
+    member_users = list(User.objects.filter(username__startswith='bench-member-').order_by('id'))
+    UserProfile.objects.bulk_create(
+        UserProfile(user=user, full_name=f'Member {i}') for i, user in enumerate(member_users)
+    )
+
+    Book.objects.bulk_create(
+        Book(
+            title=f'Synthetic Book {i:06d}',
+            author=f'Author {i % 97}',
+            isbn=f'{i:013d}',
+            description=f'Synthetic description for book number {i}',
+            total_copies=3,
+            available_copies=3
+        )
+        for i in range(books)
+    )
+    book_list = list(Book.objects.filter(isbn__startswith='000').order_by('id')[:books])
+
+    profiles = list(UserProfile.objects.filter(user__in=member_users).order_by('id'))
+    now = timezone.now()
+    pairs = set()
+    loans_per_member = dict.fromkeys((profile.pk for profile in profiles), 0)
+    for i in range(loans):
+        profile = profiles[i % len(profiles)]
+        book = book_list[(i * 7 + i // len(profiles)) % len(book_list)]
+        if (profile.pk, book.pk) not in pairs and loans_per_member[profile.pk] < 3:
+            pairs.add((profile.pk, book.pk))
+            loans_per_member[profile.pk] += 1
+
+    BookLoan.objects.bulk_create(
+        BookLoan(
+            user_id=profile_id,
+            book_id=book_id,
+            due_date=now + timedelta(days=14 - i % 20),
+            return_date=now if i % 3 == 0 else None,
+            status='RETURNED' if i % 3 == 0 else 'ACTIVE'
+        )
+        for i, (profile_id, book_id) in enumerate(sorted(pairs))
+    )
+
+    books_by_id = {book.pk: book for book in book_list}
+    for loan in BookLoan.objects.filter(book__in=book_list, return_date__isnull=True).only('book_id'):
+        books_by_id[loan.book_id].available_copies -= 1
+    Book.objects.bulk_update(book_list, ['available_copies'], batch_size=500)
+    LoanService.reconcile_counters([profile.pk for profile in profiles])
+
+    BookRequest.objects.bulk_create(
+        BookRequest(
+            user=profiles[i % len(profiles)],
+            book=book_list[(i * 11) % len(book_list)],
+            status='PENDING' if i % 2 else 'REJECTED'
+        )
+        for i in range(requests)
+    )
+    CirculationStats.rebuild()
+
+    return SyntheticLibrary(
+        admin=admin,
+        members=member_users,
+        books=book_list,
+        loans=list(BookLoan.objects.order_by('id')),
+        requests=list(BookRequest.objects.order_by('id')),
+        password_hash=password
+    )
+
+def _book_payload(library, i):
+    n = library.next_id()
+    return {
+        'title': f'Benchmark created book {n}',
+        'author': 'Benchmark Author',
+        'isbn': f'2{n:012d}',
+        'description': '',
+        'total_copies': 3
+    }
+
+def _register_call(library, i):
+    n = library.next_id()
+    return Call('post', '/api/auth/register/', None, {
+        'username': f'bench-reg-{n}',
+        'email': f'reg{n}@example.com',
+        'password': BENCHMARK_PASSWORD,
+        'confirm_password': BENCHMARK_PASSWORD
+    })
+
+def _pending_request(library, i):
+    book = library.fresh_book()
+    return BookRequest.objects.create(user=library.member(i).profile, book=book)
+
+def _queued_request(library, i):
+    # A book with every copy out on loan and a few people waiting.
+    book = library.fresh_book(copies=2)
+    for _ in range(2):
+        LoanService.checkout(BookLoan(user=library.fresh_member().profile, book=book))
+    waiting = [BookRequest(user=library.fresh_member().profile, book=book) for _ in range(3)]
+    return BookRequest.objects.bulk_create(waiting)[-1]
+
+def _decisions_call(library, i):
+    book = library.fresh_book(copies=5)
+    members = [library.fresh_member() for _ in range(10)]
+    pending = BookRequest.objects.bulk_create(
+        BookRequest(user=member.profile, book=book) for member in members
+    )
+    ids = [request.pk for request in pending]
+    return Call('post', '/api/admin/book-requests/decisions/', library.admin,
+                {'approve': ids[:8], 'reject': ids[8:]})
+
+def _refresh_token(library, i):
+    return str(LibraryTokenObtainPairSerializer.get_token(library.member(i)))
+
+def _return_call(library, i):
+    member = library.fresh_member()
+    loan = LoanService.checkout(BookLoan(user=member.profile, book=library.fresh_book()))
+    return Call('post', f'/loans/{loan.pk}/return_book/', member)
+
+def _batch_checkout_call(library, i):
+    members = [library.fresh_member() for _ in range(10)]
+    books = [library.fresh_book(copies=5) for _ in range(2)]
+    return Call('post', '/loans/batch_checkout/', library.admin, {'loans': [
+        {'user_id': member.profile.pk, 'book_id': book.pk} for member in members for book in books
+    ]})
+
+def _batch_return_call(library, i):
+    members = [library.fresh_member() for _ in range(10)]
+    books = [library.fresh_book(copies=10) for _ in range(2)]
+    loans = [BookLoan(user_id=member.profile.pk, book_id=book.pk) for member in members for book in books]
+    LoanService.checkout_many(loans)
+    return Call('post', '/loans/batch_return/', library.admin, {'loan_ids': [loan.pk for loan in loans]})
+
+def _google_search_call(library, i):
+    # Served from a pre-seeded cache entry so the benchmark stays offline.
+    query = f'benchmark topic {i % 5}'
+    cache = GoogleBooksService.get_cache()
+    if cache is None:
+        cache = TieredCache([LRUCache()])
+        GoogleBooksService.set_cache(cache)
+    _, volumes = SyntheticCorpus(size=1000).search(query, 0, 10)
+    cache.set(make_key('volumes', query, max_results=10, start_index=0), volumes, ttl=300)
+    return Call('get', f'/api/async/books/google/?q={query.replace(" ", "+")}', library.member(i))
+
+ENDPOINTS = [
+    Endpoint('token_obtain_pair:post', lambda lib, i: Call(
+        'post', '/api/token/', None,
+        {'username': lib.member(i).username, 'password': BENCHMARK_PASSWORD})),
+    Endpoint('token_refresh:post', lambda lib, i: Call(
+        'post', '/api/token/refresh/', None, {'refresh': _refresh_token(lib, i)})),
+    Endpoint('token_blacklist:post', lambda lib, i: Call(
+        'post', '/api/token/blacklist/', None, {'refresh': _refresh_token(lib, i)})),
+    Endpoint('login:post', lambda lib, i: Call(
+        'post', '/api/auth/login/', None,
+        {'username': lib.member(i).username, 'password': BENCHMARK_PASSWORD})),
+    Endpoint('logout:post', lambda lib, i: Call('post', '/api/auth/logout/', lib.fresh_member())),
+    Endpoint('register:post', _register_call),
+    Endpoint('current-user:get', lambda lib, i: Call('get', '/api/users/me/', lib.member(i))),
+    Endpoint('current-user:get@jwt', lambda lib, i: Call('get', '/api/users/me/', lib.member(i), auth='jwt')),
+    Endpoint('user-list:get', lambda lib, i: Call('get', '/api/users/', lib.member(i))),
+    Endpoint('user-list:get@search', lambda lib, i: Call('get', '/api/users/?q=bench-member-1', lib.admin)),
+    Endpoint('loan-history:get', lambda lib, i: Call('get', '/api/users/me/loans/', lib.member(i))),
+    Endpoint('loan-history:get@archived', lambda lib, i: Call(
+        'get', '/api/users/me/loans/?archived=true&since=2020-01-01', lib.member(i))),
+    Endpoint('book-list:get', lambda lib, i: Call('get', '/api/books/?ordering=title', lib.member(i))),
+    Endpoint('book-list:get@jwt', lambda lib, i: Call(
+        'get', '/api/books/?ordering=title', lib.member(i), auth='jwt')),
+    Endpoint('book-list:post', lambda lib, i: Call('post', '/api/books/', lib.admin, _book_payload(lib, i))),
+    Endpoint('book-search:get', lambda lib, i: Call('get', '/api/books/search/?q=synth', lib.member(i))),
+    Endpoint('book-detail:get', lambda lib, i: Call('get', f'/api/books/{lib.book(i).pk}/', lib.member(i))),
+    Endpoint('book-detail:put', lambda lib, i: Call(
+        'put', f'/api/books/{lib.fresh_book().pk}/', lib.admin, _book_payload(lib, i))),
+    Endpoint('book-detail:delete', lambda lib, i: Call(
+        'delete', f'/api/books/{lib.fresh_book().pk}/', lib.admin)),
+    Endpoint('book-requests:get', lambda lib, i: Call('get', '/api/book-requests/', lib.member(i))),
+    Endpoint('book-requests:get@jwt', lambda lib, i: Call('get', '/api/book-requests/', lib.member(i), auth='jwt')),
+    Endpoint('book-requests:post', lambda lib, i: Call(
+        'post', '/api/book-requests/', lib.member(i), {'book_id': lib.fresh_book().pk})),
+    Endpoint('book-request-queue:get', lambda lib, i: Call(
+        'get', f'/api/book-requests/{_queued_request(lib, i).pk}/queue/', lib.admin)),
+    Endpoint('async-book-list:get', lambda lib, i: Call('get', '/api/async/books/?ordering=title', lib.member(i))),
+    Endpoint('async-book-list:get@jwt', lambda lib, i: Call(
+        'get', '/api/async/books/?ordering=title', lib.member(i), auth='jwt')),
+    Endpoint('async-book-search:get', lambda lib, i: Call('get', '/api/async/books/search/?q=synth', lib.member(i))),
+    Endpoint('async-book-detail:get', lambda lib, i: Call('get', f'/api/async/books/{lib.book(i).pk}/', lib.member(i))),
+    Endpoint('async-google-search:get', _google_search_call),
+    Endpoint('async-my-loans:get', lambda lib, i: Call('get', '/api/async/loans/', lib.member(i))),
+    Endpoint('admin-book-requests:get', lambda lib, i: Call('get', '/api/admin/book-requests/', lib.admin)),
+    Endpoint('admin-book-request-detail:put', lambda lib, i: Call(
+        'put', f'/api/admin/book-requests/{_pending_request(lib, i).pk}/', lib.admin,
+        {'status': 'APPROVED'})),
+    Endpoint('admin-book-request-decisions:post', _decisions_call),
+    Endpoint('admin-cache-metrics:get', lambda lib, i: Call('get', '/api/admin/cache/', lib.admin)),
+    Endpoint('admin-export:get', lambda lib, i: Call(
+        'get', f"/api/admin/exports/{['books', 'loans', 'requests'][i % 3]}.{['csv', 'ndjson'][i % 2]}", lib.admin)),
+    Endpoint('stats:get', lambda lib, i: Call('get', f'/api/stats/?days={[7, 30, 365][i % 3]}', lib.admin)),
+    Endpoint('router-user-list:get', lambda lib, i: Call('get', '/users/', lib.admin)),
+    Endpoint('user-detail:get', lambda lib, i: Call('get', f'/users/{lib.member(i).pk}/', lib.admin)),
+    Endpoint('user-loans:get', lambda lib, i: Call('get', f'/users/{lib.member(i).pk}/loans/', lib.admin)),
+    Endpoint('user-active-loans:get', lambda lib, i: Call(
+        'get', f'/users/{lib.member(i).pk}/active_loans/', lib.admin)),
+    Endpoint('loan-list:get', lambda lib, i: Call('get', '/loans/', lib.admin)),
+    Endpoint('loan-list:get@jwt', lambda lib, i: Call('get', '/loans/', lib.admin, auth='jwt')),
+    Endpoint('loan-list:post', lambda lib, i: Call(
+        'post', '/loans/', lib.fresh_member(), {'book_id': lib.fresh_book().pk})),
+    Endpoint('loan-detail:get', lambda lib, i: Call('get', f'/loans/{lib.loans[i % len(lib.loans)].pk}/', lib.admin)),
+    Endpoint('loan-return-book:post', _return_call),
+    Endpoint('loan-batch-checkout:post', _batch_checkout_call),
+    Endpoint('loan-batch-return:post', _batch_return_call),
+]
+
+def api_routes() -> List[str]:
+    """
+    Every routed API pattern, excluding the admin site, the browsable API
+    root and DRF's format-suffix duplicates
+    """
+    def walk(patterns, prefix=''):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                if pattern.namespace == 'admin':
+                    continue
+                yield from walk(pattern.url_patterns, prefix + str(pattern.pattern))
+            elif pattern.name != 'api-root' and 'format>' not in str(pattern.pattern):
+                yield prefix + str(pattern.pattern)
+
+    return list(walk(get_resolver().url_patterns))
+
+def get_budgets() -> Dict[str, dict]:
+    overrides = getattr(settings, 'API_PERFORMANCE_BUDGETS', {})
+    return {
+        endpoint.name: {**DEFAULT_BUDGET, **DEFAULT_BUDGETS.get(endpoint.name, {}), **overrides.get(endpoint.name, {})}
+        for endpoint in ENDPOINTS
+    }
+
+def run_benchmark(library: SyntheticLibrary, iterations: int = 10,
+                  endpoints: Optional[List[Endpoint]] = None) -> List[Measurement]:
+    clients = {}
+
+    def client_for(user, auth):
+        key = (user.pk if user else None, auth)
+        if key not in clients:
+            if user and auth == 'jwt':
+                token = LibraryTokenObtainPairSerializer.get_token(user).access_token
+                clients[key] = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+            else:
+                clients[key] = Client()
+                if user:
+                    clients[key].force_login(user)
+        return clients[key]
+
+    results = []
+    for endpoint in endpoints or ENDPOINTS:
+        measurement = None
+        for i in range(iterations):
+            call = endpoint.prepare(library, i)
+            client = client_for(call.user, call.auth)
+            if measurement is None:
+                measurement = Measurement(endpoint.name, call.path)
+
+            request = getattr(client, call.method)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                if call.method == 'get':
+                    response = request(call.path)
+                else:
+                    response = request(call.path, data=call.data or {}, content_type='application/json')
+                # Streamed bodies are only read, and queried, as they are consumed.
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                elapsed = (time.perf_counter() - started) * 1000
+
+            measurement.calls += 1
+            measurement.queries.append(len(queries))
+            measurement.latencies_ms.append(elapsed)
+            measurement.sizes.append(len(body))
+            measurement.statuses.append(response.status_code)
+        results.append(measurement)
+
+    return results
+
+def check_budgets(results: List[Measurement], budgets: Optional[Dict[str, dict]] = None,
+                  latency: bool = True) -> List[str]:
+    """
+    Return one message per exceeded budget or failed call
+
+    Args:
+        latency: Also check p99_ms; timings depend on the host, so the
+            test suite leaves them to the benchmark_api command
+    """
+    budgets = budgets or get_budgets()
+    violations = []
+    for result in results:
+        budget = budgets[result.name]
+        failed = [code for code in result.statuses if code >= 400]
+        if failed:
+            violations.append(f'{result.name}: returned HTTP {failed[0]} ({result.path})')
+        if result.max_queries > budget['queries']:
+            violations.append(f"{result.name}: {result.max_queries} queries > budget {budget['queries']}")
+        if latency and result.p99_ms > budget['p99_ms']:
+            violations.append(f"{result.name}: p99 {result.p99_ms:.1f}ms > budget {budget['p99_ms']}ms")
+        if result.max_bytes > budget['bytes']:
+            violations.append(f"{result.name}: {result.max_bytes} bytes > budget {budget['bytes']}")
+    return violations
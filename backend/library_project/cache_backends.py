@@ -0,0 +1,230 @@
+"""
+Django cache backend built on the LRU and SQLite tiers in books.services.cache
+
+Each process keeps a bounded LRU in front of an SQLite file shared by every
+worker on the host, so no cache server is needed. Entries written by one
+worker are visible to the others through the file. A process-local copy can
+outlive a delete made by another worker for at most ``LOCAL_TIMEOUT``
+seconds, so data that must never be served stale (sessions) should use an
+alias with ``LOCAL_MAX_ENTRIES`` set to 0.
+
+``get_or_set`` is single-flight: when a key is missing, one caller on the
+host computes it while the others wait for the result instead of all
+recomputing it at once.
+
+Options:
+    LOCATION: Path of the shared SQLite file; empty for a local-only cache
+    LOCAL_MAX_ENTRIES: Size of the per-process LRU, 0 to disable it
+    LOCAL_TIMEOUT: Longest time a value is kept in the per-process LRU
+    MAX_ENTRIES: Size of the shared file
+    LEASE_TIMEOUT: How long others wait for a computation before doing it
+        themselves
+"""
+
+import os
+import pickle
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from books.services.cache import MISSING, CacheStats, LRUCache, SQLiteCache
+
+# Django creates a backend instance per thread; the tiers are shared by
+# every instance with the same name in the process.
+_tiers: Dict[str, tuple] = {}
+_tiers_lock = threading.Lock()
+
+class TieredCache(BaseCache):
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.name = f"{location}:{params.get('KEY_PREFIX', '')}"
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.lease_timeout = options.get('LEASE_TIMEOUT', 10)
+
+        with _tiers_lock:
+            if self.name not in _tiers:
+                local_size = options.get('LOCAL_MAX_ENTRIES', 1024)
+                _tiers[self.name] = (
+                    LRUCache(max_entries=local_size) if local_size else None,
+                    SQLiteCache(location, max_entries=options.get('MAX_ENTRIES', 100_000)) if location else None,
+                    CacheStats(),
+                    {},
+                )
+            self.local, self.shared, self.stats, self._flights = _tiers[self.name]
+
+    def _ttl(self, timeout) -> Optional[float]:
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else max(timeout, 0)
+
+    def _local_ttl(self, ttl: Optional[float]) -> float:
+        return self.local_timeout if ttl is None else min(ttl, self.local_timeout)
+
+    def _get(self, key: str) -> Any:
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not MISSING:
+                return pickle.loads(value)
+        if self.shared is not None:
+            value, remaining = self.shared.get_with_ttl(key)
+            if value is not MISSING:
+                if self.local is not None:
+                    self.local.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._local_ttl(remaining))
+                return value
+        return MISSING
+
+    def get(self, key, default=None, version=None):
+        value = self._get(self.make_and_validate_key(key, version=version))
+        if value is MISSING:
+            self.stats.misses += 1
+            return default
+        self.stats.hits += 1
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        ttl = self._ttl(timeout)
+        if ttl == 0:
+            self._delete(key)
+            return
+        self.stats.sets += 1
+        # Values are copied into the local tier, like LocMemCache, so
+        # callers can never mutate a cached object in place.
+        if self.local is not None:
+            self.local.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._local_ttl(ttl))
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        ttl = self._ttl(timeout)
+        if ttl == 0:
+            return False
+        # The shared tier decides for the whole host when there is one.
+        if self.shared is not None:
+            added = self.shared.add(key, value, ttl)
+            if added and self.local is not None:
+                self.local.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._local_ttl(ttl))
+        else:
+            added = self.local.add(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+        if added:
+            self.stats.sets += 1
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        value = self._get(self.make_and_validate_key(key, version=version))
+        if value is MISSING:
+            return False
+        self.set(key, value, timeout, version=version)
+        return True
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        found = self._get(key) is not MISSING
+        self._delete(key)
+        return found
+
+    def _delete(self, key: str) -> None:
+        if self.local is not None:
+            self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def has_key(self, key, version=None):
+        return self._get(self.make_and_validate_key(key, version=version)) is not MISSING
+
+    def clear(self):
+        if self.local is not None:
+            self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Return the cached value, computing and storing it once on a miss
+
+        Threads in this process queue on a per-key lock, and processes on
+        the host take turns through a lease entry in the shared tier, so a
+        popular key that expires is recomputed once rather than by every
+        concurrent request. If the lease holder takes longer than
+        LEASE_TIMEOUT the waiters give up and compute it themselves.
+        Exceptions from ``default`` propagate and nothing is stored.
+        """
+        value = self.get(key, MISSING, version=version)
+        if value is not MISSING:
+            return value
+        if not callable(default):
+            self.add(key, default, timeout, version=version)
+            return self.get(key, default, version=version)
+
+        full_key = self.make_and_validate_key(key, version=version)
+        with self._flight(full_key):
+            value = self._get(full_key)
+            if value is not MISSING:
+                self.stats.coalesced += 1
+                return value
+
+            lease = f'{full_key}:lease'
+            leased = self.shared is None or self.shared.add(lease, os.getpid(), self.lease_timeout)
+            deadline = time.monotonic() + self.lease_timeout
+            while not leased and time.monotonic() < deadline:
+                time.sleep(self.POLL_INTERVAL)
+                value = self._get(full_key)
+                if value is not MISSING:
+                    self.stats.coalesced += 1
+                    return value
+                leased = self.shared.add(lease, os.getpid(), self.lease_timeout)
+
+            try:
+                value = default()
+                self.set(key, value, timeout, version=version)
+            finally:
+                if leased and self.shared is not None:
+                    self.shared.delete(lease)
+            return value
+
+    def _flight(self, key: str) -> '_Flight':
+        with _tiers_lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(self._flights, key)
+            flight.waiters += 1
+        return flight
+
+    def metrics(self) -> dict:
+        """
+        Hit ratio, evictions and sizes of this process's view of the cache
+        """
+        tiers = {}
+        if self.local is not None:
+            tiers['local'] = {**self.local.stats.as_dict(), 'entries': len(self.local)}
+        if self.shared is not None:
+            tiers['shared'] = {**self.shared.stats.as_dict(), 'entries': len(self.shared)}
+        return {**self.stats.as_dict(), 'tiers': tiers}
+
+class _Flight:
+    """
+    Per-key lock, dropped from the registry when its last waiter leaves
+    """
+
+    def __init__(self, registry: dict, key: str):
+        self.registry = registry
+        self.key = key
+        self.lock = threading.Lock()
+        self.waiters = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+        with _tiers_lock:
+            self.waiters -= 1
+            if not self.waiters:
+                self.registry.pop(self.key, None)
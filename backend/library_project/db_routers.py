@@ -0,0 +1,102 @@
+"""
+Read-replica routing
+
+Writes and most reads go to the primary (``default``). Views that only
+read data which may lag a little, such as the catalogue and the user
+listing, wrap their work in ``replica_reads`` and read from a randomly
+chosen replica listed in settings.DATABASE_REPLICAS. Sessions and token
+blacklists are always read from the primary.
+
+A user whose request changed something is pinned to the primary for
+REPLICA_PIN_SECONDS, so they always see their own writes even while the
+replicas catch up. Pins live in the shared cache, so they hold across
+workers. Without replicas none of this does anything.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY = 'default'
+PRIMARY_ONLY_APPS = frozenset({'sessions', 'token_blacklist'})
+
+_read_alias: ContextVar[Optional[str]] = ContextVar('replica_read_alias', default=None)
+
+def _pin_key(user) -> str:
+    return f'db-primary-pin:{user.pk}'
+
+def pin_to_primary(user) -> None:
+    cache.set(_pin_key(user), True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+def is_pinned(user) -> bool:
+    return bool(user and user.is_authenticated and cache.get(_pin_key(user)))
+
+def current_replica() -> Optional[str]:
+    """
+    Replica the current reads go to, or None when they go to the primary
+    """
+    return _read_alias.get()
+
+@contextmanager
+def replica_reads(request):
+    """
+    Route the reads made inside the block to a replica, unless there are
+    none or the requesting user is pinned to the primary
+    """
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    alias = None
+    if replicas and not is_pinned(getattr(request, 'user', None)):
+        alias = random.choice(replicas)
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary, so an object read
+        # from one can be related to an object from any other.
+        databases = {PRIMARY, *getattr(settings, 'DATABASE_REPLICAS', [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema along with their data from the primary.
+        if db in getattr(settings, 'DATABASE_REPLICAS', []):
+            return False
+        return None
+
+class PrimaryPinMiddleware:
+    """
+    Pin users to the primary after a successful write request
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', []):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(user)
+        return response
@@ -0,0 +1,168 @@
+"""
+Streaming CSV and NDJSON exports of the catalog, loans, archived loans and
+book requests
+
+Rows are read with ``values_list`` through a server-side iterator and
+written out one chunk at a time, so memory use stays flat however many
+rows are exported; no model instances are built. Used by the admin export
+endpoint and by the ``export_data`` management command.
+
+Under ASGI, Django collects a synchronous iterator into a list before it
+sends anything, so the endpoint streams aexport_chunks there instead.
+"""
+
+import csv
+import io
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import AsyncIterator, Iterable, Iterator, Optional, Sequence, Tuple
+
+from asgiref.sync import sync_to_async
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+from books.models import Book, BookRequest
+from users.models import ArchivedLoan, BookLoan
+
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+@dataclass
+class Export:
+    model: type
+    # (output column, values_list lookup) pairs, in output order.
+    columns: Sequence[Tuple[str, str]]
+    statuses: Sequence[str] = ()
+
+    def queryset(self, status: Optional[str] = None) -> models.QuerySet:
+        queryset = self.model.objects.order_by('pk')
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset.values_list(*(lookup for _, lookup in self.columns))
+
+EXPORTS = {
+    'books': Export(Book, [
+        ('id', 'id'),
+        ('isbn', 'isbn'),
+        ('title', 'title'),
+        ('author', 'author'),
+        ('description', 'description'),
+        ('google_book_id', 'google_book_id'),
+        ('total_copies', 'total_copies'),
+        ('available_copies', 'available_copies'),
+    ]),
+    'loans': Export(BookLoan, [
+        ('id', 'id'),
+        ('book_id', 'book_id'),
+        ('isbn', 'book__isbn'),
+        ('profile_id', 'user_id'),
+        ('username', 'user__user__username'),
+        ('loan_date', 'loan_date'),
+        ('due_date', 'due_date'),
+        ('return_date', 'return_date'),
+        ('status', 'status'),
+    ], statuses=[choice for choice, _ in BookLoan.LOAN_STATUS]),
+    'archived-loans': Export(ArchivedLoan, [
+        ('id', 'id'),
+        ('book_id', 'book_id'),
+        ('isbn', 'book__isbn'),
+        ('profile_id', 'user_id'),
+        ('username', 'user__user__username'),
+        ('loan_date', 'loan_date'),
+        ('due_date', 'due_date'),
+        ('return_date', 'return_date'),
+        ('status', 'status'),
+        ('archived_at', 'archived_at'),
+    ]),
+    'requests': Export(BookRequest, [
+        ('id', 'id'),
+        ('book_id', 'book_id'),
+        ('isbn', 'book__isbn'),
+        ('profile_id', 'user_id'),
+        ('username', 'user__user__username'),
+        ('request_date', 'request_date'),
+        ('status', 'status'),
+        ('response_date', 'response_date'),
+        ('notes', 'notes'),
+    ], statuses=[choice for choice, _ in BookRequest.STATUS_CHOICES]),
+}
+
+def export_chunks(name: str, fmt: str, status: Optional[str] = None,
+                  chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Text chunks of an export, ordered by primary key
+
+    Arguments are checked before anything is read, so a bad request fails
+    before a response starts streaming.
+
+    Args:
+        name: One of EXPORTS
+        fmt: 'csv' or 'ndjson'
+        status: Only export rows with this status (loans and requests)
+        chunk_size: Rows fetched from the database and written per chunk
+
+    Raises:
+        ValidationError: For an unknown export, format or status
+    """
+    export = EXPORTS.get(name)
+    if export is None:
+        raise ValidationError('Unknown export')
+    if fmt not in CONTENT_TYPES:
+        raise ValidationError('Unknown format')
+    if status and status not in export.statuses:
+        raise ValidationError('Invalid status')
+
+    rows = export.queryset(status).iterator(chunk_size=chunk_size)
+    header = [column for column, _ in export.columns]
+    write = _csv_chunks if fmt == 'csv' else _ndjson_chunks
+    return write(header, rows, chunk_size)
+
+def aexport_chunks(name: str, fmt: str, status: Optional[str] = None,
+                   chunk_size: int = CHUNK_SIZE) -> AsyncIterator[str]:
+    """
+    export_chunks as an async iterator, for ASGI servers
+
+    Each chunk is produced by the sync iterator in the thread that owns
+    its database cursor. Arguments are checked at once, as in
+    export_chunks.
+    """
+    return _aiterate(export_chunks(name, fmt, status, chunk_size))
+
+async def _aiterate(chunks: Iterator[str]) -> AsyncIterator[str]:
+    next_chunk = sync_to_async(next)
+    done = object()
+    while (chunk := await next_chunk(chunks, done)) is not done:
+        yield chunk
+
+def _cell(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _csv_chunks(header: Sequence[str], rows: Iterable[tuple], chunk_size: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(map(_cell, row))
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _ndjson_chunks(header: Sequence[str], rows: Iterable[tuple], chunk_size: int) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, map(_cell, row))), ensure_ascii=False))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
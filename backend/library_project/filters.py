@@ -0,0 +1,34 @@
+"""
+Query-string filters shared by the list views
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+def filter_by_date_range(queryset: QuerySet, params, field: str) -> QuerySet:
+    """
+    Apply the since/until range from params to a datetime field
+
+    Either bound may be a datetime or a date; a date covers the whole day,
+    so ``until=2024-05-01`` includes everything on the first of May.
+    Raises ValueError naming the parameter that could not be parsed.
+    """
+    for param, lookup in (('since', 'gte'), ('until', 'lt')):
+        value = params.get(param, '').strip()
+        if not value:
+            continue
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f'Invalid {param} date')
+            if param == 'until':
+                day += timedelta(days=1)
+            moment = datetime.combine(day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        queryset = queryset.filter(**{f'{field}__{lookup}': moment})
+    return queryset
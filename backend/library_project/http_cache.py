@@ -0,0 +1,88 @@
+"""
+Conditional GET and a shared cache of rendered payloads
+
+A view names the version stamps (books.models.ResourceVersion) its
+payload depends on. The ETag is derived from those stamps, so a client
+polling an unchanged resource gets 304 Not Modified after one stamp
+lookup, without loading or serializing anything. A changed resource is
+rendered once and served to everyone else from the cache until the next
+write replaces one of its stamps; stale entries are never looked up
+again and simply expire.
+
+Last-Modified is sent as well, but has one-second resolution, so the
+ETag is what clients should revalidate with.
+"""
+
+import hashlib
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from books.models import ResourceVersion
+
+def conditional_response(request, names: Iterable[str], render: Callable[[], Response],
+                         vary: Iterable = ()) -> Response:
+    """
+    Answer a GET from the stamps in ``names`` when possible
+
+    Args:
+        request: The current request
+        names: Version stamps the payload depends on
+        render: Builds the response when the payload is not cached; only
+            200 responses are cached
+        vary: Anything else the payload depends on, such as the user or
+            the current date
+    """
+    # Inside replica_reads the stamps are read from the same replica as the
+    # payload, so a payload is never cached under a stamp newer than its
+    # data. A resource that was never touched has no stamp and counts as
+    # version 0; its first write creates one with a random version.
+    names = list(names)
+    stamps = ResourceVersion.get_many(names)
+    fingerprint = repr((
+        request.build_absolute_uri(),
+        request.META.get('HTTP_ACCEPT', ''),
+        sorted((name, stamps[name].version if name in stamps else 0) for name in set(names)),
+        tuple(vary),
+    ))
+    digest = hashlib.sha256(fingerprint.encode()).hexdigest()[:40]
+    etag = f'"{digest}"'
+    last_modified = max(stamp.updated_at for stamp in stamps.values()).timestamp() if stamps else None
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, last_modified)
+
+    def build():
+        response = render()
+        if response.status_code != status.HTTP_200_OK:
+            raise _Uncacheable(response)
+        return response.data
+
+    config = getattr(settings, 'RESPONSE_CACHE', {})
+    try:
+        if config.get('ENABLED', True):
+            # Concurrent misses for the same payload render it only once.
+            data = cache.get_or_set(f'response:{digest}', build, config.get('TIMEOUT', 600))
+        else:
+            data = build()
+    except _Uncacheable as e:
+        return e.response
+    return _with_validators(Response(data), etag, last_modified)
+
+class _Uncacheable(Exception):
+    def __init__(self, response):
+        self.response = response
+
+def _with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Only the client may keep a copy, and it has to revalidate every time.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
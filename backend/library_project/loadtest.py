@@ -0,0 +1,138 @@
+"""
+Throughput of the same endpoint under WSGI and ASGI
+
+WSGI is modelled as a pool of worker threads, each with its own test
+client, which is how a threaded WSGI server serves requests: one request
+per thread, for the whole of its duration. ASGI is modelled as one event
+loop driving many requests through a single async test client. Against a
+slow upstream, such as the Google Books stub with added latency, WSGI
+throughput is capped at workers / latency while ASGI is capped by
+concurrency instead. Used by the test suite and by the ``loadtest_api``
+management command.
+"""
+
+import asyncio
+import math
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from books.services.google_books import GoogleBooksService
+from books.services.volumes_stub import SyntheticCorpus, make_server, start_in_thread
+
+GOOGLE_SEARCH_PATH = '/api/async/books/google/?q=load+test'
+
+@dataclass
+class LoadResult:
+    mode: str
+    elapsed: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list)
+    statuses: List[int] = field(default_factory=list)
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies_ms)
+
+    @property
+    def rps(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def p50_ms(self) -> float:
+        return statistics.median(self.latencies_ms)
+
+    @property
+    def p99_ms(self) -> float:
+        ordered = sorted(self.latencies_ms)
+        return ordered[max(0, math.ceil(0.99 * len(ordered)) - 1)]
+
+    @property
+    def errors(self) -> int:
+        return sum(code >= 400 for code in self.statuses)
+
+def load_token() -> str:
+    """
+    Access token for a user that exists only in its claims, so the
+    endpoints can be loaded without creating users
+    """
+    token = AccessToken()
+    token['user_id'] = 0
+    token['username'] = 'loadtest'
+    token['is_staff'] = False
+    token['profile_id'] = 0
+    return str(token)
+
+@contextmanager
+def stubbed_google_books(latency: float) -> Iterator[str]:
+    """
+    Serve Google Books from a local stub with ``latency`` seconds per call
+    and the response cache off, so every request goes upstream
+    """
+    server = make_server(SyntheticCorpus(size=10_000), port=0, latency=latency)
+    url, _ = start_in_thread(server)
+    previous_cache = GoogleBooksService._cache
+    config = {**getattr(settings, 'GOOGLE_BOOKS_CACHE', {}), 'ENABLED': False, 'OFFLINE': False}
+    try:
+        with override_settings(GOOGLE_BOOKS_BASE_URL=url, GOOGLE_BOOKS_CACHE=config):
+            GoogleBooksService.set_cache(None)
+            yield url
+    finally:
+        GoogleBooksService.set_cache(previous_cache)
+        server.shutdown()
+        server.server_close()
+
+def run_wsgi(path: str, token: str, requests: int, workers: int) -> LoadResult:
+    result = LoadResult('wsgi')
+    local = threading.local()
+    lock = threading.Lock()
+
+    def call(_):
+        if not hasattr(local, 'client'):
+            local.client = Client(headers={'Authorization': f'Bearer {token}'})
+        started = time.perf_counter()
+        response = local.client.get(path)
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            result.latencies_ms.append(elapsed)
+            result.statuses.append(response.status_code)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(call, range(requests)))
+        result.elapsed = time.perf_counter() - started
+    return result
+
+def run_asgi(path: str, token: str, requests: int, concurrency: int) -> LoadResult:
+    async def load():
+        result = LoadResult('asgi')
+        client = AsyncClient()
+        # AsyncClient drops headers given to its constructor; they have to
+        # be passed with each request.
+        headers = {'Authorization': f'Bearer {token}'}
+        slots = asyncio.Semaphore(concurrency)
+
+        async def call():
+            async with slots:
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                result.latencies_ms.append((time.perf_counter() - started) * 1000)
+                result.statuses.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(call() for _ in range(requests)))
+        result.elapsed = time.perf_counter() - started
+        await GoogleBooksService.get_async_client().aclose()
+        await sync_to_async(connections.close_all)()
+        return result
+
+    return asyncio.run(load())
@@ -0,0 +1,157 @@
+"""
+Query-plan checks for the API's hot query shapes
+
+Runs EXPLAIN for each shape the views and services issue on every request
+and flags full-table scans, so a missing index shows up in the test suite
+instead of in production. Used by the test suite and by the
+``explain_queries`` management command.
+"""
+
+import re
+import statistics
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable, List, Optional
+
+from django.db import connection
+from django.db.models import Count, Q, QuerySet, Sum
+from django.utils import timezone
+
+from books.models import Book, BookRequest
+from books.services.search import get_search_backend
+from users.models import ArchivedLoan, BookLoan, DailyBookStats, DailyUserStats
+from .benchmark import SyntheticLibrary
+
+@dataclass
+class QueryShape:
+    name: str
+    build: Callable[[SyntheticLibrary], QuerySet]
+    # Shapes that must read every row anyway.
+    allow_scan: bool = False
+
+@dataclass
+class QueryPlan:
+    name: str
+    sql: str
+    plan: str
+    full_scans: List[str] = field(default_factory=list)
+    sorts: int = 0
+    timings_ms: List[float] = field(default_factory=list)
+    allow_scan: bool = False
+
+    @property
+    def median_ms(self) -> float:
+        return statistics.median(self.timings_ms) if self.timings_ms else 0.0
+
+def _member_profile(library):
+    return library.member(len(library.members) // 2).profile
+
+def _stats_window():
+    # The default 30-day window of the stats dashboard.
+    until = timezone.localdate()
+    return until - timedelta(days=29), until
+
+def _loaned_book(library):
+    loan = library.loans[len(library.loans) // 2]
+    return loan.book_id, loan.user_id
+
+QUERY_SHAPES = [
+    QueryShape('user-active-loans', lambda lib: BookLoan.objects.filter(
+        user=_member_profile(lib), return_date__isnull=True)),
+    QueryShape('user-loan-history', lambda lib: BookLoan.objects.filter(
+        user=_member_profile(lib), loan_date__gte=timezone.now() - timedelta(days=365)
+    ).order_by('-loan_date', '-pk')[:21]),
+    QueryShape('archived-loan-history', lambda lib: ArchivedLoan.objects.filter(
+        user=_member_profile(lib)).order_by('-loan_date', '-pk')[:21]),
+    QueryShape('duplicate-loan-check', lambda lib: BookLoan.objects.filter(
+        book_id=_loaned_book(lib)[0], user_id=_loaned_book(lib)[1], return_date__isnull=True)[:1]),
+    QueryShape('loan-list', lambda lib: BookLoan.objects.select_related(
+        'book', 'user__user').order_by('-loan_date')[:50]),
+    QueryShape('overdue-sweep', lambda lib: BookLoan.objects.filter(
+        return_date__isnull=True, due_date__lt=timezone.now(), status='ACTIVE').order_by('due_date')[:1000]),
+    QueryShape('pending-request-check', lambda lib: BookRequest.objects.filter(
+        user=lib.requests[0].user_id, book=lib.requests[0].book_id, status='PENDING')[:1]),
+    QueryShape('user-requests', lambda lib: BookRequest.objects.filter(
+        user=_member_profile(lib)).select_related('user__user', 'book')),
+    QueryShape('reservation-queue-head', lambda lib: BookRequest.objects.filter(
+        book=lib.requests[0].book_id, status='PENDING').order_by('request_date', 'id')[:20]),
+    QueryShape('reservation-queue-position', lambda lib: BookRequest.objects.filter(
+        book=lib.requests[0].book_id, status='PENDING', request_date__lt=timezone.now()
+    ).order_by().values('book').annotate(total=Count('pk'))),
+    QueryShape('admin-request-queue', lambda lib: BookRequest.objects.select_related(
+        'user__user', 'book').order_by('-request_date', '-id')[:50]),
+    QueryShape('admin-pending-queue', lambda lib: BookRequest.objects.filter(status='PENDING').select_related(
+        'user__user', 'book').order_by('-request_date', '-id')[:50]),
+    QueryShape('admin-request-counts', lambda lib: BookRequest.objects.order_by().values_list(
+        'status').annotate(total=Count('id'))),
+    QueryShape('stats-loans-per-day', lambda lib: DailyBookStats.objects.filter(
+        day__range=_stats_window()).order_by('day').values('day').annotate(loans=Sum('loans'))),
+    QueryShape('stats-most-borrowed', lambda lib: DailyBookStats.objects.filter(
+        day__range=_stats_window()).values('book_id').annotate(
+        loans=Sum('loans')).order_by('-loans', 'book_id')[:10]),
+    QueryShape('stats-overdue-rates', lambda lib: DailyUserStats.objects.filter(
+        day__range=_stats_window()).values('user_id').annotate(
+        late_returns=Sum('late_returns')).order_by('-late_returns')[:10]),
+    # Deleting a book or a member cascades to its rollup rows.
+    QueryShape('stats-book-rows', lambda lib: DailyBookStats.objects.filter(book=lib.book(0))),
+    QueryShape('stats-user-rows', lambda lib: DailyUserStats.objects.filter(user=_member_profile(lib))),
+    QueryShape('book-list-by-title', lambda lib: Book.objects.order_by('title', 'id')[:20]),
+    QueryShape('book-by-isbn', lambda lib: Book.objects.filter(isbn=lib.book(0).isbn)),
+    QueryShape('book-list-search', lambda lib: Book.objects.filter(
+        get_search_backend().matching('synthetic 1') | Q(isbn__gte='synthetic 1', isbn__lt='synthetic 1\uffff')
+    ).order_by('title', 'id')[:21]),
+    QueryShape('book-list-by-author', lambda lib: Book.objects.filter(
+        get_search_backend().matching(lib.book(0).author, field='author')).order_by('title', 'id')[:21]),
+]
+
+def find_full_scans(plan: str, vendor: Optional[str] = None) -> List[str]:
+    """
+    Tables read in full according to an EXPLAIN plan
+
+    On SQLite a bare ``SCAN table`` is a full scan. ``SCAN table USING
+    INDEX`` walks an index in order and usually stops at a LIMIT, unless
+    the rows still have to be sorted afterwards, in which case every row
+    is read as well.
+    """
+    vendor = vendor or connection.vendor
+    if vendor == 'postgresql':
+        return re.findall(r'Seq Scan on (\w+)', plan)
+    pattern = r'\bSCAN (\w+)(?: AS \w+)?\s*$'
+    if count_sorts(plan):
+        pattern = r'\bSCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?\s*$'
+    return re.findall(pattern, plan, re.MULTILINE)
+
+def count_sorts(plan: str) -> int:
+    return len(re.findall(r'USE TEMP B-TREE FOR ORDER BY|Sort Key', plan))
+
+def explain_shapes(library: SyntheticLibrary, iterations: int = 5,
+                   shapes: Optional[List[QueryShape]] = None) -> List[QueryPlan]:
+    results = []
+    for shape in shapes or QUERY_SHAPES:
+        queryset = shape.build(library)
+        plan = queryset.explain()
+        result = QueryPlan(
+            name=shape.name,
+            sql=str(queryset.query),
+            plan=plan,
+            full_scans=find_full_scans(plan),
+            sorts=count_sorts(plan),
+            allow_scan=shape.allow_scan
+        )
+        for _ in range(iterations):
+            started = time.perf_counter()
+            list(queryset._chain())
+            result.timings_ms.append((time.perf_counter() - started) * 1000)
+        results.append(result)
+    return results
+
+def check_plans(results: List[QueryPlan]) -> List[str]:
+    """
+    Return one message per unexpected full-table scan
+    """
+    return [
+        f"{result.name}: full scan of {', '.join(result.full_scans)}"
+        for result in results
+        if result.full_scans and not result.allow_scan
+    ]
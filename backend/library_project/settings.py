@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -10,9 +11,66 @@ if not SECRET_KEY:
 
 GOOGLE_BOOKS_API_KEY = os.environ.get('GOOGLE_BOOKS_API_KEY')
 
-if not GOOGLE_BOOKS_API_KEY:
+# Point this at a local stand-in (manage.py serve_volumes_stub) to run
+# imports without network access; an API key is only required for Google.
+GOOGLE_BOOKS_BASE_URL = os.environ.get(
+    'GOOGLE_BOOKS_BASE_URL',
+    'https://www.googleapis.com/books/v1/volumes'
+)
+
+if not GOOGLE_BOOKS_API_KEY and GOOGLE_BOOKS_BASE_URL.startswith('https://www.googleapis.com/'):
     raise ValueError("No GOOGLE_BOOKS_API_KEY set in environment variables")
 
+GOOGLE_BOOKS_CACHE = {
+    'ENABLED': os.environ.get('GOOGLE_BOOKS_CACHE_ENABLED', 'true').lower() == 'true',
+    'PATH': os.environ.get('GOOGLE_BOOKS_CACHE_PATH', BASE_DIR / 'google_books_cache.sqlite3'),
+    'MAX_ENTRIES': 1024,
+    'MAX_DISK_ENTRIES': 100_000,
+    'TTL': int(os.environ.get('GOOGLE_BOOKS_CACHE_TTL', 7 * 24 * 3600)),
+    'NEGATIVE_TTL': int(os.environ.get('GOOGLE_BOOKS_CACHE_NEGATIVE_TTL', 3600)),
+    'OFFLINE': os.environ.get('GOOGLE_BOOKS_OFFLINE', 'false').lower() == 'true',
+}
+
+# Process-local LRU in front of an SQLite file shared by every worker on the
+# host; see library_project/cache_backends.py. Sessions skip the local tier
+# so a logout is seen by every worker at once.
+CACHE_DIR = Path(os.environ.get('CACHE_DIR', BASE_DIR))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'library_project.cache_backends.TieredCache',
+        'LOCATION': str(CACHE_DIR / 'cache.sqlite3'),
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 2048,
+            'LOCAL_TIMEOUT': 60,
+            'MAX_ENTRIES': 50_000,
+        },
+    },
+    'sessions': {
+        'BACKEND': 'library_project.cache_backends.TieredCache',
+        'LOCATION': str(CACHE_DIR / 'sessions-cache.sqlite3'),
+        'TIMEOUT': 2 * 3600,
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 0,
+            'MAX_ENTRIES': 100_000,
+        },
+    },
+}
+
+# Tests run against copies of these caches in a temporary directory.
+TEST_RUNNER = 'library_project.test_runner.IsolatedCacheTestRunner'
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Rendered payloads of the conditional GET endpoints, keyed by the version
+# stamps they were rendered from (see library_project/http_cache.py).
+RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true',
+    'TIMEOUT': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 600)),
+}
+
 DEBUG = True
 
 ALLOWED_HOSTS = []
@@ -25,6 +83,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     'books',
     'users'
@@ -36,6 +95,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'library_project.db_routers.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware'
@@ -61,13 +121,58 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'library_project.wsgi.application'
 
+# SQLite tuning applied to every new connection. WAL lets reads run
+# alongside the single writer and, with synchronous=NORMAL, commits without
+# an fsync each time. IMMEDIATE transactions take the write lock when they
+# begin, so a busy writer makes others wait up to the timeout instead of
+# failing with "database is locked" when they try to upgrade a read lock.
+# Connections are reused for DB_CONN_MAX_AGE seconds; set it to 0 under
+# ASGI, where requests do not reuse threads.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    # A negative cache_size is in KiB rather than pages.
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
     }
 }
 
+# Read replicas, as a comma-separated list of SQLite files kept up to date
+# with the primary (``manage.py sync_replicas`` copies it locally). Only the
+# catalogue and user listing read from them, and a user who has just
+# written reads from the primary for DB_REPLICA_PIN_SECONDS; see
+# library_project/db_routers.py.
+DATABASE_REPLICAS = []
+for index, path in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': path.strip(),
+        'OPTIONS': {
+            **DATABASES['default']['OPTIONS'],
+            'init_command': DATABASES['default']['OPTIONS']['init_command'] + ';PRAGMA query_only=ON',
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['library_project.db_routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 10))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -85,10 +190,24 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        # Bearer tokens are checked first and need no database access;
+        # the frontend's session cookie keeps working.
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     )
 }
 
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'ROTATE_REFRESH_TOKENS': True,
+    'BLACKLIST_AFTER_ROTATION': True,
+    'UPDATE_LAST_LOGIN': False,
+    'TOKEN_USER_CLASS': 'users.authentication.ClaimsUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'users.authentication.LibraryTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.authentication.LibraryTokenRefreshSerializer',
+}
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000"
 ]
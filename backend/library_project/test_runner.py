@@ -0,0 +1,55 @@
+"""
+Test runner that keeps the suite away from the cache files of a running
+server
+
+The tiered caches in settings.CACHES and the Google Books response cache
+live in SQLite files next to the project. Tests get the same backends on
+files in a throwaway directory, and a memory-only Google Books cache, so
+they neither read entries left behind by a dev server nor leave their own
+behind for it.
+"""
+
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from books.services.google_books import GoogleBooksService
+
+class IsolatedCacheTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.TemporaryDirectory(prefix='library-test-cache-')
+        directory = Path(self._cache_dir.name)
+        self._cache_settings = override_settings(CACHES={
+            alias: {**config, 'LOCATION': str(directory / Path(config['LOCATION']).name)}
+            if config.get('LOCATION') else config
+            for alias, config in settings.CACHES.items()
+        }, GOOGLE_BOOKS_CACHE={**settings.GOOGLE_BOOKS_CACHE, 'PATH': None})
+        self._cache_settings.enable()
+        GoogleBooksService.set_cache(None)
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        GoogleBooksService.set_cache(None)
+        self._cache_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
+
+@contextmanager
+def throwaway_environment():
+    """
+    A test database and throwaway caches for commands that seed synthetic
+    data, so nothing they write reaches the real ones
+    """
+    runner = IsolatedCacheTestRunner(verbosity=0, interactive=False)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        runner.teardown_test_environment()
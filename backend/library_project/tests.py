@@ -0,0 +1,314 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from books.models import Book
+from users.models import BookLoan
+from users.services.loans import LoanService
+from . import cache_backends
+from .db_routers import PrimaryPinMiddleware, ReplicaRouter, current_replica, is_pinned, replica_reads
+from .benchmark import ENDPOINTS, api_routes, check_budgets, run_benchmark, seed_library
+from .exports import aexport_chunks, export_chunks
+from .loadtest import GOOGLE_SEARCH_PATH, load_token, run_asgi, run_wsgi, stubbed_google_books
+from .query_plans import check_plans, explain_shapes, find_full_scans
+from .write_benchmark import ALIAS, configured_profile, run_writers, scratch_connections
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ApiPerformanceBudgetTests(TestCase):
+    def setUp(self):
+        self.library = seed_library(books=300, members=40, loans=90, requests=40)
+
+    def test_every_route_is_benchmarked(self):
+        covered = {
+            resolve(endpoint.prepare(self.library, 0).path.split('?')[0]).route
+            for endpoint in ENDPOINTS
+        }
+        self.assertEqual(set(api_routes()) - covered, set())
+
+    def test_endpoints_stay_within_budget(self):
+        results = run_benchmark(self.library, iterations=5)
+        violations = check_budgets(results, latency=False)
+        self.assertEqual(violations, [], '\n'.join(violations))
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        library = seed_library(books=300, members=40, loans=90, requests=40)
+        violations = check_plans(explain_shapes(library, iterations=1))
+        self.assertEqual(violations, [], '\n'.join(violations))
+
+    def test_sorted_index_walk_counts_as_full_scan(self):
+        self.assertEqual(find_full_scans('SCAN books_book USING INDEX title_idx', 'sqlite'), [])
+        self.assertEqual(find_full_scans(
+            'SCAN books_book USING INDEX title_idx\nUSE TEMP B-TREE FOR ORDER BY', 'sqlite'), ['books_book'])
+        self.assertEqual(find_full_scans('Seq Scan on books_book  (cost=0.00..1.01)', 'postgresql'), ['books_book'])
+
+class TieredCacheBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'cache.sqlite3')
+        tiers = dict(cache_backends._tiers)
+        self.addCleanup(lambda: (cache_backends._tiers.clear(), cache_backends._tiers.update(tiers)))
+
+    def backend(self, **options):
+        # Each call stands in for a separate worker process on the host.
+        cache_backends._tiers.clear()
+        return cache_backends.TieredCache(self.path, {'TIMEOUT': 60, 'OPTIONS': options})
+
+    def test_suite_does_not_use_the_project_cache_files(self):
+        for config in settings.CACHES.values():
+            self.assertNotEqual(os.path.dirname(config['LOCATION']), str(settings.BASE_DIR))
+        self.assertNotEqual(os.path.dirname(cache.shared.path), str(settings.BASE_DIR))
+        self.assertIsNone(settings.GOOGLE_BOOKS_CACHE['PATH'])
+
+    def test_workers_share_the_file_tier(self):
+        first, second = self.backend(), self.backend()
+        first.set('book', {'title': 'Dune'})
+        self.assertEqual(second.get('book'), {'title': 'Dune'})
+        self.assertFalse(second.add('book', 'other'))
+
+        second.delete('book')
+        self.assertIsNone(self.backend().get('book'))
+
+    def test_local_copies_expire_with_the_shared_entry(self):
+        self.backend().set('book', 'Dune', timeout=0.05)
+        second = self.backend(LOCAL_TIMEOUT=60)
+        self.assertEqual(second.get('book'), 'Dune')
+        time.sleep(0.06)
+        self.assertIsNone(second.get('book'))
+
+    def test_local_copies_cannot_be_mutated_in_place(self):
+        cache = self.backend()
+        cache.set('book', {'title': 'Dune'})
+        cache.get('book')['title'] = 'Changed'
+        self.assertEqual(cache.get('book'), {'title': 'Dune'})
+
+    def test_concurrent_misses_compute_once(self):
+        workers = [self.backend(), self.backend()]
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'page'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda cache=workers[i % 2]: results.append(cache.get_or_set('page', compute)))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['page'] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sum(worker.stats.coalesced for worker in workers), 7)
+
+    def test_failed_computation_stores_nothing(self):
+        cache = self.backend()
+
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            cache.get_or_set('page', fail)
+        self.assertFalse(cache.has_key('page'))
+        self.assertEqual(cache.get_or_set('page', lambda: 'page'), 'page')
+
+    def test_metrics_report_hit_ratio_and_evictions(self):
+        cache = self.backend(LOCAL_MAX_ENTRIES=2)
+        for key in 'abc':
+            cache.set(key, key)
+        cache.get('a')
+        cache.get('missing')
+
+        metrics = cache.metrics()
+        self.assertEqual(metrics['hit_ratio'], 0.5)
+        # Reading 'a' back from the file pushes 'b' out of the local tier.
+        self.assertEqual(metrics['tiers']['local']['evictions'], 2)
+        self.assertEqual(metrics['tiers']['shared']['entries'], 3)
+
+    def test_local_only_cache(self):
+        cache_backends._tiers.clear()
+        cache = cache_backends.TieredCache('', {'OPTIONS': {}})
+        self.assertTrue(cache.add('key', 1))
+        self.assertFalse(cache.add('key', 2))
+        self.assertEqual(cache.get_or_set('other', lambda: 3), 3)
+
+class LoadTestTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_asgi_keeps_serving_while_upstream_is_slow(self):
+        token = load_token()
+        with stubbed_google_books(latency=0.05):
+            wsgi = run_wsgi(GOOGLE_SEARCH_PATH, token, requests=20, workers=2)
+            asgi = run_asgi(GOOGLE_SEARCH_PATH, token, requests=20, concurrency=20)
+
+        # Throughput depends on the host; loadtest_api compares it.
+        self.assertEqual((wsgi.requests, asgi.requests), (20, 20))
+        self.assertEqual(wsgi.errors + asgi.errors, 0)
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create(username='reader')
+        self.books = [
+            Book.objects.create(title=f'Book, "{i}"', author='Anon', isbn=f'{9780000000000 + i}',
+                                total_copies=1, available_copies=1)
+            for i in range(5)
+        ]
+        self.loans = [LoanService.checkout(BookLoan(user=self.member.profile, book=book)) for book in self.books]
+        LoanService.return_loan(self.loans[0])
+        self.client = Client()
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+
+    def test_csv_round_trips_every_row(self):
+        response = self.client.get('/api/admin/exports/books.csv', headers={'Accept': 'text/csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="books-', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['title'] for row in rows], [book.title for book in self.books])
+
+    def test_ndjson_filters_by_status(self):
+        response = self.client.get('/api/admin/exports/loans.ndjson', {'status': 'returned'})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line['id'] for line in lines], [self.loans[0].pk])
+        self.assertEqual(lines[0]['username'], 'reader')
+        self.assertEqual(lines[0]['return_date'], self.loans[0].return_date.isoformat())
+
+    def test_archived_loans_are_exported(self):
+        LoanService.archive_returned(timezone.now() + timedelta(minutes=1))
+        rows = list(csv.DictReader(io.StringIO(''.join(export_chunks('archived-loans', 'csv')))))
+        self.assertEqual([int(row['id']) for row in rows], [self.loans[0].pk])
+        self.assertEqual(rows[0]['status'], 'RETURNED')
+
+    def test_rows_are_read_as_the_stream_is_consumed(self):
+        with self.assertNumQueries(0):
+            chunks = export_chunks('loans', 'csv', chunk_size=2)
+        with self.assertNumQueries(1):
+            chunks = list(chunks)
+        # The header and two rows, two rows, then the last row.
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [3, 2, 1])
+
+        async def collect():
+            return [chunk async for chunk in aexport_chunks('loans', 'csv', chunk_size=2)]
+
+        with self.assertNumQueries(1):
+            self.assertEqual(async_to_sync(collect)(), chunks)
+
+    async def test_asgi_streams_without_buffering(self):
+        await self.async_client.aforce_login(await User.objects.aget(username='admin'))
+        response = await self.async_client.get('/api/admin/exports/loans.ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        lines = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([line['id'] for line in lines], [loan.pk for loan in self.loans])
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get('/api/admin/exports/users.csv').status_code, 404)
+        self.assertEqual(self.client.get('/api/admin/exports/books.xml').status_code, 404)
+        response = self.client.get('/api/admin/exports/loans.csv', {'status': 'lost'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid status'})
+
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get('/api/admin/exports/books.csv').status_code, 403)
+
+    def test_command_writes_the_same_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'loans.csv')
+            call_command('export_data', 'loans', '--status', 'active', '--output', path, stderr=io.StringIO())
+            with open(path, newline='') as output:
+                rows = list(csv.DictReader(output))
+        self.assertEqual([int(row['id']) for row in rows], [loan.pk for loan in self.loans[1:]])
+
+class SQLiteTuningTests(SimpleTestCase):
+    def test_pragmas_are_applied_on_connect(self):
+        with tempfile.TemporaryDirectory() as directory:
+            handler = scratch_connections(os.path.join(directory, 'tuned.sqlite3'), configured_profile())
+            try:
+                with handler[ALIAS].cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store'):
+                        cursor.execute(f'PRAGMA {name}')
+                        pragmas[name] = cursor.fetchone()[0]
+                self.assertEqual(handler[ALIAS].transaction_mode, 'IMMEDIATE')
+            finally:
+                handler.close_all()
+
+        # synchronous 1 is NORMAL and temp_store 2 is MEMORY.
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000, 'temp_store': 2})
+        self.assertEqual(handler.settings[ALIAS]['CONN_MAX_AGE'], 600)
+
+    def test_concurrent_writers_are_not_locked_out(self):
+        # Throughput depends on the host; benchmark_writers compares it.
+        configured = run_writers(configured_profile(), 'configured', threads=4, per_thread=50)
+
+        self.assertEqual(configured.transactions, 200)
+        self.assertEqual(configured.locked, 0)
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.user = User(pk=987654, username='reader')
+        self.request = RequestFactory().get('/api/books/')
+        self.request.user = self.user
+        self.addCleanup(cache.delete, 'db-primary-pin:987654')
+
+    def test_only_reads_inside_replica_reads_use_a_replica(self):
+        self.assertIsNone(self.router.db_for_read(Book))
+        with replica_reads(self.request) as alias:
+            self.assertIn(alias, ['replica1', 'replica2'])
+            self.assertEqual(current_replica(), alias)
+            self.assertEqual(self.router.db_for_read(Book), alias)
+            self.assertEqual(self.router.db_for_read(User), alias)
+            self.assertIsNone(self.router.db_for_read(Session))
+            self.assertEqual(self.router.db_for_write(Book), 'default')
+        self.assertIsNone(self.router.db_for_read(Book))
+
+    def test_successful_writes_pin_the_user_to_the_primary(self):
+        request = RequestFactory().post('/loans/')
+        request.user = self.user
+        PrimaryPinMiddleware(lambda request: HttpResponse(status=400))(request)
+        self.assertFalse(is_pinned(self.user))
+        PrimaryPinMiddleware(lambda request: HttpResponse(status=201))(request)
+        self.assertTrue(is_pinned(self.user))
+
+        with replica_reads(self.request) as alias:
+            self.assertIsNone(alias)
+            self.assertIsNone(self.router.db_for_read(Book))
+
+    def test_objects_relate_across_primary_and_replicas(self):
+        book, loan = Book(), BookLoan()
+        book._state.db, loan._state.db = 'replica2', 'default'
+        self.assertTrue(self.router.allow_relation(book, loan))
+        self.assertFalse(self.router.allow_migrate('replica1', 'books'))
+        self.assertIsNone(self.router.allow_migrate('default', 'books'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_nothing_changes_without_replicas(self):
+        with replica_reads(self.request) as alias:
+            self.assertIsNone(alias)
+        with self.assertRaises(MiddlewareNotUsed):
+            PrimaryPinMiddleware(lambda request: HttpResponse())
@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
-from users.views import LoginView, LogoutView, RegisterView, UserViewSet, LoanViewSet, CurrentUserView, UserListView
-from books.views import BookListView, BookDetailView, BookRequestView, AdminBookRequestView
-from rest_framework_simplejwt.views import TokenObtainPairView
+from users.views import LoginView, LogoutView, RegisterView, UserViewSet, LoanViewSet, CurrentUserView, UserListView, AsyncLoanListView, LoanHistoryView
+from books.views import BookListView, BookSearchView, BookDetailView, BookRequestView, BookRequestQueueView, AdminBookRequestView, AdminBookRequestDecisionView
+from books.views import AsyncBookListView, AsyncBookSearchView, AsyncBookDetailView, AsyncGoogleBookSearchView
+from rest_framework_simplejwt.views import TokenBlacklistView, TokenObtainPairView, TokenRefreshView
 from rest_framework.routers import DefaultRouter
+from .views import CacheMetricsView, ExportView, StatsView
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
@@ -12,15 +14,29 @@ router.register(r'loans', LoanViewSet, basename='loan')
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/blacklist/', TokenBlacklistView.as_view(), name='token_blacklist'),
     path('api/auth/login/', LoginView.as_view(), name='login'),
     path('api/auth/logout/', LogoutView.as_view(), name='logout'),
     path('api/auth/register/', RegisterView.as_view(), name='register'),
     path('api/users/me/', CurrentUserView.as_view(), name='current-user'),
+    path('api/users/me/loans/', LoanHistoryView.as_view(), name='loan-history'),
     path('api/users/', UserListView.as_view(), name='user-list'),
     path('api/books/', BookListView.as_view(), name='book-list'),
+    path('api/books/search/', BookSearchView.as_view(), name='book-search'),
     path('api/books/<int:pk>/', BookDetailView.as_view(), name='book-detail'),
     path('api/book-requests/', BookRequestView.as_view(), name='book-requests'),
+    path('api/book-requests/<int:request_id>/queue/', BookRequestQueueView.as_view(), name='book-request-queue'),
     path('api/admin/book-requests/', AdminBookRequestView.as_view(), name='admin-book-requests'),
+    path('api/admin/book-requests/decisions/', AdminBookRequestDecisionView.as_view(), name='admin-book-request-decisions'),
     path('api/admin/book-requests/<int:request_id>/', AdminBookRequestView.as_view(), name='admin-book-request-detail'),
+    path('api/async/books/', AsyncBookListView.as_view(), name='async-book-list'),
+    path('api/async/books/search/', AsyncBookSearchView.as_view(), name='async-book-search'),
+    path('api/async/books/google/', AsyncGoogleBookSearchView.as_view(), name='async-google-search'),
+    path('api/async/books/<int:pk>/', AsyncBookDetailView.as_view(), name='async-book-detail'),
+    path('api/async/loans/', AsyncLoanListView.as_view(), name='async-my-loans'),
+    path('api/admin/cache/', CacheMetricsView.as_view(), name='admin-cache-metrics'),
+    path('api/admin/exports/<str:resource>.<str:fmt>', ExportView.as_view(), name='admin-export'),
+    path('api/stats/', StatsView.as_view(), name='stats'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.services.stats import CirculationStats
+from .exports import CONTENT_TYPES, EXPORTS, aexport_chunks, export_chunks
+
+class CacheMetricsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Hit ratio, evictions and sizes of each cache, as seen by this worker"""
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        return Response({
+            alias: caches[alias].metrics()
+            for alias in settings.CACHES
+            if hasattr(caches[alias], 'metrics')
+        })
+
+class ExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # The export itself is not rendered by DRF, so an Accept header
+        # such as text/csv must not be refused; errors are sent as JSON.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, resource, fmt):
+        """
+        Stream every book, loan or request as CSV or NDJSON, oldest first
+
+        ``?status=`` limits loans and requests to one status.
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if resource not in EXPORTS or fmt not in CONTENT_TYPES:
+            return Response({'error': 'Unknown export'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Under ASGI a sync iterator would be read to the end before the
+        # first byte is sent.
+        is_asgi = isinstance(request._request, ASGIRequest)
+        try:
+            chunks = (aexport_chunks if is_asgi else export_chunks)(
+                resource, fmt, request.query_params.get('status', '').upper() or None
+            )
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+        filename = f'{resource}-{timezone.localdate():%Y%m%d}.{fmt}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class StatsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Circulation dashboard over the last ``?days=`` days (30 by default):
+        totals, loans per day, the ``?limit=`` most borrowed books and the
+        users with the highest share of late returns
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            days = int(request.query_params.get('days', 30))
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response(
+                {'error': 'days and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(CirculationStats.dashboard(
+            days=max(1, min(days, CirculationStats.MAX_DAYS)),
+            limit=max(1, min(limit, CirculationStats.MAX_LIMIT))
+        ))
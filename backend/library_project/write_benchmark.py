@@ -0,0 +1,135 @@
+"""
+Concurrent-writer benchmark for SQLite connection settings
+
+Runs a checkout-shaped transaction (read a book's free copies, decrement
+them, insert a loan) from several threads against a scratch database
+file, once with Django's SQLite defaults and once with the configured
+DATABASES settings. Each thread opens its connection through Django's
+backend, so OPTIONS, init_command and transaction_mode apply exactly as
+they do in the app, and closes or keeps it after each transaction the way
+request_finished would under CONN_MAX_AGE. Used by the test suite and by
+the ``benchmark_writers`` management command.
+"""
+
+import os
+import statistics
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.db.utils import ConnectionHandler
+
+# Plain Django: rollback journal, DEFERRED transactions, a new connection
+# for every request.
+DEFAULT_PROFILE = {'CONN_MAX_AGE': 0, 'OPTIONS': {}}
+
+ALIAS = 'write_benchmark'
+BOOKS = 20
+COPIES = 10 ** 9
+
+@dataclass
+class WriterResult:
+    profile: str
+    threads: int
+    transactions: int = 0
+    # Attempts that failed with "database is locked" and were retried.
+    locked: int = 0
+    elapsed: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list)
+
+    @property
+    def tps(self) -> float:
+        return self.transactions / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def p50_ms(self) -> float:
+        return statistics.median(self.latencies_ms) if self.latencies_ms else 0.0
+
+def configured_profile() -> Dict:
+    default = settings.DATABASES['default']
+    return {
+        'CONN_MAX_AGE': default.get('CONN_MAX_AGE', 0),
+        'OPTIONS': default.get('OPTIONS', {}),
+    }
+
+def scratch_connections(path: str, profile: Dict) -> ConnectionHandler:
+    """
+    Connections to the SQLite file at ``path`` under the ALIAS alias, kept
+    apart from django.db.connections
+    """
+    return ConnectionHandler({
+        'default': {},
+        ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, **profile},
+    })
+
+def run_writers(profile: Dict, name: str, threads: int = 4, per_thread: int = 100) -> WriterResult:
+    """
+    Run ``threads`` writers of ``per_thread`` transactions each against a
+    fresh database file using the ``CONN_MAX_AGE`` and ``OPTIONS`` of
+    ``profile``
+    """
+    result = WriterResult(name, threads)
+    lock = threading.Lock()
+
+    with tempfile.TemporaryDirectory() as directory:
+        handler = scratch_connections(os.path.join(directory, 'writers.sqlite3'), profile)
+        _create_schema(handler[ALIAS])
+        handler[ALIAS].close()
+
+        def writer(index):
+            # transaction.atomic() looks the alias up in django.db.connections,
+            # which is per thread, so each writer registers its own wrapper.
+            connections[ALIAS] = handler[ALIAS]
+            latencies, locked = [], 0
+            try:
+                for n in range(per_thread):
+                    started = time.perf_counter()
+                    while True:
+                        try:
+                            _checkout(connections[ALIAS], (index * per_thread + n) % BOOKS + 1)
+                            break
+                        except OperationalError:
+                            locked += 1
+                            time.sleep(0.001)
+                        finally:
+                            connections[ALIAS].close_if_unusable_or_obsolete()
+                    latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections[ALIAS].close()
+                del connections[ALIAS]
+            with lock:
+                result.transactions += len(latencies)
+                result.locked += locked
+                result.latencies_ms.extend(latencies)
+
+        workers = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        result.elapsed = time.perf_counter() - started
+
+    return result
+
+def _create_schema(connection) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE book (id INTEGER PRIMARY KEY, available INTEGER NOT NULL)')
+        cursor.execute(
+            'CREATE TABLE loan (id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL REFERENCES book (id), '
+            'loan_date REAL NOT NULL)'
+        )
+        cursor.executemany('INSERT INTO book (id, available) VALUES (%s, %s)',
+                           [(book_id, COPIES) for book_id in range(1, BOOKS + 1)])
+
+def _checkout(connection, book_id: int) -> None:
+    with transaction.atomic(using=ALIAS):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT available FROM book WHERE id = %s', [book_id])
+            if cursor.fetchone()[0] > 0:
+                cursor.execute('UPDATE book SET available = available - 1 WHERE id = %s', [book_id])
+                cursor.execute('INSERT INTO loan (book_id, loan_date) VALUES (%s, %s)', [book_id, time.time()])
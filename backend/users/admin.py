@@ -1,5 +1,44 @@
 from django.contrib import admin
-from .models import UserProfile, BookLoan
+from django.db import transaction
+from books.models import ResourceVersion
+from books.services.requests import BookRequestService
+from .models import ArchivedLoan, UserProfile, BookLoan
+from .services.loans import LoanService
+
+def save_loan(loan):
+    """
+    Save an admin-edited loan, routing everything that takes or gives
+    back a copy through LoanService so inventory stays consistent:
+    checkouts, returns, reopening a returned loan and moving an active
+    loan to another book
+    """
+    if loan.pk is None:
+        return_date = loan.return_date
+        loan.return_date = None
+        LoanService.checkout(loan)
+        if return_date:
+            LoanService.return_loan(loan, return_date)
+        return
+
+    stored = BookLoan.objects.get(pk=loan.pk)
+    return_date = loan.return_date
+    was_active = stored.return_date is None
+    moved = loan.book_id != stored.book_id
+    with transaction.atomic():
+        # An active loan that is returned or moved gives its copy back to
+        # the book it was on; if it stays active it then takes one from
+        # its new book, as does a returned loan that is reopened.
+        if was_active and (return_date or moved):
+            LoanService.return_loan(stored, return_date)
+        if return_date is None and (moved or not was_active):
+            LoanService.checkout(loan)
+        else:
+            loan.save()
+        if was_active and (return_date or moved):
+            BookRequestService.allocate(stored.book_id)
+    # Editing the due date can move a loan between ACTIVE and OVERDUE, and
+    # editing the user moves it between profiles.
+    LoanService.reconcile_counters({stored.user_id, loan.user_id})
 
 class BookLoanInline(admin.TabularInline):
     model = BookLoan
@@ -11,19 +50,30 @@ class BookLoanInline(admin.TabularInline):
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ['username', 'email', 'is_admin', 'active_loans_count']
+    list_display = ['username', 'email', 'is_admin', 'active_loan_count', 'overdue_loan_count']
+    list_select_related = ['user']
+    readonly_fields = ['active_loan_count', 'overdue_loan_count']
     search_fields = ['user__username', 'user__email']
     inlines = [BookLoanInline]
 
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not BookLoan:
+            return super().save_formset(request, form, formset, change)
+
+        loans = formset.save(commit=False)
+        for loan_form in formset.forms:
+            if loan_form.instance in loans:
+                save_loan(loan_form.instance)
+        for loan in formset.deleted_objects:
+            loan.delete()
+        if formset.deleted_objects:
+            LoanService.reconcile_counters([form.instance.pk])
+
     def username(self, obj):
         return obj.user.username
 
     def email(self, obj):
         return obj.user.email
-
-    def active_loans_count(self, obj):
-        return obj.loans.filter(return_date__isnull=True).count()
-    active_loans_count.short_description = 'Active Loans'
     
 @admin.register(BookLoan)
 class BookLoanAdmin(admin.ModelAdmin):
@@ -31,3 +81,29 @@ class BookLoanAdmin(admin.ModelAdmin):
     list_filter = ['return_date', 'due_date']
     search_fields = ['user__user__username', 'book__title']
     raw_id_fields = ['user', 'book']
+
+    def save_model(self, request, obj, form, change):
+        save_loan(obj)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        LoanService.reconcile_counters([obj.user_id])
+
+    def delete_queryset(self, request, queryset):
+        profile_ids = set(queryset.values_list('user_id', flat=True))
+        ResourceVersion.touch(books=queryset.values_list('book_id', flat=True), profiles=profile_ids)
+        super().delete_queryset(request, queryset)
+        LoanService.reconcile_counters(profile_ids)
+
+@admin.register(ArchivedLoan)
+class ArchivedLoanAdmin(admin.ModelAdmin):
+    list_display = ['user', 'book', 'loan_date', 'return_date', 'archived_at']
+    list_select_related = ['user__user', 'book']
+    search_fields = ['user__user__username', 'book__title']
+    raw_id_fields = ['user', 'book']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,103 @@
+"""
+Stateless JWT authentication
+
+Access tokens carry the user's id, username, email, staff flag and profile
+id, so authenticating a request and checking ``is_staff`` reads nothing
+from the database. Claims are re-read from the database whenever a refresh
+token is exchanged, which also rotates it; a change such as losing staff
+rights takes effect at the latest when the current access token expires.
+"""
+
+from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .models import UserProfile
+
+def profile_id_for(user) -> int:
+    """
+    Profile id of an authenticated user, from the token when there is one
+    """
+    profile_id = getattr(user, 'profile_id', None)
+    return profile_id if profile_id is not None else user.profile.pk
+
+async def aprofile_id_for(user) -> int:
+    """
+    Async version of profile_id_for, for views that run on the event loop
+    """
+    profile_id = getattr(user, 'profile_id', None)
+    if profile_id is not None:
+        return profile_id
+    return await UserProfile.objects.filter(user=user).values_list('pk', flat=True).afirst()
+
+async def authenticate_async(request):
+    """
+    Authenticate a plain Django request the way the DRF views do
+
+    A bearer token is checked first, without touching the database, and
+    the session is the fallback. Returns the user, or None when neither
+    identifies an active user; an invalid token is treated like no token.
+    """
+    try:
+        result = JWTStatelessUserAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    if result is not None:
+        return result[0]
+
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+class ClaimsUser(TokenUser):
+    """
+    Request user built from access token claims
+
+    The profile is only loaded when a view needs more than its id.
+    """
+
+    @cached_property
+    def email(self) -> str:
+        return self.token.get('email', '')
+
+    @cached_property
+    def profile_id(self):
+        return self.token.get('profile_id')
+
+    @cached_property
+    def profile(self) -> UserProfile:
+        return UserProfile.objects.select_related('user').get(pk=self.profile_id)
+
+class LibraryTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['email'] = user.email
+        token['is_staff'] = user.is_staff
+        token['profile_id'] = user.profile.pk
+        return token
+
+class LibraryTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Exchange a refresh token for a new pair with up-to-date claims
+
+    The refresh token is single use: it is blacklisted and replaced, so a
+    stolen token stops working as soon as either party refreshes.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.select_related('profile').filter(
+            **{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}
+        ).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        if api_settings.BLACKLIST_AFTER_ROTATION:
+            refresh.blacklist()
+        new_refresh = LibraryTokenObtainPairSerializer.get_token(user)
+        return {'access': str(new_refresh.access_token), 'refresh': str(new_refresh)}
@@ -0,0 +1,26 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from users.services.loans import LoanService
+
+class Command(BaseCommand):
+    help = 'Move loans returned more than --months months ago into the loan archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=12,
+                          help='Archive loans returned more than this many months ago')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                          help='Number of loans moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['months'] < 0:
+            raise CommandError('--months must not be negative')
+
+        before = timezone.now() - timedelta(days=30 * options['months'])
+        stats = LoanService.archive_returned(before, batch_size=options['batch_size'])
+
+        rate = stats.archived / stats.elapsed if stats.elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {stats.archived} loans returned before {stats.before:%Y-%m-%d %H:%M:%S} '
+            f'in {stats.batches} batches in {stats.elapsed:.2f}s, {rate:.0f} loans/s'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from users.services.stats import CirculationStats
+
+class Command(BaseCommand):
+    help = 'Recompute the daily circulation statistics from the loans and requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since',
+                          help='Only recompute this day (YYYY-MM-DD) and later')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since must be a date (YYYY-MM-DD)')
+
+        written = CirculationStats.rebuild(since)
+        scope = f'from {since:%Y-%m-%d}' if since else 'for all days'
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} statistics rows {scope}'))
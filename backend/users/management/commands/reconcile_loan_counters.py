@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from users.models import UserProfile
+from users.services.loans import LoanService
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized active and overdue loan counters on user profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                          help='Number of profiles checked per query')
+        parser.add_argument('--dry-run', action='store_true',
+                          help='Report drifted profiles without repairing them')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        batch_size = options['batch_size']
+        checked = drifted = 0
+        last_pk = 0
+
+        while True:
+            batch = list(
+                UserProfile.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            drifted += LoanService.reconcile_counters(batch, dry_run=options['dry_run'])
+            checked += len(batch)
+            last_pk = batch[-1]
+
+        verb = 'would be repaired' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} profiles in {time.monotonic() - started:.2f}s; {drifted} {verb}'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from users.services.loans import LoanService
+
+class Command(BaseCommand):
+    help = 'Mark active loans that are past their due date as OVERDUE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                          help='Number of loans updated per statement')
+        parser.add_argument('--full', action='store_true',
+                          help='Check every active loan instead of only those due since the last run')
+
+    def handle(self, *args, **options):
+        stats = LoanService.sweep_overdue(batch_size=options['batch_size'], full=options['full'])
+
+        since = f'{stats.since:%Y-%m-%d %H:%M:%S}' if stats.since else 'the beginning'
+        rate = stats.swept / stats.elapsed if stats.elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Marked {stats.swept} loans overdue in {stats.batches} batches '
+            f'({since} to {stats.until:%Y-%m-%d %H:%M:%S}) '
+            f'in {stats.elapsed:.2f}s, {rate:.0f} loans/s'
+        ))
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_loan_counters(apps, schema_editor):
+    BookLoan = apps.get_model('users', 'BookLoan')
+    UserProfile = apps.get_model('users', 'UserProfile')
+    active = BookLoan.objects.filter(user=OuterRef('pk'), return_date__isnull=True)
+
+    def count(loans):
+        return Coalesce(Subquery(
+            loans.order_by().values('user').annotate(total=Count('pk')).values('total')
+        ), 0)
+
+    UserProfile.objects.update(
+        active_loan_count=count(active),
+        overdue_loan_count=count(active.filter(status='OVERDUE'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_bookloan_status_userprofile_full_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='active_loan_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='overdue_loan_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_loan_counters, migrations.RunPython.noop),
+    ]
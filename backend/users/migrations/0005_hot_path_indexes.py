@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_hot_path_indexes'),
+        ('users', '0004_overdue_sweep'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(fields=['user', 'return_date'], name='bookloan_user_return_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(fields=['-loan_date'], name='bookloan_loan_date_idx'),
+        ),
+    ]
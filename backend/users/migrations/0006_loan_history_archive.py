@@ -0,0 +1,47 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_resourceversion'),
+        ('users', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLoan',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('loan_date', models.DateTimeField()),
+                ('return_date', models.DateTimeField()),
+                ('due_date', models.DateTimeField()),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('RETURNED', 'Returned'), ('OVERDUE', 'Overdue')], default='RETURNED', max_length=20)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-loan_date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(fields=['user', 'loan_date'], name='bookloan_user_loan_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedloan',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to='books.book'),
+        ),
+        migrations.AddField(
+            model_name='archivedloan',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to='users.userprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedloan',
+            index=models.Index(fields=['user', 'loan_date'], name='archivedloan_user_date_idx'),
+        ),
+    ]
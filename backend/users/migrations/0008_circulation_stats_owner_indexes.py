@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_resourceversion'),
+        ('users', '0007_circulation_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailybookstats',
+            index=models.Index(fields=['book', 'day'], name='dailybookstats_book_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyuserstats',
+            index=models.Index(fields=['user', 'day'], name='dailyuserstats_user_day_idx'),
+        ),
+    ]
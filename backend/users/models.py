@@ -1,18 +1,23 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save
 from django.dispatch import receiver
-from books.models import Book
+from books.models import Book, ResourceVersion
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 class UserProfile(models.Model):
+    MAX_ALLOWED_LOANS = 5
+
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
         related_name='profile'
     )
     full_name = models.CharField(max_length=255, blank=True)
+    # Maintained by LoanService; repair drift with reconcile_loan_counters.
+    active_loan_count = models.PositiveIntegerField(default=0)
+    overdue_loan_count = models.PositiveIntegerField(default=0)
     books_on_loan = models.ManyToManyField(
         Book,
         through='BookLoan',
@@ -25,14 +30,11 @@ class UserProfile(models.Model):
     
     @property
     def active_loans_count(self):
-        return self.loans.filter(return_date__isnull=True).count()
+        return self.active_loan_count
     
     @property
     def has_overdue_books(self):
-        return self.loans.filter(
-            return_date__isnull=True,
-            due_date__lt=timezone.now()
-        ).exists()
+        return self.overdue_loan_count > 0
 
     def __str__(self):
         return f"{self.user.username}'s profile"
@@ -41,8 +43,14 @@ class UserProfile(models.Model):
         return self.loans.filter(return_date__isnull=True)
     
     def can_borrow_books(self):
-        max_allowed_loans = 5
-        return self.active_loans_count < max_allowed_loans
+        return self.active_loan_count < self.MAX_ALLOWED_LOANS
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        # Nothing can have been cached from a profile that did not exist.
+        if not adding:
+            ResourceVersion.touch(profiles=[self.pk])
 
 class BookLoan(models.Model):
     LOAN_STATUS = [
@@ -68,6 +76,14 @@ class BookLoan(models.Model):
 
     class Meta:
         ordering = ['-loan_date']
+        indexes = [
+            # Serves the overdue sweep: active loans by due date.
+            models.Index(fields=['return_date', 'due_date'], name='bookloan_return_due_idx'),
+            models.Index(fields=['user', 'return_date'], name='bookloan_user_return_idx'),
+            # Serves the paginated loan history: one user's loans by date.
+            models.Index(fields=['user', 'loan_date'], name='bookloan_user_loan_date_idx'),
+            models.Index(fields=['-loan_date'], name='bookloan_loan_date_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'book'],
@@ -76,10 +92,6 @@ class BookLoan(models.Model):
             )
         ]
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._original_return_date = self.return_date if self.pk else None
-
     def __str__(self):
         return f"{self.book.title} loaned to {self.user.user.username}"
     
@@ -96,10 +108,6 @@ class BookLoan(models.Model):
                 raise ValidationError('User already has this book on loan.')
 
     def save(self, *args, **kwargs):
-        if not self.id:
-            self.book.available_copies -= 1
-            self.book.save()
-        
         if not self.return_date:
             if self.due_date < timezone.now():
                 self.status = 'OVERDUE'
@@ -109,33 +117,122 @@ class BookLoan(models.Model):
             self.status = 'RETURNED'
         
         super().save(*args, **kwargs)
+        ResourceVersion.touch(books=[self.book_id], profiles=[self.user_id])
+
+    def delete(self, *args, **kwargs):
+        ResourceVersion.touch(books=[self.book_id], profiles=[self.user_id])
+        return super().delete(*args, **kwargs)
+
+class ArchivedLoan(models.Model):
+    """
+    A returned loan moved out of BookLoan by the archive_loans job, so the
+    live table only holds recent loans; keeps the loan's original id
+    """
+    id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(
+        UserProfile,
+        on_delete=models.CASCADE,
+        related_name='archived_loans'
+    )
+    book = models.ForeignKey(
+        'books.Book',
+        on_delete=models.CASCADE,
+        related_name='archived_loans'
+    )
+    loan_date = models.DateTimeField()
+    return_date = models.DateTimeField()
+    due_date = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=BookLoan.LOAN_STATUS, default='RETURNED')
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-loan_date']
+        indexes = [
+            models.Index(fields=['user', 'loan_date'], name='archivedloan_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book.title} loaned to {self.user.user.username} (archived)"
+
+class DailyBookStats(models.Model):
+    """
+    Checkouts, returns, late returns and requests of one book on one day,
+    kept up to date by CirculationStats; repair with rebuild_stats
+    """
+    day = models.DateField()
+    book = models.ForeignKey(
+        'books.Book',
+        on_delete=models.CASCADE,
+        related_name='daily_stats',
+        db_index=False
+    )
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    # Returns made after the loan's due date.
+    late_returns = models.PositiveIntegerField(default=0)
+    requests = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'book'], name='dailybookstats_day_book_uniq'),
+        ]
+        # Stands in for the foreign key index (db_index=False above): it
+        # serves cascade deletes and a single book's history.
+        indexes = [
+            models.Index(fields=['book', 'day'], name='dailybookstats_book_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} on {self.day}"
+
+class DailyUserStats(models.Model):
+    """
+    Checkouts, returns, late returns and requests of one user on one day
+    """
+    day = models.DateField()
+    user = models.ForeignKey(
+        UserProfile,
+        on_delete=models.CASCADE,
+        related_name='daily_stats',
+        db_index=False
+    )
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    late_returns = models.PositiveIntegerField(default=0)
+    requests = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='dailyuserstats_day_user_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'day'], name='dailyuserstats_user_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} on {self.day}"
+
+class Watermark(models.Model):
+    """
+    High-water mark of an incremental maintenance job, such as the
+    overdue loan sweep
+    """
+    name = models.CharField(max_length=100, unique=True)
+    value = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.value:%Y-%m-%d %H:%M:%S}"
+
+    @classmethod
+    def get(cls, name):
+        return cls.objects.filter(name=name).values_list('value', flat=True).first()
+
+    @classmethod
+    def advance(cls, name, value):
+        cls.objects.update_or_create(name=name, defaults={'value': value})
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
-
-@receiver(pre_save, sender=BookLoan)
-def handle_returned_book(sender, instance, **kwargs):
-    try:
-        old_instance = BookLoan.objects.get(pk=instance.pk)
-        if instance.return_date and not old_instance.return_date:
-            instance.book.available_copies += 1
-            instance.book.save()
-    except BookLoan.DoesNotExist:
-        pass
-
-@receiver(post_save, sender=BookLoan)
-def update_book_availability(sender, instance, created, **kwargs):
-    if created:
-        book = instance.book
-        book.available_copies = max(0, book.available_copies - 1)
-        book.save()
-    elif instance.return_date and not instance._original_return_date:
-        book = instance.book
-        book.available_copies += 1
-        book.save()
@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
 from django.utils import timezone
-from .models import UserProfile, BookLoan
+from .models import ArchivedLoan, UserProfile, BookLoan
 from books.serializers import BookSerializer
 
 class BookLoanSerializer(serializers.ModelSerializer):
@@ -21,38 +22,69 @@ class BookLoanSerializer(serializers.ModelSerializer):
             return max(0, remaining)
         return None
 
+class ArchivedLoanSerializer(BookLoanSerializer):
+    class Meta(BookLoanSerializer.Meta):
+        model = ArchivedLoan
+
 class UserProfileSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     email = serializers.CharField(source='user.email', read_only=True)
-    active_loans = BookLoanSerializer(
-        source='loans',
-        many=True,
-        read_only=True
-    )
-    loans = serializers.SerializerMethodField()
+    active_loans = serializers.SerializerMethodField()
     can_borrow = serializers.SerializerMethodField()
     
     class Meta:
         model = UserProfile
-        fields = ['id', 'username', 'email', 'full_name', 'is_admin', 'active_loans', 'loans', 'can_borrow']
+        fields = ['id', 'username', 'email', 'full_name', 'is_admin', 'active_loans', 'can_borrow']
     
     def get_is_admin(self, obj):
         return obj.is_staff
 
-    def get_active_loans(self, obj):
-        active_loans = obj.loans.filter(return_date__isnull=True)
-        return BookLoanSerializer(active_loans, many=True).data
+    def _active_loans(self, obj):
+        if hasattr(obj, 'active_loan_list'):
+            return obj.active_loan_list
+        return obj.loans.filter(return_date__isnull=True).select_related('book', 'user__user')
 
-    def get_loans(self, obj):
-        completed_loans = obj.loans.filter(return_date__isnull=False)
-        return BookLoanSerializer(completed_loans, many=True).data
+    def get_active_loans(self, obj):
+        return BookLoanSerializer(self._active_loans(obj), many=True).data
 
     def get_can_borrow(self, obj):
         return obj.can_borrow_books()
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    """
+    Compact user representation for listings and pickers, read from the
+    profile's maintained loan counter instead of the loans themselves
+    """
+    active_loan_count = serializers.IntegerField(source='profile.active_loan_count', read_only=True)
+    can_borrow = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'active_loan_count', 'can_borrow']
+
+    def get_can_borrow(self, obj):
+        return obj.profile.can_borrow_books()
+
 class UserSerializer(serializers.ModelSerializer):
     profile = UserProfileSerializer(read_only=True)
     
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'is_staff','profile']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load users with their profile and active loans in a fixed number of queries
+
+        The active loans are attached as active_loan_list, which
+        UserProfileSerializer uses instead of querying per user. Past loans
+        are served page by page by the loan history endpoints.
+        """
+        return queryset.select_related('profile').prefetch_related(
+            Prefetch(
+                'profile__loans',
+                queryset=BookLoan.objects.select_related('book').filter(return_date__isnull=True),
+                to_attr='active_loan_list'
+            )
+        )
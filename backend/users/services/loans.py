@@ -0,0 +1,462 @@
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from books.models import Book, ResourceVersion
+from users.models import ArchivedLoan, BookLoan, UserProfile, Watermark
+from users.services.stats import CirculationStats
+
+@dataclass
+class SweepStats:
+    """
+    Outcome of one overdue sweep
+    """
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    batches: int = 0
+    swept: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+@dataclass
+class ArchiveStats:
+    """
+    Outcome of one archive run
+    """
+    before: Optional[datetime] = None
+    batches: int = 0
+    archived: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+class LoanService:
+    """
+    Checkout and return of book loans
+
+    Inventory is only ever changed with a single conditional UPDATE, so two
+    concurrent checkouts can never both take the last copy and a loan can
+    never be returned twice. The same goes for the active and overdue loan
+    counters on UserProfile, which are updated in the same transaction.
+    """
+
+    LOAN_PERIOD = timedelta(days=14)
+    MAX_BATCH = 1000
+    OVERDUE_WATERMARK = 'overdue-sweep'
+
+    @classmethod
+    def checkout(cls, loan: BookLoan) -> BookLoan:
+        """
+        Save a new loan and take one copy of its book
+
+        Args:
+            loan (BookLoan): Unsaved loan with user and book set. A missing
+                due_date defaults to LOAN_PERIOD from now.
+
+        Returns:
+            The saved loan
+
+        Raises:
+            ValidationError: If no copy is available (code 'unavailable'),
+                the user is at the loan limit or already has this book on
+                loan
+        """
+        if loan.due_date is None:
+            loan.due_date = timezone.now() + cls.LOAN_PERIOD
+
+        with transaction.atomic():
+            taken = Book.objects.filter(
+                pk=loan.book_id,
+                available_copies__gt=0
+            ).update(available_copies=F('available_copies') - 1)
+            if not taken:
+                raise ValidationError('Book not available', code='unavailable')
+
+            # Checking the limit and taking a slot in one statement also
+            # serialises checkouts by the same user on the profile row.
+            counted = UserProfile.objects.filter(
+                pk=loan.user_id,
+                active_loan_count__lt=UserProfile.MAX_ALLOWED_LOANS
+            ).update(active_loan_count=F('active_loan_count') + 1)
+            if not counted:
+                raise ValidationError('User has reached maximum allowed loans')
+
+            # The partial unique constraint on active loans rejects a
+            # duplicate; raising out of the atomic block rolls back the
+            # inventory and counter changes above.
+            try:
+                loan.save()
+            except IntegrityError:
+                raise ValidationError('User already has this book on loan')
+
+            if loan.status == 'OVERDUE':
+                UserProfile.objects.filter(pk=loan.user_id).update(
+                    overdue_loan_count=F('overdue_loan_count') + 1
+                )
+            CirculationStats.record(CirculationStats.loan_events([loan]))
+
+        # Keep an already loaded book in step without re-reading it.
+        if BookLoan._meta.get_field('book').is_cached(loan):
+            loan.book.available_copies = max(0, loan.book.available_copies - 1)
+        return loan
+
+    @classmethod
+    def checkout_many(cls, loans: List[BookLoan]) -> List[Optional[str]]:
+        """
+        Check out many new loans at once, first come first served
+
+        Copies and loan slots are handed out in list order, so callers
+        control fairness by sorting the loans. Inventory and counters are
+        read once, allocated in memory and written back with a handful of
+        set-based UPDATEs, and the accepted loans are inserted with
+        bulk_create, all in one transaction.
+
+        Args:
+            loans: Unsaved loans with user_id and book_id set. A missing
+                due_date defaults to LOAN_PERIOD from now.
+
+        Returns:
+            One entry per loan: None if it was saved, otherwise the reason
+            it was refused, using the same messages as checkout
+        """
+        now = timezone.now()
+        errors: List[Optional[str]] = [None] * len(loans)
+        user_ids = {loan.user_id for loan in loans}
+        book_ids = {loan.book_id for loan in loans}
+
+        # Nothing in here is expected to fail half way, so an enclosing
+        # transaction is joined without a savepoint.
+        with transaction.atomic(savepoint=False):
+            copies = dict(cls._for_update(Book.objects.filter(pk__in=book_ids))
+                          .values_list('pk', 'available_copies'))
+            active = dict(cls._for_update(UserProfile.objects.filter(pk__in=user_ids))
+                          .values_list('pk', 'active_loan_count'))
+            on_loan = set(BookLoan.objects.filter(
+                user_id__in=user_ids,
+                book_id__in=book_ids,
+                return_date__isnull=True
+            ).values_list('user_id', 'book_id'))
+
+            accepted = []
+            for index, loan in enumerate(loans):
+                if copies.get(loan.book_id, 0) < 1:
+                    errors[index] = 'Book not available'
+                elif loan.user_id not in active:
+                    errors[index] = 'User not found'
+                elif active[loan.user_id] >= UserProfile.MAX_ALLOWED_LOANS:
+                    errors[index] = 'User has reached maximum allowed loans'
+                elif (loan.user_id, loan.book_id) in on_loan:
+                    errors[index] = 'User already has this book on loan'
+                else:
+                    copies[loan.book_id] -= 1
+                    active[loan.user_id] += 1
+                    on_loan.add((loan.user_id, loan.book_id))
+                    if loan.due_date is None:
+                        loan.due_date = now + cls.LOAN_PERIOD
+                    loan.status = 'OVERDUE' if loan.due_date < now else 'ACTIVE'
+                    accepted.append(loan)
+
+            if accepted:
+                cls._add_counts(Book, 'available_copies', {
+                    book_id: -taken for book_id, taken in Counter(loan.book_id for loan in accepted).items()
+                })
+                cls._add_counts(UserProfile, 'active_loan_count', Counter(loan.user_id for loan in accepted))
+                cls._add_counts(UserProfile, 'overdue_loan_count', Counter(
+                    loan.user_id for loan in accepted if loan.status == 'OVERDUE'
+                ))
+                BookLoan.objects.bulk_create(accepted, batch_size=500)
+                CirculationStats.record(CirculationStats.loan_events(accepted))
+                ResourceVersion.touch(
+                    books=[loan.book_id for loan in accepted],
+                    profiles=[loan.user_id for loan in accepted]
+                )
+
+        return errors
+
+    @classmethod
+    def return_loan(cls, loan: BookLoan, return_date: Optional[datetime] = None) -> BookLoan:
+        """
+        Mark a loan returned and put its copy back into inventory
+
+        Raises:
+            ValidationError: If the loan was already returned
+        """
+        return_date = return_date or timezone.now()
+
+        with transaction.atomic():
+            active = BookLoan.objects.filter(pk=loan.pk, return_date__isnull=True)
+            # Try the common on-time case first; only an overdue return
+            # needs the second statement.
+            overdue = 0
+            returned = active.exclude(status='OVERDUE').update(return_date=return_date, status='RETURNED')
+            if not returned:
+                overdue = active.update(return_date=return_date, status='RETURNED')
+                if not overdue:
+                    raise ValidationError('Book already returned')
+
+            Book.objects.filter(pk=loan.book_id).update(
+                available_copies=F('available_copies') + 1
+            )
+            UserProfile.objects.filter(pk=loan.user_id).update(
+                active_loan_count=Greatest(F('active_loan_count') - 1, Value(0)),
+                overdue_loan_count=Greatest(F('overdue_loan_count') - overdue, Value(0))
+            )
+            CirculationStats.record(CirculationStats.return_events(
+                [(loan.book_id, loan.user_id, loan.due_date)], return_date
+            ))
+            ResourceVersion.touch(books=[loan.book_id], profiles=[loan.user_id])
+
+        loan.return_date = return_date
+        loan.status = 'RETURNED'
+        if BookLoan._meta.get_field('book').is_cached(loan):
+            loan.book.available_copies += 1
+        return loan
+
+    @classmethod
+    def return_many(cls, loans: List[BookLoan], return_date: Optional[datetime] = None) -> List[Optional[str]]:
+        """
+        Return many loans at once
+
+        The active loans among them are locked and read once, marked
+        returned with one UPDATE, and their copies and the owners' counters
+        are put back with set-based UPDATEs, all in one transaction.
+
+        Args:
+            loans: Saved loans
+            return_date: Defaults to the current time
+
+        Returns:
+            One entry per loan: None if it was returned, otherwise the
+            reason it was refused, using the same messages as return_loan
+        """
+        return_date = return_date or timezone.now()
+        errors: List[Optional[str]] = [None] * len(loans)
+
+        with transaction.atomic(savepoint=False):
+            active, due_dates = {}, {}
+            for pk, user_id, book_id, status, due_date in cls._for_update(BookLoan.objects.filter(
+                pk__in={loan.pk for loan in loans},
+                return_date__isnull=True
+            )).values_list('pk', 'user_id', 'book_id', 'status', 'due_date'):
+                active[pk] = (user_id, book_id, status)
+                due_dates[pk] = due_date
+
+            returned = {}
+            for index, loan in enumerate(loans):
+                if loan.pk in returned or loan.pk not in active:
+                    errors[index] = 'Book already returned'
+                else:
+                    returned[loan.pk] = active[loan.pk]
+
+            if returned:
+                BookLoan.objects.filter(pk__in=list(returned)).update(return_date=return_date, status='RETURNED')
+                cls._add_counts(Book, 'available_copies', Counter(book_id for _, book_id, _ in returned.values()))
+                cls._add_counts(UserProfile, 'active_loan_count', {
+                    user_id: -count for user_id, count in Counter(user_id for user_id, _, _ in returned.values()).items()
+                })
+                cls._add_counts(UserProfile, 'overdue_loan_count', {
+                    user_id: -count for user_id, count in Counter(
+                        user_id for user_id, _, status in returned.values() if status == 'OVERDUE'
+                    ).items()
+                })
+                CirculationStats.record(CirculationStats.return_events(
+                    [(book_id, user_id, due_dates[pk]) for pk, (user_id, book_id, _) in returned.items()],
+                    return_date
+                ))
+                ResourceVersion.touch(
+                    books=[book_id for _, book_id, _ in returned.values()],
+                    profiles=[user_id for user_id, _, _ in returned.values()]
+                )
+
+        for loan, error in zip(loans, errors):
+            if error is None:
+                loan.return_date = return_date
+                loan.status = 'RETURNED'
+        return errors
+
+    @classmethod
+    def counter_expressions(cls) -> dict:
+        """
+        Subquery expressions computing each profile's loan counters from
+        its loans, keyed by counter field name
+        """
+        active = BookLoan.objects.filter(user=OuterRef('pk'), return_date__isnull=True)
+
+        def count(loans):
+            return Coalesce(Subquery(
+                loans.order_by().values('user').annotate(total=Count('pk')).values('total')
+            ), 0)
+
+        return {
+            'active_loan_count': count(active),
+            'overdue_loan_count': count(active.filter(status='OVERDUE')),
+        }
+
+    @classmethod
+    def reconcile_counters(cls, profile_ids: Optional[Iterable[int]] = None, dry_run: bool = False) -> int:
+        """
+        Recompute the loan counters of profiles whose stored values drifted
+
+        Args:
+            profile_ids: Profiles to check; all profiles when omitted
+            dry_run (bool): Only count the drifted profiles
+
+        Returns:
+            Number of profiles whose counters were wrong
+        """
+        profiles = UserProfile.objects.all()
+        if profile_ids is not None:
+            profiles = profiles.filter(pk__in=list(profile_ids))
+
+        expressions = cls.counter_expressions()
+        drifted = list(
+            profiles.annotate(
+                actual_active=expressions['active_loan_count'],
+                actual_overdue=expressions['overdue_loan_count']
+            ).exclude(
+                active_loan_count=F('actual_active'),
+                overdue_loan_count=F('actual_overdue')
+            ).values_list('pk', flat=True)
+        )
+        if drifted and not dry_run:
+            with transaction.atomic():
+                UserProfile.objects.filter(pk__in=drifted).update(**expressions)
+                ResourceVersion.touch(profiles=drifted)
+        return len(drifted)
+
+    @classmethod
+    def sweep_overdue(cls, batch_size: int = 1000, full: bool = False,
+                      now: Optional[datetime] = None) -> SweepStats:
+        """
+        Mark active loans that are past due as OVERDUE
+
+        Only loans that came due since the previous sweep are considered,
+        unless full is set; checkouts and edits already store the right
+        status for anything older. Each batch is one transaction: select
+        the ids through the (return_date, due_date) index, flip them with
+        one conditional UPDATE and add them to the owners' overdue
+        counters.
+
+        Args:
+            batch_size (int): Number of loans updated per statement
+            full (bool): Ignore the watermark and check every active loan
+            now: Cut-off time, defaults to the current time
+
+        Returns:
+            SweepStats with the swept window, batch and loan counts
+        """
+        stats = SweepStats(
+            since=None if full else Watermark.get(cls.OVERDUE_WATERMARK),
+            until=now or timezone.now()
+        )
+        due = BookLoan.objects.filter(
+            return_date__isnull=True,
+            due_date__lt=stats.until,
+            status='ACTIVE'
+        )
+        if stats.since is not None:
+            due = due.filter(due_date__gte=stats.since)
+        if connection.features.has_select_for_update_skip_locked:
+            # Lets overlapping sweeps split the work instead of counting
+            # the same loans twice.
+            due = due.select_for_update(skip_locked=True)
+
+        # Walk the index in due-date order so each batch starts where the
+        # previous one stopped instead of rescanning flipped rows.
+        cursor = None
+        while True:
+            with transaction.atomic():
+                batch = due if cursor is None else due.filter(due_date__gte=cursor)
+                loans = list(batch.order_by('due_date').values_list('pk', 'user_id', 'due_date')[:batch_size])
+                if not loans:
+                    break
+                swept = BookLoan.objects.filter(
+                    pk__in=[pk for pk, _, _ in loans],
+                    return_date__isnull=True,
+                    status='ACTIVE'
+                ).update(status='OVERDUE')
+
+                # The selected rows are locked (or, on SQLite, the write
+                # would fail on a stale snapshot), so every one was
+                # flipped.
+                cls._add_counts(UserProfile, 'overdue_loan_count', Counter(user_id for _, user_id, _ in loans))
+                ResourceVersion.touch(profiles=[user_id for _, user_id, _ in loans])
+
+            cursor = loans[-1][2]
+            stats.batches += 1
+            stats.swept += swept
+
+        Watermark.advance(cls.OVERDUE_WATERMARK, stats.until)
+        return stats
+
+    @classmethod
+    def archive_returned(cls, before: datetime, batch_size: int = 1000) -> ArchiveStats:
+        """
+        Move loans returned before a cut-off from BookLoan to ArchivedLoan
+
+        Only returned loans move, so inventory and the loan counters are
+        unaffected. Each batch is one transaction: select the oldest
+        returned loans through the (return_date, due_date) index, copy
+        them with one INSERT and delete them with one DELETE. A loan that
+        is already in the archive, say from an interrupted run, is kept as
+        it is and only removed from BookLoan.
+
+        Args:
+            before: Loans returned before this time are archived
+            batch_size (int): Number of loans moved per transaction
+
+        Returns:
+            ArchiveStats with the cut-off, batch and loan counts
+        """
+        stats = ArchiveStats(before=before)
+        columns = ['pk', 'user_id', 'book_id', 'loan_date', 'return_date', 'due_date', 'status']
+        returned = BookLoan.objects.filter(return_date__lt=before).order_by('return_date')
+
+        while True:
+            with transaction.atomic():
+                rows = list(returned.values_list(*columns)[:batch_size])
+                if not rows:
+                    break
+                ArchivedLoan.objects.bulk_create(
+                    [ArchivedLoan(**dict(zip(columns, row))) for row in rows],
+                    ignore_conflicts=True
+                )
+                BookLoan.objects.filter(pk__in=[row[0] for row in rows]).delete()
+
+            stats.batches += 1
+            stats.archived += len(rows)
+
+        return stats
+
+    @classmethod
+    def _for_update(cls, queryset):
+        if connection.features.has_select_for_update:
+            return queryset.select_for_update()
+        return queryset
+
+    @classmethod
+    def _add_counts(cls, model, field_name: str, counts: Dict[int, int]) -> None:
+        """
+        Add a per-row amount to a counter column with one UPDATE per
+        distinct amount, which is much cheaper than a CASE or a correlated
+        subquery per row
+        """
+        by_amount = defaultdict(list)
+        for pk, amount in counts.items():
+            if amount:
+                by_amount[amount].append(pk)
+        for amount, pks in by_amount.items():
+            # Counters never go below zero, even if they had drifted.
+            value = F(field_name) + amount if amount > 0 else Greatest(F(field_name) + amount, Value(0))
+            model.objects.filter(pk__in=pks).update(**{field_name: value})
@@ -0,0 +1,194 @@
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+from books.models import BookRequest
+from users.models import ArchivedLoan, BookLoan, DailyBookStats, DailyUserStats
+
+FIELDS = ('loans', 'returns', 'late_returns', 'requests')
+
+@dataclass
+class Event:
+    """
+    Something that happened to a book and a user, counted under ``field``
+    on the day of ``moment``
+    """
+    field: str
+    moment: datetime
+    book_id: int
+    profile_id: int
+
+class CirculationStats:
+    """
+    Daily per-book and per-user circulation rollups and the dashboard
+    read from them
+
+    Checkouts, returns and requests add to the rollups in the transaction
+    that makes them, so the dashboard only ever reads the rollup rows of
+    the days it shows and never the loan or request history itself. Each
+    write is a single INSERT ... ON CONFLICT DO UPDATE that adds to the
+    counts, so concurrent writers never lose one.
+    """
+
+    MAX_DAYS = 366
+    MAX_LIMIT = 50
+    UPSERT_BATCH = 500
+
+    @classmethod
+    def record(cls, events: Iterable[Event]) -> None:
+        """
+        Add the events to the rollups of their books and users
+        """
+        by_book: Dict[Tuple[date, int], Counter] = defaultdict(Counter)
+        by_user: Dict[Tuple[date, int], Counter] = defaultdict(Counter)
+        for event in events:
+            day = timezone.localdate(event.moment)
+            by_book[day, event.book_id][event.field] += 1
+            by_user[day, event.profile_id][event.field] += 1
+        cls._add(DailyBookStats, 'book_id', by_book)
+        cls._add(DailyUserStats, 'user_id', by_user)
+
+    @classmethod
+    def loan_events(cls, loans: Iterable[BookLoan]) -> List[Event]:
+        return [Event('loans', loan.loan_date, loan.book_id, loan.user_id) for loan in loans]
+
+    @classmethod
+    def return_events(cls, returns: Iterable[Tuple[int, int, datetime]], return_date: datetime) -> List[Event]:
+        """
+        Events for loans returned at return_date, given as
+        (book_id, profile_id, due_date)
+        """
+        events = []
+        for book_id, profile_id, due_date in returns:
+            events.append(Event('returns', return_date, book_id, profile_id))
+            if due_date and return_date > due_date:
+                events.append(Event('late_returns', return_date, book_id, profile_id))
+        return events
+
+    @classmethod
+    def rebuild(cls, since: Optional[date] = None) -> int:
+        """
+        Recompute the rollups from the loans, archived loans and requests
+
+        Args:
+            since: Only recompute this day and later; everything by default
+
+        Returns:
+            The number of rollup rows written
+        """
+        start = timezone.make_aware(datetime.combine(since, time.min)) if since else None
+        sources = [
+            ('loans', BookLoan.objects.all(), 'loan_date'),
+            ('loans', ArchivedLoan.objects.all(), 'loan_date'),
+            ('returns', BookLoan.objects.filter(return_date__isnull=False), 'return_date'),
+            ('returns', ArchivedLoan.objects.all(), 'return_date'),
+            ('late_returns', BookLoan.objects.filter(return_date__gt=F('due_date')), 'return_date'),
+            ('late_returns', ArchivedLoan.objects.filter(return_date__gt=F('due_date')), 'return_date'),
+            ('requests', BookRequest.objects.all(), 'request_date'),
+        ]
+
+        written = 0
+        with transaction.atomic():
+            for model, key in ((DailyBookStats, 'book_id'), (DailyUserStats, 'user_id')):
+                rows: Dict[Tuple[date, int], Counter] = defaultdict(Counter)
+                for field, queryset, moment in sources:
+                    if start:
+                        queryset = queryset.filter(**{f'{moment}__gte': start})
+                    grouped = queryset.order_by().annotate(day=TruncDate(moment)).values_list('day', key)
+                    for day, pk, count in grouped.annotate(count=Count('pk')):
+                        rows[day, pk][field] += count
+
+                stale = model.objects.all()
+                if since:
+                    stale = stale.filter(day__gte=since)
+                stale.delete()
+                model.objects.bulk_create(
+                    [model(day=day, **{key: pk}, **counts) for (day, pk), counts in rows.items()],
+                    batch_size=1000
+                )
+                written += len(rows)
+        return written
+
+    @classmethod
+    def dashboard(cls, days: int = 30, limit: int = 10) -> dict:
+        """
+        Loans per day, the most borrowed books and the users with the
+        highest share of late returns over the last ``days`` days
+
+        Reads at most ``days`` rollup rows per book and user that had any
+        activity in the window, whatever the size of the history.
+        """
+        until = timezone.localdate()
+        since = until - timedelta(days=days - 1)
+        books = DailyBookStats.objects.filter(day__range=(since, until))
+        users = DailyUserStats.objects.filter(day__range=(since, until))
+
+        per_day = list(
+            books.order_by('day').values('day').annotate(**{field: Sum(field) for field in FIELDS})
+        )
+        most_borrowed = list(
+            books.values('book_id', 'book__title').annotate(loans=Sum('loans'))
+            .filter(loans__gt=0).order_by('-loans', 'book_id')[:limit]
+        )
+        overdue = list(
+            users.values('user_id', 'user__user__username')
+            .annotate(returns=Sum('returns'), late_returns=Sum('late_returns'))
+            .filter(late_returns__gt=0)
+            .annotate(overdue_rate=Cast('late_returns', FloatField()) / F('returns'))
+            .order_by('-overdue_rate', '-late_returns', 'user_id')[:limit]
+        )
+
+        return {
+            'since': since,
+            'until': until,
+            'totals': {field: sum(row[field] for row in per_day) for field in FIELDS},
+            'loans_per_day': per_day,
+            'most_borrowed': [
+                {'book_id': row['book_id'], 'title': row['book__title'], 'loans': row['loans']}
+                for row in most_borrowed
+            ],
+            'overdue_rates': [
+                {
+                    'profile_id': row['user_id'],
+                    'username': row['user__user__username'],
+                    'returns': row['returns'],
+                    'late_returns': row['late_returns'],
+                    'overdue_rate': round(row['overdue_rate'], 4),
+                }
+                for row in overdue
+            ],
+        }
+
+    @classmethod
+    def _add(cls, model, key: str, counts: Dict[Tuple[date, int], Counter]) -> None:
+        """
+        Add the counts to the rows keyed by (day, key), creating missing
+        rows, with one upsert per batch
+        """
+        rows = [(day, pk, *(amounts[field] for field in FIELDS)) for (day, pk), amounts in counts.items()]
+        for start in range(0, len(rows), cls.UPSERT_BATCH):
+            cls._upsert(model, key, rows[start:start + cls.UPSERT_BATCH])
+
+    @classmethod
+    def _upsert(cls, model, key: str, rows: List[tuple]) -> None:
+        # bulk_create(update_conflicts=True) can only overwrite columns,
+        # not add to them, so the increments are written out by hand.
+        qn = connection.ops.quote_name
+        table = qn(model._meta.db_table)
+        columns = ['day', model._meta.get_field(key).column, *FIELDS]
+        placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        increments = ', '.join(f'{qn(field)} = {table}.{qn(field)} + EXCLUDED.{qn(field)}' for field in FIELDS)
+        sql = (
+            f"INSERT INTO {table} ({', '.join(qn(column) for column in columns)}) "
+            f"VALUES {', '.join([placeholders] * len(rows))} "
+            f"ON CONFLICT ({qn(columns[0])}, {qn(columns[1])}) DO UPDATE SET {increments}"
+        )
+        params = []
+        for day, *values in rows:
+            params.extend([connection.ops.adapt_datefield_value(day), *values])
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
@@ -1,3 +1,745 @@
-from django.test import TestCase
+import base64
+import json
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .admin import save_loan
+from .authentication import LibraryTokenObtainPairSerializer
+from books.models import Book, BookRequest
+from library_project.query_plans import count_sorts
+from .models import ArchivedLoan, BookLoan, DailyBookStats, DailyUserStats, UserProfile
+from .services.loans import LoanService
 
-# Create your tests here.
+class UserListQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='password123', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.book_count = 0
+
+    def add_users(self, count):
+        for _ in range(count):
+            self.book_count += 1
+            user = User.objects.create_user(username=f'reader{self.book_count}', password='password123')
+            active = Book.objects.create(title=f'Active {self.book_count}', author='Author',
+                                         isbn=f'{9781000000000 + self.book_count}', total_copies=5,
+                                         available_copies=5)
+            returned = Book.objects.create(title=f'Returned {self.book_count}', author='Author',
+                                           isbn=f'{9782000000000 + self.book_count}', total_copies=5,
+                                           available_copies=5)
+            due_date = timezone.now() + timedelta(days=14)
+            BookLoan.objects.create(user=user.profile, book=active, due_date=due_date)
+            BookLoan.objects.create(user=user.profile, book=returned, due_date=due_date,
+                                    return_date=timezone.now())
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context), response
+
+    def test_user_list_query_count_is_constant(self):
+        self.add_users(2)
+        small, _ = self.count_queries('/api/users/')
+
+        self.add_users(10)
+        large, response = self.count_queries('/api/users/')
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data['results']), 13)
+
+    def test_user_list_returns_compact_summaries(self):
+        self.add_users(1)
+        call_command('reconcile_loan_counters', stdout=StringIO())
+        _, response = self.count_queries('/api/users/?q=reader')
+
+        self.assertEqual(response.data['results'], [{
+            'id': User.objects.get(username='reader1').id,
+            'username': 'reader1',
+            'active_loan_count': 1,
+            'can_borrow': True,
+        }])
+        self.assertLess(len(response.content), 200)
+
+    def test_user_list_filters_by_username_prefix(self):
+        self.add_users(3)
+        User.objects.create(username='Rebecca')
+
+        _, response = self.count_queries('/api/users/?q=re')
+        self.assertEqual([user['username'] for user in response.data['results']],
+                         ['Rebecca', 'reader1', 'reader2', 'reader3'])
+
+        _, response = self.count_queries('/api/users/?q=adm')
+        self.assertEqual([user['username'] for user in response.data['results']], ['admin'])
+
+    def test_user_list_pages_by_username(self):
+        self.add_users(3)
+        _, first = self.count_queries('/api/users/?page_size=2')
+        _, second = self.count_queries(first.data['next'])
+
+        self.assertEqual([user['username'] for user in first.data['results']], ['admin', 'reader1'])
+        self.assertEqual([user['username'] for user in second.data['results']], ['reader2', 'reader3'])
+        self.assertIsNone(second.data['next'])
+
+    def test_user_list_shows_members_only_themselves(self):
+        self.add_users(2)
+        self.client.force_authenticate(User.objects.get(username='reader1'))
+
+        _, response = self.count_queries('/api/users/')
+        self.assertEqual([user['username'] for user in response.data['results']], ['reader1'])
+
+    def test_profile_splits_active_and_completed_loans(self):
+        self.add_users(1)
+        user = User.objects.get(username='reader1')
+        self.client.force_authenticate(user)
+
+        _, response = self.count_queries('/api/users/me/')
+        profile = response.data['profile']
+
+        self.assertEqual([loan['book']['title'] for loan in profile['active_loans']], ['Active 1'])
+        self.assertNotIn('loans', profile)
+        self.assertEqual(profile['active_loans'][0]['user_name'], 'reader1')
+        self.assertTrue(profile['can_borrow'])
+
+class LoanServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        total_copies=2, available_copies=2)
+
+    def checkout(self, user=None, book=None):
+        profile = (user or self.user).profile
+        return LoanService.checkout(BookLoan(user=profile, book=book or self.book))
+
+    def test_checkout_takes_exactly_one_copy(self):
+        loan = self.checkout()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+        self.assertEqual(loan.status, 'ACTIVE')
+
+    def test_return_puts_copy_back_once(self):
+        loan = self.checkout()
+        LoanService.return_loan(loan)
+        with self.assertRaises(ValidationError):
+            LoanService.return_loan(loan)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+    def test_return_updates_a_loaded_book(self):
+        self.checkout()
+        loan = BookLoan.objects.select_related('book').get()
+        LoanService.return_loan(loan)
+        self.assertEqual(loan.book.available_copies, 2)
+
+    def test_checkout_fails_without_available_copies(self):
+        self.checkout()
+        self.checkout(user=User.objects.create(username='second'))
+        with self.assertRaises(ValidationError):
+            self.checkout(user=User.objects.create(username='third'))
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_duplicate_and_over_limit_checkouts_leave_inventory_untouched(self):
+        self.checkout()
+        with self.assertRaises(ValidationError):
+            self.checkout()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+        for i in range(UserProfile.MAX_ALLOWED_LOANS - 1):
+            self.checkout(book=Book.objects.create(title=f'Book {i}', author='Author',
+                                                   isbn=f'{9781000000000 + i}'))
+        extra = Book.objects.create(title='One too many', author='Author', isbn='9789999999999')
+        with self.assertRaises(ValidationError):
+            self.checkout(book=extra)
+        extra.refresh_from_db()
+        self.assertEqual(extra.available_copies, 1)
+
+class LoanServiceConcurrencyTests(TransactionTestCase):
+    COPIES = 5
+    THREADS = 16
+
+    def run_threads(self, target, args_list):
+        errors = []
+
+        def run(*args):
+            try:
+                target(*args)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=args) for args in args_list]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def retry_locked(self, operation):
+        # SQLite reports contention as "database is locked" instead of
+        # blocking; retrying is what a production busy timeout would do.
+        for _ in range(200):
+            try:
+                return operation()
+            except OperationalError:
+                time.sleep(0.005)
+        raise AssertionError('database stayed locked')
+
+    def test_concurrent_checkouts_and_returns_never_oversell(self):
+        book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                   total_copies=self.COPIES, available_copies=self.COPIES)
+        profiles = [User.objects.create(username=f'reader{i}').profile for i in range(self.THREADS)]
+        outcomes = []
+
+        def checkout(profile):
+            try:
+                self.retry_locked(lambda: LoanService.checkout(BookLoan(user_id=profile.pk, book_id=book.pk)))
+                outcomes.append('loaned')
+            except ValidationError:
+                outcomes.append('unavailable')
+
+        self.run_threads(checkout, [(profile,) for profile in profiles])
+
+        book.refresh_from_db()
+        self.assertEqual(outcomes.count('loaned'), self.COPIES)
+        self.assertEqual(book.available_copies, 0)
+        self.assertEqual(BookLoan.objects.filter(book=book, return_date__isnull=True).count(), self.COPIES)
+
+        loans = list(BookLoan.objects.filter(book=book))
+
+        def return_twice(loan):
+            for _ in range(2):
+                try:
+                    self.retry_locked(lambda: LoanService.return_loan(loan))
+                except ValidationError:
+                    pass
+
+        self.run_threads(return_twice, [(loan,) for loan in loans for _ in range(2)])
+
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, self.COPIES)
+        self.assertFalse(BookLoan.objects.filter(book=book, return_date__isnull=True).exists())
+
+class AdminLoanEditTests(TestCase):
+    def setUp(self):
+        self.profile = User.objects.create(username='reader').profile
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        total_copies=1, available_copies=1)
+        self.emma = Book.objects.create(title='Emma', author='Jane Austen', isbn='9780141439587',
+                                        total_copies=1, available_copies=1)
+        self.loan = LoanService.checkout(BookLoan(user=self.profile, book=self.dune))
+
+    def edit(self, **changes):
+        loan = BookLoan.objects.get(pk=self.loan.pk)
+        for name, value in changes.items():
+            setattr(loan, name, value)
+        save_loan(loan)
+
+    def copies(self):
+        return list(Book.objects.order_by('title').values_list('available_copies', flat=True))
+
+    def test_moving_an_active_loan_moves_its_copy(self):
+        self.edit(book=self.emma)
+        self.assertEqual(self.copies(), [1, 0])
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.active_loan_count, 1)
+
+    def test_moving_to_a_book_without_copies_is_refused(self):
+        self.emma.available_copies = 0
+        self.emma.save()
+        with self.assertRaises(ValidationError):
+            self.edit(book=self.emma)
+        self.assertEqual(self.copies(), [0, 0])
+        self.assertEqual(BookLoan.objects.get(pk=self.loan.pk).book_id, self.dune.pk)
+
+    def test_reopening_a_returned_loan_takes_a_copy(self):
+        self.edit(return_date=timezone.now())
+        self.assertEqual(self.copies(), [1, 1])
+
+        self.edit(return_date=None)
+        self.assertEqual(self.copies(), [0, 1])
+        self.assertEqual(BookLoan.objects.get(pk=self.loan.pk).status, 'ACTIVE')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.active_loan_count, 1)
+
+    def test_due_date_edits_leave_inventory_alone(self):
+        self.edit(due_date=timezone.now() + timedelta(days=30))
+        self.assertEqual(self.copies(), [0, 1])
+
+class LoanCounterTests(TestCase):
+    def setUp(self):
+        self.profile = User.objects.create(username='reader').profile
+        self.books = [
+            Book.objects.create(title=f'Book {i}', author='Author', isbn=f'{9781000000000 + i}')
+            for i in range(3)
+        ]
+
+    def test_checkout_and_return_maintain_counters(self):
+        on_time = LoanService.checkout(BookLoan(user=self.profile, book=self.books[0]))
+        late = LoanService.checkout(BookLoan(user=self.profile, book=self.books[1],
+                                             due_date=timezone.now() - timedelta(days=1)))
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.active_loan_count, self.profile.overdue_loan_count), (2, 1))
+        self.assertTrue(self.profile.has_overdue_books)
+
+        LoanService.return_loan(late)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.active_loan_count, self.profile.overdue_loan_count), (1, 0))
+
+        LoanService.return_loan(on_time)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.active_loan_count, self.profile.overdue_loan_count), (0, 0))
+
+    def test_limit_uses_the_counter_without_counting_loans(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(active_loan_count=UserProfile.MAX_ALLOWED_LOANS)
+        with self.assertRaises(ValidationError):
+            LoanService.checkout(BookLoan(user=self.profile, book=self.books[0]))
+
+        self.profile.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertFalse(self.profile.can_borrow_books())
+
+    def test_reconcile_repairs_drift(self):
+        LoanService.checkout(BookLoan(user=self.profile, book=self.books[0]))
+        BookLoan.objects.create(user=self.profile, book=self.books[1],
+                                due_date=timezone.now() - timedelta(days=1))
+        self.assertEqual(LoanService.reconcile_counters(dry_run=True), 1)
+
+        call_command('reconcile_loan_counters', batch_size=1, stdout=StringIO())
+
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.active_loan_count, self.profile.overdue_loan_count), (2, 1))
+        self.assertEqual(LoanService.reconcile_counters(), 0)
+
+class OverdueSweepTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.profiles = [User.objects.create(username=f'reader{i}').profile for i in range(2)]
+        self.books = [
+            Book.objects.create(title=f'Book {i}', author='Author', isbn=f'{9781000000000 + i}')
+            for i in range(4)
+        ]
+
+    def loan(self, profile, book, due_in_days):
+        return LoanService.checkout(BookLoan(user=profile, book=book,
+                                             due_date=self.now + timedelta(days=due_in_days)))
+
+    def test_sweep_marks_past_due_loans_and_counts_them(self):
+        first = self.loan(self.profiles[0], self.books[0], 3)
+        second = self.loan(self.profiles[0], self.books[1], 5)
+        third = self.loan(self.profiles[1], self.books[2], 5)
+        later = self.loan(self.profiles[1], self.books[3], 30)
+        LoanService.return_loan(third)
+
+        stats = LoanService.sweep_overdue(batch_size=1, now=self.now + timedelta(days=10))
+
+        self.assertEqual((stats.swept, stats.batches), (2, 2))
+        statuses = dict(BookLoan.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[first.pk], 'OVERDUE')
+        self.assertEqual(statuses[second.pk], 'OVERDUE')
+        self.assertEqual(statuses[third.pk], 'RETURNED')
+        self.assertEqual(statuses[later.pk], 'ACTIVE')
+        self.assertEqual(LoanService.reconcile_counters(dry_run=True), 0)
+        self.profiles[0].refresh_from_db()
+        self.assertEqual(self.profiles[0].overdue_loan_count, 2)
+
+    def test_sweep_only_looks_at_loans_due_since_the_last_run(self):
+        self.loan(self.profiles[0], self.books[0], 3)
+        LoanService.sweep_overdue(now=self.now + timedelta(days=10))
+
+        # Simulate a loan the watermark has already passed.
+        stale = self.loan(self.profiles[1], self.books[1], 5)
+        BookLoan.objects.filter(pk=stale.pk).update(status='ACTIVE')
+        self.loan(self.profiles[1], self.books[2], 15)
+
+        stats = LoanService.sweep_overdue(now=self.now + timedelta(days=20))
+        self.assertEqual(stats.since, self.now + timedelta(days=10))
+        self.assertEqual(stats.swept, 1)
+
+        stats = LoanService.sweep_overdue(full=True, now=self.now + timedelta(days=20))
+        self.assertEqual(stats.swept, 1)
+        self.assertEqual(BookLoan.objects.get(pk=stale.pk).status, 'OVERDUE')
+
+    def test_command_reports_counts(self):
+        BookLoan.objects.create(user=self.profiles[0], book=self.books[0], due_date=self.now)
+        BookLoan.objects.filter(user=self.profiles[0]).update(status='ACTIVE')
+
+        out = StringIO()
+        call_command('sweep_overdue_loans', stdout=out)
+        self.assertIn('Marked 1 loans overdue in 1 batches', out.getvalue())
+
+class BatchLoanTests(TestCase):
+    def setUp(self):
+        self.profiles = [User.objects.create(username=f'reader{i}').profile for i in range(3)]
+        self.books = [
+            Book.objects.create(title=f'Book {i}', author='Author', isbn=f'{9781000000000 + i}',
+                                total_copies=3, available_copies=3)
+            for i in range(3)
+        ]
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def checkout_all(self):
+        loans = [BookLoan(user=profile, book=book) for profile in self.profiles for book in self.books]
+        self.assertEqual(LoanService.checkout_many(loans), [None] * len(loans))
+        return loans
+
+    def test_saving_a_user_does_not_touch_the_profile(self):
+        user = self.profiles[0].user
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertEqual(len(queries), 1)
+
+    def test_return_many_restores_inventory_and_counters(self):
+        loans = self.checkout_all()
+        BookLoan.objects.filter(pk=loans[0].pk).update(status='OVERDUE')
+        UserProfile.objects.filter(pk=self.profiles[0].pk).update(overdue_loan_count=1)
+
+        errors = LoanService.return_many(loans[:4] + [loans[0]])
+
+        self.assertEqual(errors, [None] * 4 + ['Book already returned'])
+        self.assertEqual(loans[0].status, 'RETURNED')
+        self.assertEqual(
+            list(Book.objects.order_by('pk').values_list('available_copies', flat=True)), [2, 1, 1]
+        )
+        self.assertEqual(LoanService.reconcile_counters(dry_run=True), 0)
+        self.assertEqual(LoanService.return_many(loans[:1]), ['Book already returned'])
+
+    def test_return_many_uses_a_fixed_number_of_statements(self):
+        loans = self.checkout_all()
+        with CaptureQueriesContext(connection) as few:
+            LoanService.return_many(loans[:3])
+        with CaptureQueriesContext(connection) as many:
+            LoanService.return_many(loans[3:])
+        self.assertEqual(len(few), len(many))
+
+    def test_batch_checkout_reports_each_loan(self):
+        response = self.client.post('/loans/batch_checkout/', {'loans': [
+            {'user_id': self.profiles[0].pk, 'book_id': self.books[0].pk},
+            {'user_id': self.profiles[0].pk, 'book_id': self.books[0].pk},
+            {'user_id': 0, 'book_id': self.books[1].pk},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['checked_out'], response.data['failed']), (1, 2))
+        self.assertEqual([result['error'] for result in response.data['results']],
+                         ['', 'User already has this book on loan', 'User not found'])
+
+    def test_batch_return_serves_the_reservation_queue(self):
+        loans = self.checkout_all()
+        waiting = User.objects.create(username='waiting').profile
+        request = BookRequest.objects.create(user=waiting, book=self.books[0])
+
+        response = self.client.post('/loans/batch_return/', {
+            'loan_ids': [loans[0].pk, loans[0].pk, 0]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['error'] for result in response.data['results']],
+                         ['', 'Book already returned', 'Loan not found'])
+        self.assertEqual(len(response.data['allocated']), 1)
+        request.refresh_from_db()
+        self.assertEqual(request.status, 'APPROVED')
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).available_copies, 0)
+
+    def test_batch_actions_are_staff_only(self):
+        self.client.force_authenticate(self.profiles[0].user)
+        self.assertEqual(self.client.post('/loans/batch_return/', {'loan_ids': []}, format='json').status_code, 403)
+        self.assertEqual(self.client.post('/loans/batch_checkout/', {'loans': []}, format='json').status_code, 403)
+
+class LoanHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.profile = self.user.profile
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.now = timezone.now()
+        self.loans = []
+        for days_ago in (400, 200, 100, 30, 10):
+            book = Book.objects.create(title=f'{days_ago} days ago', author='Author',
+                                       isbn=f'{9781000000000 + days_ago}')
+            loan = BookLoan.objects.create(user=self.profile, book=book, due_date=self.now,
+                                           return_date=self.now - timedelta(days=days_ago - 14))
+            BookLoan.objects.filter(pk=loan.pk).update(loan_date=self.now - timedelta(days=days_ago))
+            self.loans.append(loan)
+
+    def titles(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [loan['book']['title'] for loan in response.data['results']]
+
+    def test_history_pages_newest_first(self):
+        first = self.client.get('/api/users/me/loans/?page_size=3')
+        second = self.client.get(first.data['next'])
+
+        self.assertEqual(self.titles(first), ['10 days ago', '30 days ago', '100 days ago'])
+        self.assertEqual(self.titles(second), ['200 days ago', '400 days ago'])
+        self.assertIsNone(second.data['next'])
+
+    def test_history_rejects_a_cursor_that_is_not_a_date(self):
+        cursor = base64.urlsafe_b64encode(json.dumps(['not a date', 1]).encode()).decode()
+        response = self.client.get('/api/users/me/loans/', {'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'cursor': 'Invalid cursor'})
+
+    def test_history_filters_by_loan_date(self):
+        since = (self.now - timedelta(days=150)).date().isoformat()
+        until = (self.now - timedelta(days=21)).date().isoformat()
+        response = self.client.get(f'/api/users/me/loans/?since={since}&until={until}')
+        self.assertEqual(self.titles(response), ['30 days ago', '100 days ago'])
+
+        response = self.client.get('/api/users/me/loans/?since=last-week')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Invalid since date')
+
+    def test_history_is_limited_to_the_user(self):
+        other = User.objects.create(username='other')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.titles(self.client.get('/api/users/me/loans/')), [])
+        self.assertEqual(self.client.get(f'/users/{self.user.pk}/loans/').status_code, 404)
+
+        other.is_staff = True
+        other.save()
+        response = self.client.get(f'/users/{self.user.pk}/loans/?page_size=2')
+        self.assertEqual(self.titles(response), ['10 days ago', '30 days ago'])
+
+    def test_archive_moves_old_returned_loans(self):
+        active = BookLoan.objects.create(user=self.profile, due_date=self.now,
+                                         book=Book.objects.create(title='Active', author='Author',
+                                                                  isbn='9789000000000'))
+        BookLoan.objects.filter(pk=active.pk).update(loan_date=self.now - timedelta(days=500))
+        stats = LoanService.archive_returned(self.now - timedelta(days=150), batch_size=1)
+
+        self.assertEqual((stats.archived, stats.batches), (2, 2))
+        self.assertEqual(
+            set(ArchivedLoan.objects.values_list('pk', flat=True)),
+            {self.loans[0].pk, self.loans[1].pk}
+        )
+        self.assertTrue(BookLoan.objects.filter(pk=active.pk).exists())
+        self.assertFalse(BookLoan.objects.filter(pk=self.loans[0].pk).exists())
+
+        live = self.client.get('/api/users/me/loans/')
+        archived = self.client.get('/api/users/me/loans/?archived=true')
+        self.assertEqual(self.titles(live), ['10 days ago', '30 days ago', '100 days ago', 'Active'])
+        self.assertEqual(self.titles(archived), ['200 days ago', '400 days ago'])
+        self.assertEqual(archived.data['results'][0]['status'], 'RETURNED')
+
+        self.assertEqual(LoanService.archive_returned(self.now - timedelta(days=150)).archived, 0)
+
+    def test_archive_command(self):
+        out = StringIO()
+        call_command('archive_loans', months=6, stdout=out)
+        self.assertIn('Archived 2 loans', out.getvalue())
+        self.assertEqual(BookLoan.objects.count(), 3)
+
+    def test_history_query_walks_the_user_date_index(self):
+        since = self.now - timedelta(days=365)
+        for model in (BookLoan, ArchivedLoan):
+            plan = model.objects.filter(user=self.profile, loan_date__gte=since).order_by(
+                '-loan_date', '-pk')[:21].explain()
+            self.assertRegex(plan, r'user_(loan_)?date_idx')
+            self.assertEqual(count_sorts(plan), 0, plan)
+
+class CurrentUserConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.book = Book.objects.create(title='Book', author='Author', isbn='9781000000000')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_loans_change_the_etag(self):
+        etag = self.client.get('/api/users/me/')['ETag']
+        self.assertEqual(self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        loan = LoanService.checkout(BookLoan(user=self.user.profile, book=self.book))
+        response = self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['profile']['active_loans']), 1)
+
+        LoanService.return_loan(loan)
+        response = self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['profile']['active_loans'], [])
+
+    def test_profile_edits_change_the_etag(self):
+        etag = self.client.get('/api/users/me/')['ETag']
+
+        profile = self.user.profile
+        profile.full_name = 'Ada Reader'
+        profile.save()
+        response = self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['profile']['full_name'], 'Ada Reader')
+
+    def test_payloads_are_not_shared_between_users(self):
+        self.client.get('/api/users/me/')
+        other = User.objects.create(username='other')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/users/me/').data['username'], 'other')
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class JWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='secret-pass')
+        self.client = APIClient()
+
+    def obtain(self):
+        response = self.client.post('/api/token/', {'username': 'reader', 'password': 'secret-pass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_access_token_carries_claims(self):
+        access = AccessToken(self.obtain()['access'])
+        self.assertEqual(access['profile_id'], self.user.profile.pk)
+        self.assertEqual(access['username'], 'reader')
+        self.assertFalse(access['is_staff'])
+
+    def test_permission_checks_do_not_touch_the_database(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.obtain()['access']}")
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/admin/book-requests/decisions/', {'approve': [1]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/book-requests/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_refresh_rotates_and_reloads_claims(self):
+        refresh = self.obtain()['refresh']
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(AccessToken(response.data['access'])['is_staff'])
+        self.assertNotEqual(response.data['refresh'], refresh)
+
+        reused = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(reused.status_code, 401)
+
+    def test_inactive_user_cannot_refresh(self):
+        refresh = self.obtain()['refresh']
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+class AsyncLoanListTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create(username='reader')
+        other = User.objects.create(username='other')
+        books = [Book.objects.create(title=f'Book {i}', isbn=f'97800000000{i:02d}', total_copies=2, available_copies=2)
+                 for i in range(3)]
+        for book in books:
+            LoanService.checkout(BookLoan(user=self.reader.profile, book=book))
+        LoanService.checkout(BookLoan(user=other.profile, book=books[0]))
+
+    def test_lists_only_the_current_users_loans(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        expected = client.get('/loans/').json()
+
+        session = Client()
+        session.force_login(self.reader)
+        self.assertEqual(session.get('/api/async/loans/').json(), expected)
+
+    def test_bearer_token_reads_the_profile_from_its_claims(self):
+        token = LibraryTokenObtainPairSerializer.get_token(self.reader).access_token
+        client = Client(headers={'Authorization': f'Bearer {token}'})
+        with self.assertNumQueries(1):
+            response = client.get('/api/async/loans/')
+        self.assertEqual(len(response.json()), 3)
+
+class CirculationStatsTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.readers = [User.objects.create(username=f'reader{i}') for i in range(2)]
+        self.books = [Book.objects.create(title=f'Book {i}', isbn=f'97810000000{i:02d}', total_copies=3,
+                                          available_copies=3) for i in range(3)]
+        self.client = APIClient()
+
+    def circulate(self):
+        first, second = (reader.profile for reader in self.readers)
+        loans = [LoanService.checkout(BookLoan(user=first, book=book)) for book in self.books]
+        LoanService.checkout_many([BookLoan(user_id=second.pk, book_id=self.books[0].pk)])
+        late = LoanService.checkout(BookLoan(user=second, book=self.books[1],
+                                             due_date=timezone.now() - timedelta(days=1)))
+        LoanService.return_loan(loans[0])
+        LoanService.return_many([loans[1], late])
+
+        self.client.force_authenticate(self.readers[1])
+        self.assertEqual(self.client.post('/api/book-requests/', {'book_id': self.books[2].pk}).status_code, 201)
+
+    def rollups(self):
+        return (
+            sorted(DailyBookStats.objects.values_list('day', 'book_id', 'loans', 'returns', 'late_returns', 'requests')),
+            sorted(DailyUserStats.objects.values_list('day', 'user_id', 'loans', 'returns', 'late_returns', 'requests')),
+        )
+
+    def test_checkouts_returns_and_requests_update_the_rollups(self):
+        self.circulate()
+        today = timezone.localdate()
+        first, second = (reader.profile.pk for reader in self.readers)
+        books, users = self.rollups()
+
+        self.assertEqual(books, [
+            (today, self.books[0].pk, 2, 1, 0, 0),
+            (today, self.books[1].pk, 2, 2, 1, 0),
+            (today, self.books[2].pk, 1, 0, 0, 1),
+        ])
+        self.assertEqual(users, [(today, first, 3, 2, 0, 0), (today, second, 2, 1, 1, 1)])
+
+    def test_rebuild_matches_incremental_rollups_and_counts_archived_loans(self):
+        self.circulate()
+        incremental = self.rollups()
+
+        DailyBookStats.objects.all().delete()
+        LoanService.archive_returned(timezone.now() + timedelta(minutes=1))
+        out = StringIO()
+        call_command('rebuild_stats', stdout=out)
+
+        self.assertIn('Wrote 5 statistics rows for all days', out.getvalue())
+        self.assertEqual(self.rollups(), incremental)
+
+        call_command('rebuild_stats', since=timezone.localdate().isoformat(), stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_dashboard_reads_only_the_rollups(self):
+        self.circulate()
+        self.client.force_authenticate(self.admin)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/stats/?days=7&limit=2')
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(data['totals'], {'loans': 5, 'returns': 3, 'late_returns': 1, 'requests': 1})
+        self.assertEqual(data['loans_per_day'], [
+            {'day': timezone.localdate().isoformat(), 'loans': 5, 'returns': 3, 'late_returns': 1, 'requests': 1}
+        ])
+        self.assertEqual([book['title'] for book in data['most_borrowed']], ['Book 0', 'Book 1'])
+        self.assertEqual(data['overdue_rates'], [{
+            'profile_id': self.readers[1].profile.pk, 'username': 'reader1',
+            'returns': 1, 'late_returns': 1, 'overdue_rate': 1.0,
+        }])
+
+    def test_dashboard_is_staff_only_and_checks_its_parameters(self):
+        self.client.force_authenticate(self.readers[0])
+        self.assertEqual(self.client.get('/api/stats/').status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/stats/?days=week')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'days and limit must be integers')
+        self.assertEqual(self.client.get('/api/stats/?days=0').data['totals']['loans'], 0)
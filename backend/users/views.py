@@ -5,15 +5,48 @@ from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
 from django.contrib.auth.models import User
 from rest_framework.decorators import action
-from .serializers import UserSerializer, BookLoanSerializer
-from .models import BookLoan, UserProfile
-from django.utils import timezone
-from datetime import timedelta
+from .serializers import (
+    ArchivedLoanSerializer, BookLoanSerializer, UserProfileSerializer, UserSerializer, UserSummarySerializer
+)
+from .models import ArchivedLoan, BookLoan, UserProfile
+from .authentication import aprofile_id_for, profile_id_for
+from .services.loans import LoanService
 from django.contrib.auth import authenticate, login, logout
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from books.models import Book
+from books.pagination import LoanHistoryPagination, UserPagination
+from books.services.requests import BookRequestService
+from django.db import transaction
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from django.utils import timezone
+from library_project.async_api import AsyncAPIView
+from library_project.db_routers import replica_reads
+from library_project.filters import filter_by_date_range
+from library_project.http_cache import conditional_response
+
+def _loan_history(request, profile_id):
+    """
+    One page of a user's loans, newest first
+
+    ``since`` and ``until`` limit it to loans made in that range, which is
+    read through the (user, loan_date) index. ``archived=true`` pages
+    through the loans moved to the archive instead of the live ones.
+    """
+    if request.query_params.get('archived', '').lower() == 'true':
+        model, serializer_class = ArchivedLoan, ArchivedLoanSerializer
+    else:
+        model, serializer_class = BookLoan, BookLoanSerializer
+    loans = model.objects.filter(user_id=profile_id).select_related('book', 'user__user')
+
+    try:
+        loans = filter_by_date_range(loans, request.query_params, 'loan_date')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = LoanHistoryPagination()
+    page = paginator.paginate_queryset(loans, request)
+    return paginator.get_paginated_response(serializer_class(page, many=True).data)
 
 class LoginView(APIView):
     def post(self, request):
@@ -27,7 +60,7 @@ class LoginView(APIView):
                 'user_id': user.id,
                 'username': user.username,
                 'is_admin': user.is_staff,
-                'profile': UserSerializer(user.profile).data
+                'profile': UserProfileSerializer(user.profile).data
             })
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -112,8 +145,10 @@ class UserViewSet(ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return User.objects.all()
-        return User.objects.filter(id=user.id)
+            queryset = User.objects.all()
+        else:
+            queryset = User.objects.filter(id=user.id)
+        return UserSerializer.setup_eager_loading(queryset)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -124,9 +159,7 @@ class UserViewSet(ModelViewSet):
     def loans(self, request, pk=None):
         try:
             user = self.get_object()
-            loans = BookLoan.objects.filter(user=user.profile)
-            serializer = BookLoanSerializer(loans, many=True)
-            return Response(serializer.data)
+            return _loan_history(request, user.profile.pk)
         except User.DoesNotExist:
             return Response(
                 {'error': 'User not found'},
@@ -140,7 +173,7 @@ class UserViewSet(ModelViewSet):
             active_loans = BookLoan.objects.filter(
                 user=user.profile,
                 return_date__isnull=True
-            )
+            ).select_related('book', 'user__user')
             serializer = BookLoanSerializer(active_loans, many=True)
             return Response(serializer.data)
         except User.DoesNotExist:
@@ -153,18 +186,39 @@ class CurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        user = request.user
+        # Loans embed their books, and days_remaining changes daily.
+        return conditional_response(
+            request,
+            ['books', f'profile:{profile_id_for(user)}'],
+            self.render,
+            vary=(user.pk, user.username, user.email, user.is_staff, timezone.localdate())
+        )
+
+    def render(self):
+        user = UserSerializer.setup_eager_loading(
+            User.objects.filter(pk=self.request.user.pk)
+        ).get()
+        serializer = UserSerializer(user)
         return Response(serializer.data)
 
+class LoanHistoryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        with replica_reads(request):
+            return _loan_history(request, profile_id_for(request.user))
+
 class LoanViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = BookLoanSerializer
 
     def get_queryset(self):
         user = self.request.user
+        loans = BookLoan.objects.select_related('book', 'user__user')
         if user.is_staff:
-            return BookLoan.objects.all()
-        return BookLoan.objects.filter(user=user.profile)
+            return loans
+        return loans.filter(user_id=profile_id_for(user))
 
     def create(self, request):
         book_id = request.data.get('book_id')
@@ -178,24 +232,7 @@ class LoanViewSet(ModelViewSet):
             else:
                 user_profile = request.user.profile
 
-            if not user_profile.can_borrow_books():
-                return Response(
-                    {'error': 'User has reached maximum allowed loans'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            if book.available_copies < 1:
-                return Response(
-                    {'error': 'Book not available'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            due_date = timezone.now() + timedelta(days=14)
-            loan = BookLoan.objects.create(
-                user=user_profile,
-                book=book,
-                due_date=due_date
-            )
+            loan = LoanService.checkout(BookLoan(user=user_profile, book=book))
 
             return Response(
                 BookLoanSerializer(loan).data,
@@ -209,7 +246,7 @@ class LoanViewSet(ModelViewSet):
             )
         except ValidationError as e:
             return Response(
-                {'error': str(e)},
+                {'error': e.messages[0]},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
@@ -217,14 +254,13 @@ class LoanViewSet(ModelViewSet):
     def return_book(self, request, pk=None):
         try:
             loan = self.get_object()
-            if loan.return_date:
-                return Response(
-                    {'error': 'Book already returned'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            loan.return_date = timezone.now()
-            loan.save()
+            # The copy goes straight to the head of the book's queue, in
+            # the same transaction, so no walk-up checkout can take it.
+            with transaction.atomic():
+                LoanService.return_loan(loan)
+                if BookRequestService.allocate(loan.book_id):
+                    # The returned copy went straight back out.
+                    loan.book.refresh_from_db(fields=['available_copies'])
 
             return Response(BookLoanSerializer(loan).data)
         except BookLoan.DoesNotExist:
@@ -232,13 +268,123 @@ class LoanViewSet(ModelViewSet):
                 {'error': 'Loan not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except ValidationError as e:
+            return Response(
+                {'error': e.messages[0]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    @action(detail=False, methods=['post'])
+    def batch_checkout(self, request):
+        """Check out many loans at once; staff only"""
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        items = request.data.get('loans', [])
+        if not isinstance(items, list) or not all(
+            isinstance(item, dict)
+            and isinstance(item.get('user_id'), int)
+            and isinstance(item.get('book_id'), int)
+            for item in items
+        ):
+            return Response(
+                {'error': 'loans must be a list of objects with user_id and book_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > LoanService.MAX_BATCH:
+            return Response(
+                {'error': f'At most {LoanService.MAX_BATCH} loans per call'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        loans = [BookLoan(user_id=item['user_id'], book_id=item['book_id']) for item in items]
+        errors = LoanService.checkout_many(loans)
+        return Response({
+            'checked_out': errors.count(None),
+            'failed': len(errors) - errors.count(None),
+            'results': [
+                {'user_id': loan.user_id, 'book_id': loan.book_id, 'loan_id': loan.pk, 'error': error or ''}
+                for loan, error in zip(loans, errors)
+            ]
+        })
+
+    @action(detail=False, methods=['post'])
+    def batch_return(self, request):
+        """Return many loans at once and serve the books' queues; staff only"""
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        loan_ids = request.data.get('loan_ids', [])
+        if not isinstance(loan_ids, list) or not all(isinstance(loan_id, int) for loan_id in loan_ids):
+            return Response(
+                {'error': 'loan_ids must be a list of loan ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(loan_ids) > LoanService.MAX_BATCH:
+            return Response(
+                {'error': f'At most {LoanService.MAX_BATCH} loans per call'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        found = BookLoan.objects.only('user_id', 'book_id').in_bulk(loan_ids)
+        loans = [found[loan_id] for loan_id in loan_ids if loan_id in found]
+        allocated = []
+        with transaction.atomic():
+            errors = LoanService.return_many(loans)
+            returned = [loan for loan, error in zip(loans, errors) if error is None]
+            for book_id in dict.fromkeys(loan.book_id for loan in returned):
+                allocated += BookRequestService.allocate(book_id)
+
+        errors = iter(errors)
+        results = [
+            {'loan_id': loan_id, 'error': next(errors) or '' if loan_id in found else 'Loan not found'}
+            for loan_id in loan_ids
+        ]
+        failed = sum(1 for result in results if result['error'])
+        return Response({
+            'returned': len(results) - failed,
+            'failed': failed,
+            'allocated': [loan.pk for loan in allocated],
+            'results': results
+        })
+
+class AsyncLoanListView(AsyncAPIView):
+    """
+    The current user's loans, same payload as the loan list
+    """
+
+    async def get(self, request):
+        loans = BookLoan.objects.select_related('book', 'user__user').filter(
+            user_id=await aprofile_id_for(request.user)
+        )
+        return BookLoanSerializer([loan async for loan in loans], many=True).data
 
 class UserListView(generics.ListAPIView):
-    serializer_class = UserSerializer
+    """
+    Paginated user summaries, optionally narrowed to usernames starting
+    with ``q``; staff see every user, everyone else only themselves
+    """
+    serializer_class = UserSummarySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UserPagination
+
+    def list(self, request, *args, **kwargs):
+        with replica_reads(request):
+            return super().list(request, *args, **kwargs)
     
     def get_queryset(self):
         user = self.request.user
-        if user:
-            return User.objects.all()
-        return User.objects.filter(id=user.id)
+        if user.is_staff:
+            queryset = User.objects.all()
+        else:
+            queryset = User.objects.filter(id=user.id)
+        query = self.request.query_params.get('q', '').strip()
+        if query:
+            queryset = queryset.filter(username__istartswith=query)
+        return queryset.select_related('profile')
@@ -1,5 +1,5 @@
 import { ref } from 'vue'
-import type { Book } from '~/types'
+import type { Book, BookFilters, Paginated } from '~/types'
 
 export function useBooks() {
   const { fetchApi } = useApi()
@@ -7,34 +7,33 @@ export function useBooks() {
   const books = ref<Book[]>([])
   const loading = ref(false)
   const error = ref<string | null>(null)
-  
-  function filterBooks(items: Book[], query: string, onlyAvailable: boolean) {
-    let result = [...items]
-    
-    if (query) {
-      const loweredQuery = query.toLowerCase()
-      result = result.filter(book => 
-        book.title.toLowerCase().includes(loweredQuery) ||
-        book.author.toLowerCase().includes(loweredQuery) ||
-        book.isbn.includes(loweredQuery) ||
-        book.description?.toLowerCase().includes(loweredQuery) || false
-      )
-    }
-    
-    if (onlyAvailable) {
-      result = result.filter(book => book.available_copies > 0)
-    }
-    
-    return result
+  const nextCursor = ref<string | null>(null)
+
+  function buildQuery(filters: BookFilters, cursor: string | null) {
+    const query: Record<string, string> = {}
+
+    if (filters.query) query.q = filters.query
+    if (filters.author) query.author = filters.author
+    if (filters.onlyAvailable) query.available = 'true'
+    if (filters.ordering) query.ordering = filters.ordering
+    if (cursor) query.cursor = cursor
+
+    return query
   }
 
-  async function fetchBooks() {
+  async function fetchBooks(filters: BookFilters = {}, append = false) {
     loading.value = true
     error.value = null
     
     try {
-      const response = await fetchApi<Book[]>('/api/books/')
-      books.value = response
+      const cursor = append ? nextCursor.value : null
+      const response = await fetchApi<Paginated<Book>>('/api/books/', {
+        query: buildQuery(filters, cursor)
+      })
+      books.value = append ? [...books.value, ...response.results] : response.results
+      nextCursor.value = response.next
+        ? new URL(response.next).searchParams.get('cursor')
+        : null
     } catch (err: any) {
       error.value = 'Failed to fetch books: ' + (err.message || 'Unknown error')
       throw err
@@ -61,8 +60,8 @@ export function useBooks() {
     books,
     loading,
     error,
+    nextCursor,
     fetchBooks,
-    loanBook,
-    filterBooks
+    loanBook
   }
 }
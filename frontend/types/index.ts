@@ -6,13 +6,19 @@ export interface User {
   profile: UserProfile
 }
 
+export interface UserSummary {
+  id: number
+  username: string
+  active_loan_count: number
+  can_borrow: boolean
+}
+
 export interface UserProfile {
   id: number
   username: string
   email: string
   full_name: string
   active_loans: BookLoan[]
-  loan_history: BookLoan[]
   can_borrow: boolean
 }
 
@@ -39,6 +45,18 @@ export interface Book {
   current_loans?: BookLoan[]
 }
 
+export interface BookFilters {
+  query?: string
+  author?: string
+  onlyAvailable?: boolean
+  ordering?: string
+}
+
+export interface Paginated<T> {
+  next: string | null
+  results: T[]
+}
+
 export interface LoginCredentials {
   username: string
   password: string